@@ -1,3 +1,4 @@
+import argparse
 import curses
 import math
 import sys
@@ -11,145 +12,231 @@ from bosdyn.client.robot_command import blocking_stand, blocking_sit, blocking_s
 from bosdyn.client import ResponseError, RpcError
 from bosdyn.client.lease import Error as LeaseBaseError
 
+from capture import CommandCapture
+from input_sources import CursesInput, ScriptedInput, load_script
+from instrumentation import STATS
+from profiling import (DEFAULT_REPORT_PATH, DISPATCH, FEEDBACK, INPUT, PROFILE, SLEEP,
+                       add_profile_argument, finish_profiling, start_profiling)
+from startup import connect
+from state_watcher import StateWatcher
+from status_display import RobotStatus, StatusScreen
+from teleop import TeleopEngine
+
 BASE_SPEED = 0.5  # m/s
 BASE_ROTATION = 0.8  # rad/sec
 CMD_DURATION = 0.6  # seconds
 INPUT_RATE = 0.1
+STREAM_INPUT_RATE = 0.01  # seconds between input polls in streaming mode
+STATUS_ROW = 7  # first row of the status panel under the key help
+
+# Velocities summed by the streaming teleop engine while keys are held
+KEY_VELOCITIES = {
+    ord('w'): (BASE_SPEED, 0.0, 0.0),
+    ord('s'): (-BASE_SPEED, 0.0, 0.0),
+    ord('d'): (0.0, -BASE_SPEED, 0.0),
+    ord('a'): (0.0, BASE_SPEED, 0.0),
+    ord('q'): (0.0, 0.0, BASE_ROTATION),
+    ord('e'): (0.0, 0.0, -BASE_ROTATION),
+}
 
 class User_interface():
     
-    def __init__(self):
-        cmd_list = {
-            27: self.exit,
-            119: self.foward,
-            115: self.backwards,
-            100: self.right,
-            97: self.left,
-            101: self.clockwise,
-            113: self.counterclockwise,
-            99: self.circle,
-            
-            
-            
+    def __init__(self, stream=False, capture=None, profile=None,
+                 profile_report=DEFAULT_REPORT_PATH, keys=None):
+        self.stream = stream
+        # Input source read instead of the keyboard, e.g. an input_sources.ScriptedInput
+        self.keys = keys
+        # Pause after each dispatched key in the table-driven interface
+        self.input_rate = INPUT_RATE
+        # --profile mode, or None; the report goes to profile_report on exit
+        self.profile = profile
+        self.profile_report = profile_report
+        # Optional capture.CommandCapture every dispatched command is logged to, for replay
+        self.capture = capture
+        # Velocity templates are built once; only the end time changes per send, and the command
+        # client stamps that onto its own copy of the request.
+        velocity = RobotCommandBuilder.synchro_velocity_command
+        self.cmd_list = {
+            ord('w'): ('Move Forward', velocity(v_x=BASE_SPEED, v_y=0.0, v_rot=0.0)),
+            ord('s'): ('Move Backward', velocity(v_x=-BASE_SPEED, v_y=0.0, v_rot=0.0)),
+            ord('d'): ('Move Right', velocity(v_x=0.0, v_y=-BASE_SPEED, v_rot=0.0)),
+            ord('a'): ('Move Left', velocity(v_x=0.0, v_y=BASE_SPEED, v_rot=0.0)),
+            ord('q'): ('Rotate Counterclockwise', velocity(v_x=0.0, v_y=0.0, v_rot=BASE_ROTATION)),
+            ord('e'): ('Rotate Clockwise', velocity(v_x=0.0, v_y=0.0, v_rot=-BASE_ROTATION)),
+            ord('c'): ('Circle', velocity(v_x=BASE_SPEED, v_y=0.0, v_rot=-math.radians(90))),
+            ord('k'): ('Power On', self.power_on),
+            ord('l'): ('Power Off', self.power_off),
+            ord('y'): ('Stand', self.stand),
+            ord('['): ('Sit', self.sit),
         }
+        # Seconds from key read to RPC return, per dispatched key
+        self.dispatch_latencies = []
+        # What the status screen shows; filled in with the session's state and lease by main()
+        self.status = RobotStatus()
     
-    def display_error(desc, err, stdscr):
-        stdscr.addstr(6, 0, f'Failed {desc}: {err}')  
+    def display_error(self, desc, err, stdscr):
+        self.status.error(desc, err)
     
     def try_cmd(self, desc, cmd, stdscr):
         try:
-            self.command_client.robot_command(command=cmd, end_time_secs=time.time() + CMD_DURATION)
+            self.command_client.robot_command(command=cmd,
+                                              end_time_secs=self.clock.deadline(CMD_DURATION))
         except(ResponseError,RpcError,LeaseBaseError)as err:
             self.display_error(desc=desc, err=err,stdscr=stdscr)
-        
-    def circle(self, stdscr):
-        cmd = RobotCommandBuilder.synchro_velocity_command(v_x=BASE_SPEED, v_y=0.0, v_rot=-math.radians(90))
-        self.try_cmd(desc='Circle', cmd=cmd, stdscr=stdscr)
-        
-    def foward(self, stdscr):
-        cmd = RobotCommandBuilder.synchro_velocity_command(v_x=BASE_SPEED, v_y=0.0, v_rot=0.0)
-        self.try_cmd(desc='Move Forward', cmd=cmd, stdscr=stdscr)
-        
-    def backwards(self, stdscr):
-        cmd = RobotCommandBuilder.synchro_velocity_command(v_x=-BASE_SPEED, v_y=0.0, v_rot=0.0)
-        self.try_cmd(desc='Move Backward', cmd=cmd, stdscr=stdscr)
-        
-    def right(self, stdscr):
-        cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=-BASE_SPEED, v_rot=0.0)
-        self.try_cmd(desc='Move Right', cmd=cmd, stdscr=stdscr)
-        
-    def left(self, stdscr):
-        cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=BASE_SPEED, v_rot=0.0)
-        self.try_cmd(desc='Move Left', cmd=cmd, stdscr=stdscr)
-        
-    def clockwise(self, stdscr):
-        cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=0.0, v_rot=BASE_ROTATION)
-        self.try_cmd(desc='Rotate Clockwise', cmd=cmd, stdscr=stdscr)
-        
-    def counterclockwise(self, stdscr):
-        cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=0.0, v_rot=-BASE_ROTATION)
-        self.try_cmd(desc='Rotate Counterclockwise', cmd=cmd, stdscr=stdscr)   
-        
-    def exit(stdscr):
-        curses.nocbreak()
-        curses.echo()
-        stdscr.keypad(False)
-        curses.endwin()
+
+    @PROFILE.timed(FEEDBACK)
+    def power_on(self):
+        self.robot.power_on(timeout_sec=20)
+
+    @PROFILE.timed(FEEDBACK)
+    def power_off(self):
+        self.robot.power_off(cut_immediately=False)
+
+    @PROFILE.timed(FEEDBACK)
+    def stand(self):
+        blocking_stand(self.command_client, timeout_sec=10)
+
+    @PROFILE.timed(FEEDBACK)
+    def sit(self):
+        blocking_sit(self.command_client, timeout_sec=10)
+
+    @PROFILE.timed(DISPATCH)
+    def dispatch(self, key, stdscr):
+        """Run the table entry for `key`. Returns False if the key is not bound."""
+        entry = self.cmd_list.get(key)
+        if entry is None:
+            return False
+        start = time.perf_counter()
+        desc, action = entry
+        self.status.command(desc)
+        if callable(action):
+            if self.capture is not None:
+                self.capture.event(action.__name__, desc, key)
+            try:
+                action()
+            except(ResponseError,RpcError,LeaseBaseError)as err:
+                self.display_error(desc=desc, err=err, stdscr=stdscr)
+        else:
+            if self.capture is not None:
+                self.capture.command(desc, action, CMD_DURATION, key)
+            self.try_cmd(desc=desc, cmd=action, stdscr=stdscr)
+        self.dispatch_latencies.append(time.perf_counter() - start)
+        return True
+
+    def latency_report(self):
+        """Summarize key-to-RPC latency of everything dispatched so far."""
+        if not self.dispatch_latencies:
+            return 'No commands dispatched'
+        latencies = sorted(self.dispatch_latencies)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return (f'{len(latencies)} commands, key-to-RPC p50 {p50 * 1000:.1f} ms, '
+                f'p99 {p99 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms')
 
     def interface(self, stdscr):
         curses.noecho()
         curses.cbreak()
         stdscr.keypad(True) # Enable special keys
-        run = True
+        stdscr.nodelay(True)  # Keys are polled through the status screen, which draws meanwhile
+        screen = StatusScreen(stdscr, scheduler=self.session.scheduler)
+        screen.add(0, [
+            "User Interface:",
+            "[esc]: Exit, [k]: Power-On, [l]: Power-Off",
+            "[y]: Stand, [[]: Sit",
+            "[w, a, s, d]: Move",
+            "[q, e]: Rotate",
+            "[c]: Circle",
+        ])
+        screen.add(STATUS_ROW, self.status.lines)
+        try:
+            with screen:
+                keys = self.keys if self.keys is not None else CursesInput(screen)
+                self.key_loop(keys, stdscr, screen)
+        finally:
+            curses.nocbreak()
+            curses.echo()
+            stdscr.keypad(False)
+            curses.endwin()
+
+    def key_loop(self, keys, stdscr=None, screen=None):
+        """Dispatch keys from input source `keys` until [esc]; headless with no screen."""
+        while True:
+            PROFILE.loop('input')
+            with PROFILE.stage(INPUT):
+                key = keys.wait_key()
+            if key == ord("\x1b"):
+                break
+            if key == curses.KEY_RESIZE and screen is not None:
+                screen.invalidate()
+            self.dispatch(key, stdscr)
+            with PROFILE.stage(SLEEP):
+                time.sleep(self.input_rate)
+
+    def stream_engine(self, stdscr=None):
+        """TeleopEngine for the streaming interface, enabled only while self.watcher can_move."""
+        engine = TeleopEngine(self.command_client, KEY_VELOCITIES,
+                              max_velocity=(BASE_SPEED, BASE_SPEED, BASE_ROTATION),
+                              on_error=lambda err: self.display_error('Streaming', err, stdscr),
+                              clock=self.clock,
+                              on_send=self.capture.velocity if self.capture is not None else None)
+
+        @self.watcher.on_change
+        def gate(kind=None, old=None, new=None):
+            # Stop streaming the moment the robot is estopped, unpowered or the lease is lost.
+            if self.watcher.can_move:
+                engine.enable()
+            else:
+                engine.disable()
+
+        gate()
+        return engine
+
+    def stream_loop(self, keys, engine, stdscr=None, screen=None):
+        """Feed keys from input source `keys` to `engine` until [esc]; headless with no screen."""
+        while True:
+            PROFILE.loop('input')
+            # Drain every pending key so held keys never queue up behind the sender
+            with PROFILE.stage(INPUT):
+                key = keys.getch()
+                while key != -1:
+                    if key == ord("\x1b"):
+                        return
+                    if key == curses.KEY_RESIZE:
+                        if screen is not None:
+                            screen.invalidate()
+                    elif not engine.key_event(key):
+                        self.dispatch(key, stdscr)
+                    key = keys.getch()
+            with PROFILE.stage(SLEEP):
+                time.sleep(STREAM_INPUT_RATE)
+
+    def stream_interface(self, stdscr):
+        """Hold-to-move teleop: input is sampled here, commands go out from the engine thread."""
+        curses.noecho()
+        curses.cbreak()
+        stdscr.keypad(True)
+        stdscr.nodelay(True)  # Don't block for user input
+        engine = self.stream_engine(stdscr)
+
+        def velocity_line():
+            v_x, v_y, v_rot = engine.velocity
+            return [f'Velocity: x {v_x:+.2f}  y {v_y:+.2f}  rot {v_rot:+.2f}']
+
+        screen = StatusScreen(stdscr, scheduler=self.session.scheduler)
+        screen.add(0, [
+            "User Interface (streaming):",
+            "[esc]: Exit, [k]: Power-On, [l]: Power-Off",
+            "[y]: Stand, [[]: Sit",
+            "Hold [w, a, s, d] to move, [q, e] to rotate; combine freely",
+        ])
+        screen.add(5, velocity_line)
+        screen.add(STATUS_ROW, self.status.lines)
         try:
-            stdscr.addstr(0, 0, "User Interface:")
-            stdscr.addstr(1, 0, "[esc]: Exit, [k]: Power-On, [l]: Power-Off")
-            stdscr.addstr(2, 0, "[esc]: Exit, [k]: Power-On, [l]: Power-Off")   
-            stdscr.addstr(3, 0, "[w, a, s, d]: Move")
-            stdscr.addstr(4, 0, "[q, e]: Rotate\n")
-            stdscr.addstr(5, 0, "[c]: Circle\n")
-            stdscr.refresh()
-            while run:
-                key = stdscr.getch()
-                if key == ord("\x1b"):
-                    break
-                
-                if key == ord("k"):
-                    self.robot.power_on(timeout_sec=20)
-                    
-                elif key == ord("l"):
-                    self.robot.power_off(cut_immediately=False)                
-                
-                if key == ord('y'):
-                    blocking_stand(self.command_client, timeout_sec=10)    
-                elif key == ord('['):
-                    blocking_sit(self.command_client, timeout_sec=10)
-                    
-                    
-                if key == ord('w'):
-                    cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.5, v_y=0.0, v_rot=0.0)
-                    try:
-                        self.command_client.robot_command(command=cmd, end_time_secs=time.time() + 0.6)
-                    except(ResponseError,RpcError,LeaseBaseError)as err:
-                        self.display_error(desc="Moving Forward", err=err, stdscr=stdscr)
-                if key == ord('s'):
-                    cmd = RobotCommandBuilder.synchro_velocity_command(v_x=-0.5, v_y=0.0, v_rot=0.0)
-                    try:
-                        self.command_client.robot_command(command=cmd, end_time_secs=time.time() + 0.6)
-                    except(ResponseError,RpcError,LeaseBaseError)as err:
-                        self.display_error(desc="Moving Backward", err=err, stdscr=stdscr)
-                if key == ord('d'):
-                    cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=-0.5, v_rot=0.0)
-                    try:
-                        self.command_client.robot_command(command=cmd, end_time_secs=time.time() + 0.6)
-                    except(ResponseError,RpcError,LeaseBaseError)as err:
-                        self.display_error(desc='Moving_Right', err=err, stdscr=stdscr)
-                        
-                if key == ord('a'):
-                    cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=0.5, v_rot=0.0)
-                    try:
-                        self.command_client.robot_command(command=cmd, end_time_secs=time.time() + 0.6)
-                    except(ResponseError,RpcError,LeaseBaseError)as err:
-                        self.display_error(desc="Moving Left", err=err, stdscr=stdscr)
-                if key == ord('q'):
-                    cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=0.0, v_rot=0.8)
-                    try:
-                        self.command_client.robot_command(command=cmd, end_time_secs=time.time() + 0.6)
-                    except(ResponseError,RpcError,LeaseBaseError)as err:
-                        self.display_error(desc="Rotating Right", err=err, stdscr=stdscr)
-                if key == ord('e'):
-                    cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=0.0, v_rot=-0.8)
-                    try:
-                        self.command_client.robot_command(command=cmd, end_time_secs=time.time() + 0.6)
-                    except(ResponseError,RpcError,LeaseBaseError)as err:
-                        self.display_error(desc="Roatating Left", err=err, stdscr=stdscr)
-                if key == ord('c'):
-                    self.circle(stdscr)           
-                    
-                stdscr.refresh()
-                time.sleep(0.1)
-                            
+            with engine, screen:
+                keys = self.keys if self.keys is not None else CursesInput(screen)
+                self.stream_loop(keys, engine, stdscr, screen)
         finally:
+            stdscr.nodelay(False)
             curses.nocbreak()
             curses.echo()
             stdscr.keypad(False)
@@ -161,38 +248,56 @@ class User_interface():
 
         # Create a robot
         self.robot = self.sdk.create_robot('192.168.80.3')
+        start_profiling(self.profile, self.robot)
 
-        # Retrive robot id
-        self.id_client = self.robot.ensure_client('robot-id')
-
-        # Asynchronous call for the robot id
-        fut = self.id_client.get_id_async()
-
-        # Auttheticating the robot
-        self.robot.authenticate('user', '8w6sm6qeboc9')
+        # Authenticate, time sync, clients, lease and the first robot state, overlapped where they
+        # can be. Command deadlines are converted to robot time, which needs the time sync.
+        self.session = connect(self.robot, 'user', '8w6sm6qeboc9')
+        print('\n'.join(self.session.startup.report_lines()))
+        self.clock = self.session.clock
+        print(self.clock.describe())
 
-        # Retreaving robot state
-        self.state_client = self.robot.ensure_client('robot-state')
-        print(self.state_client.get_robot_state().battery_states)
-
-        # E-Stop State
-        estop_client = self.robot.ensure_client('estop')
-        
-        assert not self.robot.is_estopped(), 'Robot is estopped. Please use an external E-Stop client, ' \
-                                        'such as the estop SDK example, to configure E-Stop.'
-
-        
-        self.lease_client = self.robot.ensure_client(bosdyn.client.lease.LeaseClient.default_service_name)
-        with bosdyn.client.lease.LeaseKeepAlive(self.lease_client, must_acquire=True, return_at_exit=True):
+        # Robot state comes from the background cache
+        self.state_task = self.session.state_task
+        self.status.state_task = self.state_task
+        self.status.lease_keepalive = self.session.lease_keepalive
+        self.status.clock = self.clock
+        lease_client = self.session.clients[bosdyn.client.lease.LeaseClient.default_service_name]
+        self.watcher = StateWatcher(self.state_task, lease_client.lease_wallet)
+        self.watcher.start()
+        state, _ = self.state_task.latest()
+        if state is not None:
+            print(state.battery_states)
 
+        with self.session:
+            self.command_client = self.session.clients[RobotCommandClient.default_service_name]
 
-            self.command_client = self.robot.ensure_client(RobotCommandClient.default_service_name)
-            
-            curses.wrapper(self.interface)
+            try:
+                curses.wrapper(self.stream_interface if self.stream else self.interface)
+            finally:
+                print(self.latency_report())
+                print('\n'.join(self.session.scheduler.report_lines()))
+                STATS.dump()
+                finish_profiling(self.profile_report)
+                if self.capture is not None:
+                    count = self.capture.save()
+                    print(f'Captured {count} commands to {self.capture.path}')
 
         
 def main():
-    ui = User_interface()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stream', action='store_true',
+                        help='Hold keys to move; velocity is streamed at a fixed rate')
+    parser.add_argument('--capture', metavar='PATH',
+                        help='Log every command to PATH for replay with capture.py')
+    parser.add_argument('--keys', metavar='PATH',
+                        help='Read keys from a script or --capture file instead of the keyboard')
+    add_profile_argument(parser)
+    options = parser.parse_args()
+    ui = User_interface(stream=options.stream,
+                        capture=CommandCapture(options.capture) if options.capture else None,
+                        profile=options.profile, profile_report=options.profile_report,
+                        keys=ScriptedInput(load_script(options.keys)) if options.keys else None)
     ui.main()
     
 if __name__ == '__main__':
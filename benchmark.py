@@ -0,0 +1,648 @@
+"""Offline control-loop benchmarks against the local fake Spot (fake_spot.py).
+
+Drives the existing entry points -- startup.connect, basic.py key dispatch (direct and headless
+from scripted key bursts), the streaming teleop engine (alone and with every camera streaming),
+tutorial.relative_move, choreography sequences, beat-scheduled dance moves, compiled move
+libraries, body pose streaming, capture replay, smoothing and offline preview, and the robot-state
+cache -- and reports startup time, commands/s, p50/p99 round-trip times, scheduling error and
+feedback-poll counts.
+
+    python benchmark.py --latency 0.005 --jitter 0.002 --failure-rate 0.01
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+import bosdyn.client
+from bosdyn.client import ResponseError, RpcError, math_helpers
+from bosdyn.client.estop import EstopClient
+from bosdyn.client.frame_helpers import BODY_FRAME_NAME, ODOM_FRAME_NAME, get_se2_a_tform_b
+from bosdyn.client.lease import LeaseClient, LeaseKeepAlive
+from bosdyn.client.robot_command import RobotCommandBuilder, RobotCommandClient, blocking_stand
+from bosdyn.client.robot_state import RobotStateClient
+
+import basic
+import capture
+import choreography
+import dance
+import move_library
+import move_pipeline
+import pose_stream
+import preview
+import smoothing
+import startup
+import telemetry
+import transforms
+import tutorial
+from fake_spot import FakeSpot
+from image_capture import AsyncImageCapture
+from input_sources import ScriptedInput, burst_events
+from instrumentation import STATS, instrument_robot
+from robot_clock import RobotClock
+from robot_state_cache import AsyncRobotState
+from scheduler import Scheduler
+from state_watcher import ESTOP, StateWatcher
+from teleop import TeleopEngine
+from ui import EstopNoGui
+
+
+class _NullScreen():
+    """Stands in for the curses window so interface code can report errors headless."""
+
+    def addstr(self, *args):
+        pass
+
+
+def percentiles(samples):
+    """Return (p50, p99) of `samples` in milliseconds, or (None, None) when empty."""
+    if not samples:
+        return None, None
+    ordered = sorted(samples)
+    p99_index = min(len(ordered) - 1, int(len(ordered) * 0.99))
+    return ordered[len(ordered) // 2] * 1000, ordered[p99_index] * 1000
+
+
+def _timed_calls(count, call):
+    """Run `call` `count` times; returns (round-trip seconds of successes, error count, seconds)."""
+    samples = []
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        t0 = time.perf_counter()
+        try:
+            call()
+        except (ResponseError, RpcError):
+            errors += 1
+            continue
+        samples.append(time.perf_counter() - t0)
+    return samples, errors, time.perf_counter() - start
+
+
+def _rate_report(name, samples, errors, elapsed, **extra):
+    p50, p99 = percentiles(samples)
+    report = dict(name=name, calls=len(samples) + errors, errors=errors,
+                  per_sec=(len(samples) + errors) / elapsed if elapsed else 0.0, p50_ms=p50,
+                  p99_ms=p99)
+    report.update(extra)
+    return report
+
+
+def bench_robot_command(command_client, count):
+    cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=0.0, v_rot=0.0)
+    samples, errors, elapsed = _timed_calls(
+        count, lambda: command_client.robot_command(command=cmd, end_time_secs=time.time() + 0.6))
+    return _rate_report('robot_command', samples, errors, elapsed)
+
+
+def bench_feedback(command_client, count):
+    samples, errors, elapsed = _timed_calls(count, command_client.robot_command_feedback)
+    return _rate_report('robot_command_feedback', samples, errors, elapsed)
+
+
+def bench_get_robot_state(state_client, count):
+    samples, errors, elapsed = _timed_calls(count, state_client.get_robot_state)
+    return _rate_report('get_robot_state', samples, errors, elapsed)
+
+
+def bench_key_dispatch(robot, clock, command_client, count):
+    """basic.py table dispatch: key lookup through RPC return."""
+    ui = basic.User_interface()
+    ui.robot = robot
+    ui.clock = clock
+    ui.command_client = command_client
+    keys = [ord(k) for k in 'wasdqec']
+    screen = _NullScreen()
+    start = time.perf_counter()
+    for i in range(count):
+        ui.dispatch(keys[i % len(keys)], screen)
+    elapsed = time.perf_counter() - start
+    return _rate_report('basic_dispatch', ui.dispatch_latencies, 0, elapsed)
+
+
+def bench_key_bursts(robot, clock, command_client, input_rate, bursts=3, burst_size=10,
+                     name='key_bursts'):
+    """basic.py's key loop run headless on key bursts 2 ms apart, pausing `input_rate` s per key.
+
+    Latency runs from when each key was typed to when its command's RPC returned, so it includes
+    the time the key waited behind the keys before it.
+    """
+    ui = basic.User_interface()
+    ui.robot = robot
+    ui.clock = clock
+    ui.command_client = command_client
+    ui.input_rate = input_rate
+    events = burst_events('wasdqec', bursts, burst_size)
+    keys = ScriptedInput(events)
+    latencies = []
+    dispatch = ui.dispatch
+
+    def timed_dispatch(key, stdscr):
+        dispatched = dispatch(key, stdscr)
+        if dispatched:
+            latencies.append(time.monotonic() - keys.pressed)
+        return dispatched
+
+    ui.dispatch = timed_dispatch
+    start = time.perf_counter()
+    ui.key_loop(keys)
+    elapsed = time.perf_counter() - start
+    return _rate_report(name, latencies, 0, elapsed, input_rate_s=input_rate,
+                        script_s=events[-1][0])
+
+
+def bench_scripted_stream(clock, command_client, state_task, lease_wallet, duration):
+    """basic.py's streaming loop run headless on `w` auto-repeating every 30 ms."""
+    ui = basic.User_interface(stream=True)
+    ui.clock = clock
+    ui.command_client = command_client
+    ui.watcher = basic.StateWatcher(state_task, lease_wallet)
+    ui.watcher.start()
+    keys = ScriptedInput(burst_events('w', 1, int(duration / 0.03), key_interval=0.03))
+    try:
+        engine = ui.stream_engine()
+        with engine:
+            start = time.perf_counter()
+            ui.stream_loop(keys, engine)
+            elapsed = time.perf_counter() - start
+    finally:
+        ui.watcher.stop()
+    return dict(name='scripted_stream', keys=keys.delivered - 1, calls=engine.sent,
+                per_sec=engine.sent / elapsed, ticks=engine.ticks, late_ticks=engine.late_ticks)
+
+
+def bench_teleop_stream(command_client, duration, name='teleop_stream'):
+    """Hold w+q on the streaming engine and measure the achieved send rate."""
+    errors = []
+    engine = TeleopEngine(command_client, basic.KEY_VELOCITIES,
+                          max_velocity=(basic.BASE_SPEED, basic.BASE_SPEED, basic.BASE_ROTATION),
+                          on_error=errors.append)
+    with engine:
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            engine.key_event(ord('w'))
+            engine.key_event(ord('q'))
+            time.sleep(0.03)
+    return dict(name=name, calls=engine.sent + len(errors), errors=len(errors),
+                per_sec=engine.sent / duration, ticks=engine.ticks, late_ticks=engine.late_ticks)
+
+
+def bench_teleop_with_cameras(robot, command_client, duration, camera_rate):
+    """Teleop stream while every camera is captured and decoded; late_ticks should not rise."""
+    capture = AsyncImageCapture(robot, rate_hz=camera_rate)
+    with capture:
+        capture.toggle_video_mode()
+        report = bench_teleop_stream(command_client, duration, name='teleop_with_cameras')
+    report.update(camera_requests_per_sec=capture.requests / duration,
+                  frames_per_sec=capture.decoded / duration, frames_dropped=capture.dropped)
+    return report
+
+
+def bench_pose_stream(spot, clock, command_client, duration, rate_hz, slow_latency=None,
+                      name='pose_stream'):
+    """Stream a groove at `rate_hz`; with slow_latency, every RPC takes longer than a tick."""
+    curve = pose_stream.groove(120.0, duration * 2, rate_hz)
+    latency = spot.faults.latency
+    if slow_latency is not None:
+        spot.faults.latency = slow_latency
+    try:
+        report = pose_stream.PoseStreamer(command_client, clock).play(curve)
+    finally:
+        spot.faults.latency = latency
+    return dict(name=name, **report)
+
+
+def bench_scheduled_commands(spot, clock, command_client, count, spacing=0.05):
+    """Commands scheduled on the robot clock; error is the fake robot's receive time minus target."""
+    cmd = RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=0.0, v_rot=0.0)
+    start = clock.robot_time() + spacing
+    errors = []
+    failures = 0
+    for i in range(count):
+        target = start + i * spacing
+        try:
+            cmd_id, _ = clock.send_command(command_client, cmd, target, basic.CMD_DURATION)
+        except (ResponseError, RpcError):
+            failures += 1
+            continue
+        errors.append(abs(spot.robot.received_time(cmd_id) - target))
+    p50, p99 = percentiles(errors)
+    return dict(name='scheduled_command', calls=count, errors=failures, offset_ms=clock.offset * 1000,
+                round_trip_ms=clock.round_trip * 1000, abs_error_p50_ms=p50, abs_error_p99_ms=p99)
+
+
+def bench_replay(robot, clock, command_client, count, tempo):
+    """Capture `count` basic.py key dispatches, then replay them at `tempo`."""
+    ui = basic.User_interface(capture=capture.CommandCapture())
+    ui.robot = robot
+    ui.clock = clock
+    ui.command_client = command_client
+    keys = [ord(k) for k in 'wasdqec']
+    screen = _NullScreen()
+    for i in range(count):
+        ui.dispatch(keys[i % len(keys)], screen)
+        time.sleep(basic.INPUT_RATE)
+    replayer = capture.Replayer(robot, command_client, clock)
+    results = replayer.run(ui.capture.events, tempo=tempo)
+    errors = [abs(error) for _, _, error in results if error is not None]
+    p50, p99 = percentiles(errors)
+    return dict(name='replay', calls=len(results), errors=len(results) - len(errors), tempo=tempo,
+                abs_error_p50_ms=p50, abs_error_p99_ms=p99)
+
+
+def bench_dance_analysis(seconds):
+    """Beat tracking on a synthetic click track `seconds` long."""
+    samples = dance.click_track(128.0, seconds)
+    start = time.perf_counter()
+    track = dance.analyze(samples, 44100)
+    return dict(name='dance_analysis', track_s=seconds, analysis_s=time.perf_counter() - start,
+                bpm=track.bpm, beats=len(track.beats))
+
+
+def bench_smoothing(seconds, step=0.6, clock_skew=50.0, drive=(0.5, 0.0, 0.3, 3.0)):
+    """Smooth a scripted `seconds` of basic.py key velocities held `step` s each, then drive one
+    smoothed step on a fake robot whose clock is `clock_skew` s off and measure where it ends."""
+    velocities = list(basic.KEY_VELOCITIES.values())
+    steps = [smoothing.VelocityStep(*velocities[(i * 5) % len(velocities)], step)
+             for i in range(int(seconds / step))]
+    start = time.perf_counter()
+    path = smoothing.smooth(steps)
+    commands = path.commands(math_helpers.SE2Pose(0, 0, 0), 0.0)
+    elapsed = time.perf_counter() - start
+    raw = smoothing.sample_steps(steps)
+    drift = path.poses[-1] - smoothing.integrate(raw)[-1]
+
+    drive_path = smoothing.smooth([smoothing.VelocityStep(*drive)])
+    with FakeSpot(clock_skew=clock_skew) as spot:
+        sdk = bosdyn.client.create_standard_sdk('BenchmarkSmoothing')
+        with startup.connect(spot.create_robot(sdk), 'user', 'password') as session:
+            session.robot.power_on(timeout_sec=20)
+            command_client = session.clients[RobotCommandClient.default_service_name]
+            blocking_stand(command_client, timeout_sec=10)
+            state = session.state_task.current()
+            start_pose = math_helpers.SE2Pose(*spot.robot.pose)
+            sent_at = time.time()
+            drive_path.send(command_client, session.clock, state)
+            # Settle for a point spacing past the end of the path.
+            time.sleep(max(sent_at + smoothing.COMMAND_LEAD + drive_path.duration +
+                           smoothing.POINT_SPACING - time.time(), 0.0))
+            x, y, yaw = drive_path.poses[-1]
+            goal = start_pose * math_helpers.SE2Pose(float(x), float(y), float(yaw))
+            end_error = math.hypot(spot.robot.pose[0] - goal.x, spot.robot.pose[1] - goal.y)
+            session.robot.time_sync.stop()
+    return dict(name='smoothing', calls=len(steps), trajectory_commands=len(commands),
+                points=len(path.points()[0]), compute_ms=elapsed * 1000,
+                raw_peak_accel=float(smoothing.peak_acceleration(raw).max()),
+                smooth_peak_accel=float(smoothing.peak_acceleration(path.velocities).max()),
+                end_drift_m=float(math.hypot(drift[0], drift[1])), clock_skew_s=clock_skew,
+                skewed_drive_error_m=end_error)
+
+
+def bench_preview(seconds, step=0.6):
+    """Simulate and check `seconds` of key velocities, and a square walked for as long."""
+    velocities = list(basic.KEY_VELOCITIES.values())
+    steps = [smoothing.VelocityStep(*velocities[(i * 5) % len(velocities)], step)
+             for i in range(int(seconds / step))]
+    start = time.perf_counter()
+    steps_preview = preview.simulate_steps(steps)
+    preview.check(steps_preview)
+    steps_s = time.perf_counter() - start
+    lap = preview.simulate_moves(move_pipeline.square(1.0)).duration
+    start = time.perf_counter()
+    moves_preview = preview.simulate_moves(move_pipeline.square(1.0) * int(seconds / lap))
+    preview.check(moves_preview)
+    moves_s = time.perf_counter() - start
+    return dict(name='preview', routine_s=seconds, steps_ms=steps_s * 1000,
+                moves_ms=moves_s * 1000, moves_routine_s=moves_preview.duration,
+                issues=len(steps_preview.issues) + len(moves_preview.issues))
+
+
+def bench_dance(clock, command_client, beats):
+    """Dance the routine to `beats` beats at 128 BPM and report per-beat timing error."""
+    track = dance.analyze(dance.click_track(128.0, beats * 60.0 / 128.0 + 1.0), 44100)
+    scheduler = dance.BeatScheduler(command_client, clock)
+    results = scheduler.run(dance.choreograph(track.beats[:beats]))
+    errors = [abs(error) for _, _, error in results if error is not None]
+    p50, p99 = percentiles(errors)
+    return dict(name='dance', calls=len(results), errors=len(results) - len(errors),
+                abs_error_p50_ms=p50, abs_error_p99_ms=p99)
+
+
+def bench_move_library(clock, command_client, moves, path='benchmark_moves.lib'):
+    """Compile a `moves`-step routine, then time mapping it and sending its first command."""
+    description = move_library.dance_description(moves)
+    start = time.perf_counter()
+    size = move_library.write(path, description)
+    compile_s = time.perf_counter() - start
+    start = time.perf_counter()
+    library = move_library.load(path)
+    load_s = time.perf_counter() - start
+    cue = next(library.cues(math_helpers.SE2Pose(0, 0, 0)))
+    clock.send_command(command_client, cue.command, clock.robot_time(), cue.duration)
+    first_send_s = time.perf_counter() - start
+    start = time.perf_counter()
+    steps = sum(1 for _ in library.cues(math_helpers.SE2Pose(0, 0, 0)))
+    cues_s = time.perf_counter() - start
+    library.close()
+    os.remove(path)
+    return dict(name='move_library', calls=steps, file_bytes=size, compile_ms=compile_s * 1000,
+                load_ms=load_s * 1000, first_send_ms=first_send_s * 1000,
+                all_cues_ms=cues_s * 1000)
+
+
+def bench_relative_moves(spot, command_client, state_task, moves):
+    """tutorial.relative_move around a square; reports feedback polls per move."""
+    spot.reset_counts()
+    results = []
+    errors = 0
+    start = time.perf_counter()
+    for i in range(moves):
+        dx, dyaw = (0.5, 0.0) if i % 2 == 0 else (0.0, math.radians(90))
+        try:
+            result = tutorial.relative_move(dx, 0, dyaw, ODOM_FRAME_NAME, command_client,
+                                            state_task)
+        except (ResponseError, RpcError):
+            errors += 1
+            continue
+        results.append(result)
+        errors += not result.reached
+    elapsed = time.perf_counter() - start
+    polls = [result.rpc_count for result in results] or [0]
+    return dict(name='relative_move', calls=moves, errors=errors,
+                per_sec=moves / elapsed, feedback_polls_per_move=sum(polls) / len(polls),
+                max_feedback_polls=max(polls),
+                server_feedback_rpcs=spot.rpc_counts().get('RobotCommandFeedback', 0))
+
+
+def bench_move_pipeline(command_client, state_task, side=0.5):
+    """walk_square pipelined with blended corners vs settled relative_move calls."""
+    rates = move_pipeline.compare(move_pipeline.square(side), command_client, state_task)
+    return dict(name='move_pipeline', calls=len(move_pipeline.square(side)),
+                pipelined_moves_per_min=rates['pipelined'], settled_moves_per_min=rates['settled'])
+
+
+def bench_choreography(command_client, state_task):
+    results = choreography.benchmark(choreography.SQUARE, command_client, state_task)
+    return dict(name='choreography_square', trajectory_s=results['trajectory'],
+                step_by_step_s=results['step_by_step'])
+
+
+def bench_state_cache(spot, state_client, rate_hz, duration):
+    spot.reset_counts()
+    task = AsyncRobotState(state_client, rate_hz=rate_hz)
+    with task:
+        time.sleep(duration)
+    return dict(name='state_cache', target_hz=rate_hz, per_sec=task.poll_count / duration,
+                server_state_rpcs=spot.rpc_counts().get('GetRobotState', 0))
+
+
+def bench_startup(spot, latency):
+    """startup.connect() with its phases one after another, then overlapped, at `latency`."""
+    totals = {}
+    spot.faults.latency = latency
+    try:
+        for mode, workers in (('sequential', 1), ('parallel', startup.STARTUP_WORKERS)):
+            # A fresh sdk each time: an sdk keeps one robot, and its channels, per address.
+            sdk = bosdyn.client.create_standard_sdk(f'BenchmarkStartup{mode}')
+            with startup.connect(spot.create_robot(sdk), 'user', 'password',
+                                 max_workers=workers) as session:
+                totals[mode] = session.startup.total
+                session.robot.time_sync.stop()
+    finally:
+        spot.faults.latency = 0.0
+    return dict(name='startup', latency_ms=latency * 1000,
+                sequential_ms=totals['sequential'] * 1000, parallel_ms=totals['parallel'] * 1000)
+
+
+def bench_scheduler(spot, duration, camera_rate):
+    """Every background task of a session on one scheduler; per-task start jitter."""
+    sdk = bosdyn.client.create_standard_sdk('BenchmarkScheduler')
+    path = 'benchmark_scheduler.bin'
+    with startup.connect(spot.create_robot(sdk), 'user', 'password') as session:
+        scheduler = session.scheduler
+        estop_nogui = EstopNoGui(session.clients[EstopClient.default_service_name], 9.0,
+                                 'BenchmarkScheduler', scheduler)
+        images = AsyncImageCapture(session.robot, rate_hz=camera_rate, scheduler=scheduler)
+        recorder = telemetry.TelemetryRecorder(path, session.state_task, scheduler=scheduler)
+        with images, recorder:
+            images.toggle_video_mode()
+            time.sleep(duration)
+            stats = {task.name: task.stats() for task in scheduler.tasks}
+        estop_nogui.estop_keep_alive.shutdown()
+        session.robot.time_sync.stop()
+    os.remove(path)
+    os.remove(path + '.idx')
+    report = dict(name='scheduler', calls=sum(s['runs'] for s in stats.values()),
+                  errors=sum(s['errors'] for s in stats.values()))
+    for name in ('estop', 'lease', 'robot_state', 'images'):
+        if 'jitter_p99_ms' in stats.get(name, {}):
+            report[f'{name}_p99_ms'] = stats[name]['jitter_p99_ms']
+    report['images_skipped'] = stats.get('images', {}).get('skipped', 0)
+    return report
+
+
+def bench_estop_detection(spot, estop_nogui, state_client, scheduler, trials):
+    """Estop trigger to StateWatcher callback, with the watcher riding on one shared state poll.
+
+    'kick' reads the estop keepalive on the scheduler, whose check-in results trigger an early
+    poll, as ui.py does; 'poll' sees only the regular polls, as for an estop set by another client.
+    """
+    report = dict(name='estop_detection', calls=trials * 2, errors=0)
+    for mode, keepalive in (('kick', estop_nogui.estop_keep_alive), ('poll', None)):
+        task = AsyncRobotState(state_client)
+        watcher = StateWatcher(task, estop_keepalive=keepalive, scheduler=scheduler)
+        seen = threading.Event()
+        watcher.on_change(lambda kind, old, new: seen.set(), kinds=[ESTOP])
+        delays = []
+        start = time.perf_counter()
+        with task, watcher:
+            task.wait_for_update(timeout=2.0)
+            for i in range(trials):
+                # Spread the triggers over the poll phase.
+                time.sleep(task.rate_hz ** -1 * (1.0 + (i * 0.37) % 1.0))
+                seen.clear()
+                t0 = time.perf_counter()
+                if i % 2 == 0:
+                    estop_nogui.stop()
+                else:
+                    estop_nogui.allow()
+                if seen.wait(timeout=2.0):
+                    delays.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+        p50, p99 = percentiles(delays)
+        report['errors'] += trials - len(delays)
+        report[f'{mode}_p50_ms'] = p50
+        report[f'{mode}_p99_ms'] = p99
+        report[f'{mode}_max_ms'] = max(delays) * 1000 if delays else None
+        report[f'{mode}_polls_per_sec'] = task.poll_count / elapsed
+        report[f'{mode}_late_snapshots'] = watcher.late_snapshots
+    report['poll_hz'] = task.rate_hz
+    return report
+
+
+def bench_telemetry(state_client, rows, path='benchmark_telemetry.bin'):
+    """Telemetry recording cost per row, size on disk and time to map the file back."""
+    state = state_client.get_robot_state()
+    recorder = telemetry.TelemetryRecorder(path, max_rate_hz=1e9)
+    start = time.perf_counter()
+    for i in range(rows):
+        recorder.record(state, i / telemetry.MAX_RECORD_RATE)
+    elapsed = time.perf_counter() - start
+    recorder.stop()
+    start = time.perf_counter()
+    recording = telemetry.load(path)
+    load_s = time.perf_counter() - start
+    row_bytes = recording.data.dtype.itemsize
+    os.remove(path)
+    os.remove(path + '.idx')
+    return dict(name='telemetry', calls=rows, record_us=elapsed / rows * 1e6, row_bytes=row_bytes,
+                proto_bytes=state.ByteSize(),
+                mb_per_hour=row_bytes * telemetry.MAX_RECORD_RATE * 3600 / 1e6,
+                load_ms=load_s * 1000)
+
+
+def bench_transforms(state_client, count, lookups=4):
+    """Body pose lookups, `lookups` per snapshot: frame_helpers vs the transform cache."""
+    states = [state_client.get_robot_state() for _ in range(count)]
+    start = time.perf_counter()
+    for state in states:
+        for _ in range(lookups):
+            get_se2_a_tform_b(state.kinematic_state.transforms_snapshot, ODOM_FRAME_NAME,
+                              BODY_FRAME_NAME)
+    direct_s = time.perf_counter() - start
+    cache = transforms.TransformCache()
+    start = time.perf_counter()
+    for state in states:
+        for _ in range(lookups):
+            cache.se2_a_tform_b(state, ODOM_FRAME_NAME, BODY_FRAME_NAME)
+    cached_s = time.perf_counter() - start
+    start = time.perf_counter()
+    poses = cache.se2_poses(states, ODOM_FRAME_NAME, BODY_FRAME_NAME)
+    batch_s = time.perf_counter() - start
+    calls = count * lookups
+    return dict(name='transforms', calls=calls, direct_us=direct_s / calls * 1e6,
+                cached_us=cached_s / calls * 1e6, batch_us_per_row=batch_s / len(poses) * 1e6,
+                hit_rate=cache.hits / (cache.hits + cache.misses))
+
+
+def run(options):
+    """Start the fake robot, run every benchmark and return the list of reports."""
+    reports = []
+    with FakeSpot(clock_skew=options.clock_skew, seed=options.seed) as spot:
+        reports.append(bench_startup(spot, options.startup_latency))
+        reports.append(bench_scheduler(spot, options.duration * 3, options.camera_rate))
+        sdk = bosdyn.client.create_standard_sdk('Benchmark')
+        robot = spot.create_robot(sdk)
+        instrument_robot(robot)
+        robot.authenticate('user', 'password')
+        clock = RobotClock(robot).wait_for_sync()
+
+        scheduler = Scheduler().start()
+        estop_nogui = EstopNoGui(robot.ensure_client(EstopClient.default_service_name), 9.0,
+                                 'Benchmark', scheduler)
+        state_client = robot.ensure_client(RobotStateClient.default_service_name)
+        state_task = AsyncRobotState(state_client)
+        lease_client = robot.ensure_client(LeaseClient.default_service_name)
+        try:
+            with state_task, LeaseKeepAlive(lease_client, must_acquire=True,
+                                            return_at_exit=True):
+                robot.power_on(timeout_sec=20)
+                command_client = robot.ensure_client(RobotCommandClient.default_service_name)
+                blocking_stand(command_client, timeout_sec=10)
+
+                # Inject faults only once setup is done, so they hit the measured loops.
+                spot.faults.latency = options.latency
+                spot.faults.jitter = options.jitter
+                spot.faults.failure_rate = options.failure_rate
+                reports.append(bench_robot_command(command_client, options.commands))
+                reports.append(bench_feedback(command_client, options.commands))
+                reports.append(bench_get_robot_state(state_client, options.commands))
+                reports.append(bench_key_dispatch(robot, clock, command_client, options.commands))
+                reports.append(bench_key_bursts(robot, clock, command_client, 0.0))
+                reports.append(bench_key_bursts(robot, clock, command_client, basic.INPUT_RATE,
+                                                name='key_bursts_paced'))
+                reports.append(bench_scripted_stream(clock, command_client, state_task,
+                                                     lease_client.lease_wallet, options.duration))
+                reports.append(bench_teleop_stream(command_client, options.duration))
+                reports.append(bench_teleop_with_cameras(robot, command_client, options.duration,
+                                                         options.camera_rate))
+                reports.append(bench_pose_stream(spot, clock, command_client, options.duration,
+                                                 pose_stream.MAX_RATE))
+                reports.append(bench_pose_stream(spot, clock, command_client, options.duration,
+                                                 pose_stream.SEND_RATE, slow_latency=0.05,
+                                                 name='pose_stream_slow'))
+                reports.append(bench_state_cache(spot, state_client, 20.0, options.duration))
+                reports.append(bench_telemetry(state_client, options.commands * 4))
+                reports.append(bench_transforms(state_client, options.commands))
+                reports.append(bench_scheduled_commands(spot, clock, command_client,
+                                                        options.moves * 25))
+                reports.append(bench_dance(clock, command_client, options.beats))
+                reports.append(bench_move_library(clock, command_client, 1000))
+                reports.append(bench_replay(robot, clock, command_client, options.beats,
+                                            options.tempo))
+                reports.append(bench_relative_moves(spot, command_client, state_task,
+                                                    options.moves))
+                if options.choreography:
+                    reports.append(bench_choreography(command_client, state_task))
+                    reports.append(bench_move_pipeline(command_client, state_task))
+                # Last: estopping cuts motor power.
+                reports.append(bench_estop_detection(spot, estop_nogui, state_client, scheduler, 20))
+        finally:
+            estop_nogui.estop_keep_alive.shutdown()
+            scheduler.stop()
+    reports.append(bench_dance_analysis(300.0))
+    reports.append(bench_smoothing(120.0))
+    reports.append(bench_preview(600.0))
+    return reports
+
+
+def format_report(report):
+    parts = [f'{report["name"]:<24}']
+    for key, value in report.items():
+        if key == 'name' or value is None:
+            continue
+        parts.append(f'{key}={value:.2f}' if isinstance(value, float) else f'{key}={value}')
+    return '  '.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--latency', type=float, default=0.002, help='Injected latency (s)')
+    parser.add_argument('--jitter', type=float, default=0.001, help='Latency jitter (s)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Injected failure rate')
+    parser.add_argument('--clock-skew', type=float, default=0.25,
+                        help='Fake robot clock offset from local time (s)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for injected faults')
+    parser.add_argument('--commands', type=int, default=500, help='Calls per RPC benchmark')
+    parser.add_argument('--moves', type=int, default=4, help='relative_move calls')
+    parser.add_argument('--beats', type=int, default=32, help='Beats danced by the dance benchmark')
+    parser.add_argument('--tempo', type=float, default=1.5,
+                        help='Playback speed of the capture replay benchmark')
+    parser.add_argument('--duration', type=float, default=2.0,
+                        help='Seconds for rate benchmarks')
+    parser.add_argument('--camera-rate', type=float, default=10.0,
+                        help='Batched camera request rate (Hz) during the teleop benchmark')
+    parser.add_argument('--startup-latency', type=float, default=0.02,
+                        help='Injected latency (s) while timing startup')
+    parser.add_argument('--choreography', action='store_true',
+                        help='Also time the square as one trajectory, pipelined and step by step')
+    parser.add_argument('--json', help='Write the reports to this file as JSON')
+    options = parser.parse_args()
+
+    reports = run(options)
+    for report in reports:
+        print(format_report(report))
+    print()
+    print('\n'.join(STATS.report_lines()))
+    if options.json:
+        with open(options.json, 'w') as out:
+            json.dump(reports, out, indent=2)
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
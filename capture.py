@@ -0,0 +1,232 @@
+"""Capture teleop sessions and replay them on the robot with their original timing.
+
+    python basic.py --capture run.jsonl                              # drive, logging every command
+    python capture.py run.jsonl --hostname 192.168.80.3 --tempo 1.25 # play it back 25% faster
+
+A capture is one JSON event per line: seconds since capture start on the monotonic clock, the
+kind of command (velocity, stand, sit, stop, power_on, power_off), the key and description that
+triggered it, and for velocity commands the (v_x, v_y, v_rot) triple and how long it was sent for.
+"""
+import argparse
+import getpass
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import bosdyn.client
+from bosdyn.client import ResponseError, RpcError
+from bosdyn.client.lease import Error as LeaseBaseError
+from bosdyn.client.robot_command import (RobotCommandBuilder, RobotCommandClient, blocking_sit,
+                                         blocking_stand)
+
+from startup import connect
+
+START_DELAY = 1.0  # seconds between starting a replay and its first event
+LATE_TOLERANCE = 0.05  # seconds; velocity events later than this are skipped
+POWER_TIMEOUT = 20.0  # seconds
+
+VELOCITY = 'velocity'
+STAND = 'stand'
+SIT = 'sit'
+STOP = 'stop'
+POWER_ON = 'power_on'
+POWER_OFF = 'power_off'
+
+# Kinds replayed through the command client, and how to rebuild each from an event.
+COMMAND_BUILDERS = {
+    VELOCITY: lambda event: RobotCommandBuilder.synchro_velocity_command(*event['velocity']),
+    STAND: lambda event: RobotCommandBuilder.synchro_stand_command(),
+    SIT: lambda event: RobotCommandBuilder.synchro_sit_command(),
+    STOP: lambda event: RobotCommandBuilder.stop_command(),
+}
+
+LOGGER = logging.getLogger(__name__)
+
+
+def classify(command):
+    """Kind of a RobotCommand and, for velocity commands, its (v_x, v_y, v_rot).
+
+    Returns:
+        (kind, velocity or None); kind is None for commands a capture cannot rebuild.
+    """
+    if command.HasField('full_body_command'):
+        if command.full_body_command.HasField('stop_request'):
+            return STOP, None
+        return None, None
+    mobility = command.synchronized_command.mobility_command
+    if mobility.HasField('se2_velocity_request'):
+        velocity = mobility.se2_velocity_request.velocity
+        return VELOCITY, (velocity.linear.x, velocity.linear.y, velocity.angular)
+    if mobility.HasField('stand_request'):
+        return STAND, None
+    if mobility.HasField('sit_request'):
+        return SIT, None
+    return None, None
+
+
+class CommandCapture():
+    """Timestamped log of the commands a teleop session dispatches. Safe to call from any thread."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self.events = []
+        self.unsupported = 0  # commands seen that cannot be replayed
+
+    def _append(self, event):
+        event['t'] = time.monotonic() - self._start
+        with self._lock:
+            self.events.append(event)
+
+    def command(self, desc, command, duration=None, key=None):
+        """Log a RobotCommand sent for `duration` seconds (None for commands without an end)."""
+        kind, velocity = classify(command)
+        if kind is None:
+            self.unsupported += 1
+            return
+        self._append({'kind': kind, 'desc': desc, 'key': key, 'velocity': velocity,
+                      'duration': duration})
+
+    def velocity(self, velocity, duration, desc='velocity', key=None):
+        self._append({'kind': VELOCITY, 'desc': desc, 'key': key, 'velocity': tuple(velocity),
+                      'duration': duration})
+
+    def event(self, kind, desc=None, key=None):
+        """Log a non-motion event such as POWER_ON."""
+        self._append({'kind': kind, 'desc': desc or kind, 'key': key, 'velocity': None,
+                      'duration': None})
+
+    def save(self, path=None):
+        """Write the events to `path` (default the path given at construction). Returns the count."""
+        path = path or self.path
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event['t'])
+        with open(path, 'w') as out:
+            for event in events:
+                out.write(json.dumps(event) + '\n')
+        return len(events)
+
+
+def load(path):
+    """Events of a saved capture, in time order."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class Replayer():
+    """Plays captured events back so each reaches the robot at its captured offset.
+
+    Every event is scheduled against one start time on the robot clock (RobotClock.schedule), so
+    timing errors do not accumulate over a long capture the way chained sleeps do. `tempo`
+    stretches time: 2.0 plays twice as fast, with velocity commands lasting half as long.
+    Velocity events that are already too late are skipped, as the next one supersedes them; other
+    events are always sent.
+    """
+
+    def __init__(self, robot, command_client, clock):
+        self._robot = robot
+        self._command_client = command_client
+        self._clock = clock
+        self.results = []  # (event index, desc, timing error in seconds or None if not sent)
+
+    def _send(self, event, target, tempo, desc):
+        kind = event['kind']
+        if kind == POWER_ON:
+            return self._clock.schedule(
+                target, lambda: self._robot.power_on(timeout_sec=POWER_TIMEOUT), desc)[1]
+        if kind == POWER_OFF:
+            return self._clock.schedule(
+                target, lambda: self._robot.power_off(cut_immediately=False), desc)[1]
+        command = COMMAND_BUILDERS[kind](event)
+        if event['duration'] is None:
+            return self._clock.schedule(
+                target, lambda: self._command_client.robot_command(command=command), desc)[1]
+        return self._clock.send_command(self._command_client, command, target,
+                                        event['duration'] / tempo, desc)[1]
+
+    def run(self, events, tempo=1.0, start_robot_time=None):
+        """Replay `events` from robot clock `start_robot_time` (default START_DELAY from now).
+
+        Returns:
+            List of (event index, desc, timing error in seconds or None if not sent).
+        """
+        if start_robot_time is None:
+            start_robot_time = self._clock.robot_time() + START_DELAY
+        first = events[0]['t'] if events else 0.0
+        self.results = []
+        for i, event in enumerate(events):
+            target = start_robot_time + (event['t'] - first) / tempo
+            desc = f'event {i} ({event["desc"]})'
+            if (event['kind'] == VELOCITY and
+                    self._clock.robot_time() + self._clock.send_lead > target + LATE_TOLERANCE):
+                LOGGER.warning('%s: skipped, too late', desc)
+                self.results.append((i, event['desc'], None))
+                continue
+            try:
+                error = self._send(event, target, tempo, desc)
+            except (ResponseError, RpcError, LeaseBaseError) as err:
+                LOGGER.warning('%s: failed: %s', desc, err)
+                self.results.append((i, event['desc'], None))
+                continue
+            self.results.append((i, event['desc'], error))
+        return self.results
+
+    def report(self):
+        """Per-event timing error lines followed by a summary line."""
+        lines = []
+        errors = []
+        for i, desc, error in self.results:
+            if error is None:
+                lines.append(f'event {i:>5} {desc:<24} not sent')
+            else:
+                errors.append(abs(error))
+                lines.append(f'event {i:>5} {desc:<24} {error * 1000:+7.2f} ms')
+        if errors:
+            errors.sort()
+            p99 = errors[min(len(errors) - 1, int(len(errors) * 0.99))]
+            lines.append(f'{len(errors)}/{len(self.results)} events sent, |error| p50 '
+                         f'{errors[len(errors) // 2] * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, '
+                         f'max {errors[-1] * 1000:.2f} ms')
+        return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('capture', help='Capture file written by basic.py --capture')
+    parser.add_argument('--hostname', help='Robot to replay on; without it only summarize')
+    parser.add_argument('--tempo', type=float, default=1.0,
+                        help='Playback speed; 2.0 replays twice as fast')
+    options = parser.parse_args()
+
+    events = load(options.capture)
+    length = events[-1]['t'] - events[0]['t'] if events else 0.0
+    print(f'{len(events)} events over {length:.1f}s, {length / options.tempo:.1f}s at tempo '
+          f'{options.tempo:g}')
+    if options.hostname is None:
+        return True
+
+    sdk = bosdyn.client.create_standard_sdk('Replay')
+    robot = sdk.create_robot(options.hostname)
+    username = os.environ.get('BOSDYN_CLIENT_USERNAME') or input('Username: ')
+    password = os.environ.get('BOSDYN_CLIENT_PASSWORD') or getpass.getpass()
+    with connect(robot, username, password) as session:
+        robot.power_on(timeout_sec=POWER_TIMEOUT)
+        command_client = session.clients[RobotCommandClient.default_service_name]
+        blocking_stand(command_client, timeout_sec=10)
+
+        replayer = Replayer(robot, command_client, session.clock)
+        replayer.run(events, tempo=options.tempo)
+        print('\n'.join(replayer.report()))
+
+        blocking_sit(command_client, timeout_sec=10)
+        robot.power_off(cut_immediately=False)
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,181 @@
+import argparse
+import math
+import sys
+import time
+from collections import namedtuple
+
+import bosdyn.client
+import bosdyn.client.util
+from bosdyn.api import basic_command_pb2, mobility_command_pb2, robot_command_pb2
+from bosdyn.api import synchronized_command_pb2, trajectory_pb2
+from bosdyn.client import math_helpers
+from bosdyn.client.frame_helpers import BODY_FRAME_NAME, ODOM_FRAME_NAME
+from bosdyn.client.lease import LeaseClient, LeaseKeepAlive
+from bosdyn.client.robot_command import (RobotCommandBuilder, RobotCommandClient, blocking_sit,
+                                         blocking_stand)
+from bosdyn.client.robot_state import RobotStateClient
+from bosdyn.util import seconds_to_duration, seconds_to_timestamp
+from google.protobuf import any_pb2
+
+from goal_wait import wait_for_goal
+from robot_state_cache import AsyncRobotState
+from transforms import TRANSFORMS
+
+# Extra time past the last waypoint before the command expires.
+END_TIME_MARGIN = 5.0  # seconds
+
+Step = namedtuple('Step', ['dx', 'dy', 'dyaw', 'duration'])
+Step.__doc__ = ('One choreography step: a body-relative SE2 offset reached `duration` s after the '
+                'previous.')
+
+# The square from tutorial.walk_square, one side and one quarter turn at a time.
+SQUARE = [Step(1, 0, 0, 1.2), Step(0, 0, math.radians(90), 1.2)] * 4
+
+
+def compile_waypoints(start_tform_body, steps):
+    """Compose relative steps into absolute waypoints.
+
+    Args:
+        start_tform_body: math_helpers.SE2Pose of the body in the output frame at the start.
+        steps: Iterable of Step (or (dx, dy, dyaw, duration) tuples).
+
+    Returns:
+        List of (SE2Pose, seconds since start) for each step, in the same frame as start_tform_body.
+    """
+    waypoints = []
+    out_tform_goal = start_tform_body
+    elapsed = 0.0
+    for dx, dy, dyaw, duration in steps:
+        out_tform_goal = out_tform_goal * math_helpers.SE2Pose(x=dx, y=dy, angle=dyaw)
+        elapsed += duration
+        waypoints.append((out_tform_goal, elapsed))
+    return waypoints
+
+
+def trajectory_command(waypoints, frame_name=ODOM_FRAME_NAME, params=None, reference_time=None,
+                       interpolation=None):
+    """Build one synchronized RobotCommand that follows every waypoint in order.
+
+    reference_time is in local time.time() seconds; RobotCommandClient.robot_command converts it
+    to robot time. Without one, waypoint times count from when the robot receives the command.
+    interpolation is a trajectory_pb2.PosInterpolation; the robot's default when None.
+    """
+    if params is None:
+        params = RobotCommandBuilder.mobility_params()
+    points = [
+        trajectory_pb2.SE2TrajectoryPoint(pose=pose.to_proto(),
+                                          time_since_reference=seconds_to_duration(t))
+        for pose, t in waypoints
+    ]
+    traj = trajectory_pb2.SE2Trajectory(points=points)
+    if reference_time is not None:
+        traj.reference_time.CopyFrom(seconds_to_timestamp(reference_time))
+    if interpolation is not None:
+        traj.interpolation = interpolation
+    traj_command = basic_command_pb2.SE2TrajectoryCommand.Request(trajectory=traj,
+                                                                  se2_frame_name=frame_name)
+    any_params = any_pb2.Any()
+    any_params.Pack(params)
+    mobility_command = mobility_command_pb2.MobilityCommand.Request(
+        se2_trajectory_request=traj_command, params=any_params)
+    synchronized_command = synchronized_command_pb2.SynchronizedCommand.Request(
+        mobility_command=mobility_command)
+    return robot_command_pb2.RobotCommand(synchronized_command=synchronized_command)
+
+
+class Choreography():
+    """A sequence of relative moves sent to the robot as a single multi-point trajectory."""
+
+    def __init__(self, steps, frame_name=ODOM_FRAME_NAME, stairs=False):
+        self.steps = [Step(*step) for step in steps]
+        self.frame_name = frame_name
+        self.stairs = stairs
+
+    @property
+    def duration(self):
+        return sum(step.duration for step in self.steps)
+
+    def build(self, state, transforms=TRANSFORMS):
+        """Build the RobotCommand starting from the body pose in a RobotState.
+
+        `transforms` is the transforms.TransformCache to look the pose up in.
+        """
+        out_tform_body = transforms.se2_a_tform_b(state, self.frame_name, BODY_FRAME_NAME)
+        waypoints = compile_waypoints(out_tform_body, self.steps)
+        return trajectory_command(waypoints, self.frame_name,
+                                  RobotCommandBuilder.mobility_params(stair_hint=self.stairs))
+
+    def run(self, command_client, state_task):
+        """Send the whole sequence in one RPC and wait for the robot to settle at the last goal.
+
+        Returns:
+            goal_wait.GoalResult for the sequence.
+        """
+        state = state_task.current()
+        robot_cmd = self.build(state)
+        end_time_secs = time.time() + self.duration + END_TIME_MARGIN
+        cmd_id = command_client.robot_command(command=robot_cmd, end_time_secs=end_time_secs)
+        return wait_for_goal(command_client, cmd_id, end_time_secs, expected_secs=self.duration)
+
+
+def benchmark(steps, command_client, state_task, frame_name=ODOM_FRAME_NAME):
+    """Time a sequence as one trajectory and as step-by-step relative_move calls.
+
+    The robot ends each run displaced by the sequence, so use a closed routine (like SQUARE) with
+    room to move.
+
+    Returns:
+        Dict of {'trajectory': seconds, 'step_by_step': seconds}.
+    """
+    # Imported here so the choreography module does not pull in tutorial's camera dependencies.
+    from tutorial import relative_move
+
+    results = {}
+    start = time.time()
+    Choreography(steps, frame_name).run(command_client, state_task)
+    results['trajectory'] = time.time() - start
+
+    start = time.time()
+    for dx, dy, dyaw, _ in steps:
+        relative_move(dx, dy, dyaw, frame_name, command_client, state_task)
+    results['step_by_step'] = time.time() - start
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    bosdyn.client.util.add_base_arguments(parser)
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Compare one-trajectory and step-by-step sequence time')
+    options = parser.parse_args()
+
+    sdk = bosdyn.client.create_standard_sdk('Choreography')
+    robot = sdk.create_robot(options.hostname)
+    bosdyn.client.util.authenticate(robot)
+    robot.time_sync.wait_for_sync()
+
+    assert not robot.is_estopped(), 'Robot is estopped. Please use an external E-Stop client, ' \
+                                    'such as the estop SDK example, to configure E-Stop.'
+
+    state_task = AsyncRobotState(robot.ensure_client(RobotStateClient.default_service_name))
+    lease_client = robot.ensure_client(LeaseClient.default_service_name)
+    with state_task, LeaseKeepAlive(lease_client, must_acquire=True, return_at_exit=True):
+        robot.power_on(timeout_sec=20)
+        command_client = robot.ensure_client(RobotCommandClient.default_service_name)
+        blocking_stand(command_client, timeout_sec=10)
+
+        if options.benchmark:
+            results = benchmark(SQUARE, command_client, state_task)
+            print(f'One trajectory: {results["trajectory"]:.2f}s')
+            print(f'Step by step:   {results["step_by_step"]:.2f}s')
+        else:
+            print(Choreography(SQUARE).run(command_client, state_task))
+
+        blocking_sit(command_client, timeout_sec=10)
+        robot.power_off(cut_immediately=False)
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,355 @@
+"""Dance to a WAV file: offline beat tracking plus a robot-clock beat scheduler.
+
+    python dance.py song.wav                         # analyze only
+    python dance.py song.wav --hostname 192.168.80.3 # analyze, then dance to the first beats
+"""
+import argparse
+import logging
+import sys
+import time
+import wave
+from collections import namedtuple
+
+import numpy as np
+
+import bosdyn.client
+import bosdyn.client.util
+from bosdyn.client import ResponseError, RpcError
+from bosdyn.client.lease import Error as LeaseBaseError
+from bosdyn.client.lease import LeaseClient, LeaseKeepAlive
+from bosdyn.client.robot_command import (RobotCommandBuilder, RobotCommandClient, blocking_sit,
+                                         blocking_stand)
+from bosdyn.geometry import EulerZXY
+
+from robot_clock import RobotClock
+
+# Onset analysis
+FRAME_SIZE = 1024  # samples per spectrum
+HOP_SIZE = 512  # samples between spectra
+CHUNK_FRAMES = 2048  # spectra computed per FFT batch, bounds memory on long tracks
+MIN_BPM = 60.0
+MAX_BPM = 180.0
+PREFERRED_BPM = 120.0  # tempo prior; halves and doubles of the true tempo are weighed against it
+SNAP_WINDOW = 0.15  # fraction of a beat period each beat may move to land on an onset peak
+PHASE_BEATS = 16  # beats at the start of the track used to find the phase of the first beat
+PERIOD_ADAPT = 0.1  # how fast the tracked beat period follows the measured beat spacing
+
+# Scheduling
+START_DELAY = 1.0  # seconds between starting the scheduler and the first beat
+LATE_TOLERANCE = 0.05  # seconds; cues that can no longer make it within this are skipped
+END_MARGIN = 0.1  # seconds a move's command outlives its slot, so moves hand over without a stop
+
+DANCE_SPEED = 0.3  # m/s
+DANCE_ROTATION = 0.6  # rad/sec
+BOB_HEIGHT = -0.1  # m
+TWIST_YAW = 0.3  # rad
+
+BeatTrack = namedtuple('BeatTrack', ['bpm', 'beats', 'duration'])
+BeatTrack.__doc__ = 'Estimated tempo, beat times in seconds from the start, and track length.'
+
+Cue = namedtuple('Cue', ['time', 'name', 'command', 'duration'])
+Cue.__doc__ = 'One move: start time in seconds from the first beat, RobotCommand and slot length.'
+
+# Move name -> RobotCommand; velocity moves get their end time when sent.
+MOVES = {
+    'bob': RobotCommandBuilder.synchro_stand_command(body_height=BOB_HEIGHT),
+    'rise': RobotCommandBuilder.synchro_stand_command(body_height=0.0),
+    'twist_left': RobotCommandBuilder.synchro_stand_command(
+        footprint_R_body=EulerZXY(yaw=TWIST_YAW, roll=0, pitch=0)),
+    'twist_right': RobotCommandBuilder.synchro_stand_command(
+        footprint_R_body=EulerZXY(yaw=-TWIST_YAW, roll=0, pitch=0)),
+    'sway_left': RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=DANCE_SPEED, v_rot=0.0),
+    'sway_right': RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=-DANCE_SPEED,
+                                                               v_rot=0.0),
+    'spin_left': RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=0.0,
+                                                              v_rot=DANCE_ROTATION),
+    'spin_right': RobotCommandBuilder.synchro_velocity_command(v_x=0.0, v_y=0.0,
+                                                               v_rot=-DANCE_ROTATION),
+}
+
+# Two bars of 4/4; every move returns the robot to where it started.
+ROUTINE = ['bob', 'rise', 'bob', 'rise', 'sway_left', 'sway_right', 'twist_left', 'twist_right',
+           'bob', 'rise', 'spin_left', 'spin_right', 'sway_right', 'sway_left', 'twist_right', 'rise']
+
+LOGGER = logging.getLogger(__name__)
+
+
+def load_wav(path):
+    """Read a PCM WAV file. Returns (mono float32 samples in [-1, 1], sample rate)."""
+    with wave.open(path, 'rb') as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 3:
+        # Little-endian 24 bit: widen to 32 bit by shifting into the top three bytes.
+        bytes3 = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((bytes3[:, 0] << 8 | bytes3[:, 1] << 16 | bytes3[:, 2] << 24) /
+                   float(1 << 31)).astype(np.float32)
+    else:
+        dtype = {2: np.int16, 4: np.int32}[width]
+        samples = np.frombuffer(raw, dtype=dtype).astype(np.float32) / np.iinfo(dtype).max
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+def write_wav(path, samples, rate):
+    """Write mono float samples in [-1, 1] as 16 bit PCM."""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+
+
+def click_track(bpm, duration, rate=44100, offset=0.25, seed=0):
+    """Synthetic test track: decaying clicks on every beat over quiet noise."""
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(0, 0.01, int(duration * rate)).astype(np.float32)
+    click_len = int(0.03 * rate)
+    click = (np.sin(2 * np.pi * 1000 * np.arange(click_len) / rate) *
+             np.exp(-np.arange(click_len) / (0.005 * rate))).astype(np.float32)
+    for beat in np.arange(offset, duration - 0.03, 60.0 / bpm):
+        start = int(beat * rate)
+        samples[start:start + click_len] += 0.8 * click
+    return samples
+
+
+def onset_envelope(samples, rate, frame_size=FRAME_SIZE, hop_size=HOP_SIZE):
+    """Spectral-flux onset strength, one value per hop.
+
+    Returns:
+        (envelope as float32 array, envelope rate in Hz)
+    """
+    if len(samples) < frame_size:
+        return np.zeros(0, dtype=np.float32), rate / hop_size
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame_size)[::hop_size]
+    window = np.hanning(frame_size).astype(np.float32)
+    flux = np.empty(len(frames), dtype=np.float32)
+    previous = None
+    for start in range(0, len(frames), CHUNK_FRAMES):
+        chunk = frames[start:start + CHUNK_FRAMES] * window
+        spectrum = np.log1p(np.abs(np.fft.rfft(chunk, axis=1)).astype(np.float32))
+        if previous is None:
+            previous = spectrum[:1]
+        # Sum of increases in every bin since the previous spectrum.
+        stacked = np.concatenate([previous, spectrum])
+        flux[start:start + len(chunk)] = np.maximum(np.diff(stacked, axis=0), 0).sum(axis=1)
+        previous = spectrum[-1:]
+    # Remove the slowly varying level so only onsets stand out.
+    smooth = int(rate / hop_size)  # about one second
+    if len(flux) > smooth:
+        kernel = np.ones(smooth, dtype=np.float32)
+        # Divide by the in-range kernel weight so the level does not sag at either end.
+        level = (np.convolve(flux, kernel, mode='same') /
+                 np.convolve(np.ones_like(flux), kernel, mode='same'))
+        flux = np.maximum(flux - level, 0)
+    return flux, rate / hop_size
+
+
+def estimate_tempo(envelope, envelope_rate, min_bpm=MIN_BPM, max_bpm=MAX_BPM):
+    """Tempo in BPM from the envelope autocorrelation, weighted toward PREFERRED_BPM.
+
+    Returns PREFERRED_BPM for a track too short for one spectrum or without any onsets.
+    """
+    if not np.any(envelope > 0):
+        return PREFERRED_BPM
+    # A little smoothing keeps a period that falls between two lags from splitting its peak.
+    smoothed = np.convolve(envelope, np.array([0.25, 0.5, 0.25], dtype=np.float32), mode='same')
+    centered = smoothed - smoothed.mean()
+    size = 1 << (2 * len(centered) - 1).bit_length()
+    spectrum = np.fft.rfft(centered, size)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(centered)]
+    lags = np.arange(int(envelope_rate * 60 / max_bpm), int(envelope_rate * 60 / min_bpm) + 1)
+    lags = lags[(lags > 0) & (lags < len(autocorr))]
+    if not len(lags):
+        return PREFERRED_BPM
+    bpms = 60.0 * envelope_rate / lags
+    prior = np.exp(-0.5 * (np.log2(bpms / PREFERRED_BPM) / 1.0)**2)
+    best = lags[np.argmax(autocorr[lags] * prior)]
+    # Refine the integer lag with a parabola through its neighbours.
+    if 0 < best < len(autocorr) - 1:
+        y0, y1, y2 = autocorr[best - 1:best + 2]
+        denom = y0 - 2 * y1 + y2
+        best = best + (0.5 * (y0 - y2) / denom if denom else 0.0)
+    return min(max(60.0 * envelope_rate / best, min_bpm), max_bpm)
+
+
+def track_beats(envelope, envelope_rate, bpm):
+    """Beat positions in envelope frames at about `bpm`.
+
+    The phase comes from the comb that best fits the first PHASE_BEATS beats; after that each beat
+    is predicted one period after the previous one and snapped to the strongest onset near the
+    prediction, and the period follows the measured spacing so slow tempo drift is tracked.
+    """
+    period = envelope_rate * 60.0 / bpm
+    if len(envelope) < period:
+        return np.zeros(0)
+    # Score every phase of a short comb at once.
+    phases = np.arange(int(np.ceil(period)))
+    teeth = np.arange(min(PHASE_BEATS, int(len(envelope) / period)))
+    positions = np.minimum(np.rint(phases[:, None] + teeth[None, :] * period).astype(int),
+                           len(envelope) - 1)
+    position = float(phases[np.argmax(envelope[positions].sum(axis=1))])
+
+    reach = max(1, int(period * SNAP_WINDOW))
+    offsets = np.arange(-reach, reach + 1)
+    # Prefer onsets close to the prediction so off-beat hits do not pull the track.
+    closeness = np.exp(-0.5 * (offsets / reach)**2)
+    nominal = period
+    beats = []
+    first_heard = None  # first and one past the last beat that landed on an onset
+    heard = 0
+    floor = envelope.mean()  # weaker peaks count as silence
+    while position < len(envelope):
+        predicted = int(round(position))
+        candidates = np.clip(predicted + offsets, 0, len(envelope) - 1)
+        weighted = envelope[candidates] * closeness
+        if weighted.max() > floor:
+            beat = candidates[np.argmax(weighted)]
+            if beats:
+                spacing = min(max(beat - beats[-1], 0.8 * nominal), 1.2 * nominal)
+                period += PERIOD_ADAPT * (spacing - period)
+            if first_heard is None:
+                first_heard = len(beats)
+            heard = len(beats) + 1
+        else:
+            # No onset: keep the beat going at the current period.
+            beat = predicted
+        beats.append(beat)
+        position = beat + period
+    # Do not beat through silence before the music starts or after it ends.
+    return np.array(beats[first_heard or 0:heard], dtype=float)
+
+
+def analyze(samples, rate):
+    """Tempo and beats of a mono track."""
+    envelope, envelope_rate = onset_envelope(samples, rate)
+    bpm = estimate_tempo(envelope, envelope_rate)
+    # Envelope frame k covers samples from k * HOP_SIZE; report the middle of the frame.
+    beats = track_beats(envelope, envelope_rate, bpm) / envelope_rate + FRAME_SIZE / 2.0 / rate
+    return BeatTrack(bpm, beats, len(samples) / rate)
+
+
+def choreograph(beats, routine=ROUTINE, beats_per_move=1):
+    """Map `routine` (repeated as needed) onto every `beats_per_move`-th beat.
+
+    Returns:
+        List of Cue with times relative to the first beat.
+    """
+    slots = np.asarray(beats)[::beats_per_move]
+    if not len(slots):
+        return []
+    times = slots - slots[0]
+    # The last move gets as long as the one before it.
+    durations = np.append(np.diff(times), times[-1] - times[-2] if len(times) > 1 else 0.5)
+    return [
+        Cue(float(t), routine[i % len(routine)], MOVES[routine[i % len(routine)]], float(d))
+        for i, (t, d) in enumerate(zip(times, durations))
+    ]
+
+
+class BeatScheduler():
+    """Sends cues so each reaches the robot on its beat, measured on the robot clock.
+
+    Each send leads its beat by the transit time RobotClock has measured, so RPC latency does not
+    push moves late. A cue that can no longer reach the robot within LATE_TOLERANCE of its beat is
+    skipped instead of sent late, so one slow RPC does not shift the rest of the dance.
+    """
+
+    def __init__(self, command_client, clock):
+        self._command_client = command_client
+        self._clock = clock
+        self.results = []  # (cue index, move name, timing error in seconds or None if skipped)
+
+    def run(self, cues, start_robot_time=None):
+        """Dance `cues` starting at robot clock `start_robot_time` (default START_DELAY from now).
+
+        Returns:
+            List of (cue index, move name, timing error in seconds or None if skipped).
+        """
+        if start_robot_time is None:
+            start_robot_time = self._clock.robot_time() + START_DELAY
+        self.results = []
+        for i, cue in enumerate(cues):
+            target = start_robot_time + cue.time
+            if self._clock.robot_time() + self._clock.send_lead > target + LATE_TOLERANCE:
+                LOGGER.warning('beat %d (%s): skipped, too late', i, cue.name)
+                self.results.append((i, cue.name, None))
+                continue
+            try:
+                _, error = self._clock.send_command(self._command_client, cue.command, target,
+                                                    cue.duration + END_MARGIN,
+                                                    desc=f'beat {i} ({cue.name})')
+            except (ResponseError, RpcError, LeaseBaseError) as err:
+                LOGGER.warning('beat %d (%s): failed: %s', i, cue.name, err)
+                self.results.append((i, cue.name, None))
+                continue
+            self.results.append((i, cue.name, error))
+        return self.results
+
+    def report(self):
+        """Per-beat timing error lines followed by a summary line."""
+        lines = []
+        errors = []
+        for i, name, error in self.results:
+            if error is None:
+                lines.append(f'beat {i:>4} {name:<12} skipped')
+            else:
+                errors.append(abs(error))
+                lines.append(f'beat {i:>4} {name:<12} {error * 1000:+7.2f} ms')
+        if errors:
+            errors.sort()
+            p99 = errors[min(len(errors) - 1, int(len(errors) * 0.99))]
+            lines.append(f'{len(errors)}/{len(self.results)} beats sent, |error| mean '
+                         f'{np.mean(errors) * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, '
+                         f'max {errors[-1] * 1000:.2f} ms')
+        return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('wav', help='PCM WAV file to dance to')
+    parser.add_argument('--hostname', help='Robot to dance on; without it only analyze the track')
+    parser.add_argument('--beats', type=int, default=32, help='Number of beats to dance')
+    parser.add_argument('--beats-per-move', type=int, default=1, help='Beats each move lasts')
+    options = parser.parse_args()
+
+    start = time.perf_counter()
+    samples, rate = load_wav(options.wav)
+    track = analyze(samples, rate)
+    print(f'{track.duration:.1f}s track, {track.bpm:.1f} BPM, {len(track.beats)} beats '
+          f'(analysis {time.perf_counter() - start:.2f}s)')
+    if options.hostname is None:
+        return True
+
+    sdk = bosdyn.client.create_standard_sdk('Dance')
+    robot = sdk.create_robot(options.hostname)
+    bosdyn.client.util.authenticate(robot)
+    clock = RobotClock(robot).wait_for_sync()
+    print(clock.describe())
+
+    assert not robot.is_estopped(), 'Robot is estopped. Please use an external E-Stop client, ' \
+                                    'such as the estop SDK example, to configure E-Stop.'
+
+    lease_client = robot.ensure_client(LeaseClient.default_service_name)
+    with LeaseKeepAlive(lease_client, must_acquire=True, return_at_exit=True):
+        robot.power_on(timeout_sec=20)
+        command_client = robot.ensure_client(RobotCommandClient.default_service_name)
+        blocking_stand(command_client, timeout_sec=10)
+
+        cues = choreograph(track.beats[:options.beats], beats_per_move=options.beats_per_move)
+        scheduler = BeatScheduler(command_client, clock)
+        scheduler.run(cues)
+        print('\n'.join(scheduler.report()))
+
+        blocking_sit(command_client, timeout_sec=10)
+        robot.power_off(cut_immediately=False)
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,908 @@
+"""Local stand-in for the Spot services used by basic.py, tutorial.py and ui.py.
+
+Runs robot-id, auth, directory, time-sync, robot-state, lease, estop, power, robot-command and
+image gRPC services on localhost behind TLS, so an unmodified bosdyn client can connect to it. The
+body is a simple kinematic model: velocity commands are integrated, trajectories are followed at a
+fixed speed, and stand/sit take a fixed time. Latency, jitter and failures can be injected per RPC.
+
+Usage:
+    with FakeSpot(latency=0.005) as spot:
+        sdk = bosdyn.client.create_standard_sdk('bench')
+        robot = spot.create_robot(sdk)
+        robot.authenticate('user', 'password')
+"""
+import argparse
+import io
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent import futures
+
+import grpc
+import numpy as np
+from PIL import Image
+
+from bosdyn.api import (auth_pb2, auth_service_pb2_grpc, basic_command_pb2, directory_pb2,
+                        directory_service_pb2_grpc, estop_pb2, estop_service_pb2_grpc,
+                        header_pb2, image_pb2, image_service_pb2_grpc, lease_pb2,
+                        lease_service_pb2_grpc, power_pb2,
+                        power_service_pb2_grpc, robot_command_pb2, robot_command_service_pb2_grpc,
+                        robot_id_pb2, robot_id_service_pb2_grpc, robot_state_pb2,
+                        robot_state_service_pb2_grpc, time_sync_pb2, time_sync_service_pb2_grpc)
+from bosdyn.client import math_helpers
+from bosdyn.client.frame_helpers import (BODY_FRAME_NAME, GRAV_ALIGNED_BODY_FRAME_NAME,
+                                         ODOM_FRAME_NAME, VISION_FRAME_NAME)
+from bosdyn.util import (nsec_to_timestamp, sec_to_nsec, seconds_to_duration, timestamp_to_nsec,
+                         timestamp_to_sec)
+
+AUTHORITY = 'api.spot.robot'
+CLOCK_IDENTIFIER = 'fake-spot'
+
+# Kinematic model
+TRAJECTORY_SPEED = 1.0  # m/s
+TRAJECTORY_ROTATION = 1.5  # rad/sec
+GOAL_TOLERANCE = 0.02  # m and rad
+SETTLE_TIME = 0.4  # seconds at the goal before the body reports settled
+STAND_TIME = 1.0  # seconds to stand up or sit down
+JOINT_NAMES = [f'{leg}.{joint}' for leg in ('fl', 'fr', 'hl', 'hr') for joint in ('hx', 'hy', 'kn')]
+
+# Greyscale fisheye cameras served by the image service
+CAMERA_SOURCES = ['frontleft_fisheye_image', 'frontright_fisheye_image', 'left_fisheye_image',
+                  'right_fisheye_image', 'back_fisheye_image']
+CAMERA_ROWS = 480
+CAMERA_COLS = 640
+
+# (service name, service type) entries listed by the directory
+SERVICES = [
+    ('robot-state', 'bosdyn.api.RobotStateService'),
+    ('lease', 'bosdyn.api.LeaseService'),
+    ('estop', 'bosdyn.api.EstopService'),
+    ('power', 'bosdyn.api.PowerService'),
+    ('robot-command', 'bosdyn.api.RobotCommandService'),
+    ('time-sync', 'bosdyn.api.TimeSyncService'),
+    ('image', 'bosdyn.api.ImageService'),
+]
+
+
+class FaultInjection():
+    """Latency, jitter and failure rate applied to every RPC, with optional per-RPC overrides.
+
+    Overrides are keyed by RPC name, e.g. {'RobotCommand': {'latency': 0.05}}.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, overrides=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.overrides = overrides or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _setting(self, rpc, name):
+        return self.overrides.get(rpc, {}).get(name, getattr(self, name))
+
+    def delay(self, rpc):
+        jitter = self._setting(rpc, 'jitter')
+        with self._lock:
+            offset = self._random.uniform(-jitter, jitter) if jitter else 0.0
+        return max(0.0, self._setting(rpc, 'latency') + offset)
+
+    def should_fail(self, rpc):
+        rate = self._setting(rpc, 'failure_rate')
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+
+class _FaultInterceptor(grpc.ServerInterceptor):
+    """Counts RPCs and applies FaultInjection before each unary handler runs."""
+
+    def __init__(self, faults, counts, lock):
+        self._faults = faults
+        self._counts = counts
+        self._lock = lock
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+        rpc = handler_call_details.method.rsplit('/', 1)[-1]
+        inner = handler.unary_unary
+
+        def wrapper(request, context):
+            with self._lock:
+                self._counts[rpc] += 1
+            delay = self._faults.delay(rpc)
+            if delay:
+                time.sleep(delay)
+            if self._faults.should_fail(rpc):
+                context.abort(grpc.StatusCode.UNAVAILABLE, f'Injected failure in {rpc}')
+            return inner(request, context)
+
+        return grpc.unary_unary_rpc_method_handler(
+            wrapper, request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer)
+
+
+class _Command():
+    """One robot command as seen by the fake robot."""
+
+    def __init__(self, command_id, kind, start, end_time=None, velocity=None, waypoints=None):
+        self.id = command_id
+        self.kind = kind  # 'velocity', 'trajectory', 'stand', 'sit', 'stop' or 'safe_power_off'
+        self.start = start
+        self.end_time = end_time
+        self.velocity = velocity
+        self.waypoints = waypoints  # list of (robot time, (x, y, yaw)) including the start pose
+        self.at_goal_time = None
+        self.done_time = None
+        self.overridden = False
+
+
+def _wrap(angle):
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+def _se3_from_se2(x, y, yaw):
+    return math_helpers.SE3Pose(x, y, 0.0, math_helpers.Quat.from_yaw(yaw)).to_proto()
+
+
+class FakeRobot():
+    """Kinematic and service state of the stand-in robot. Time is kept on the robot's clock."""
+
+    def __init__(self, clock_skew=0.0):
+        self.clock_skew = clock_skew
+        self._lock = threading.RLock()
+        self.pose = [0.0, 0.0, 0.0]  # x, y, yaw of body in odom
+        self.body_velocity = (0.0, 0.0, 0.0)
+        self.motor_power = False
+        self.standing = False
+        self.battery = 87.0
+        self._last_update = self.time()
+
+        self._commands = {}
+        self._active = None
+        self._next_command_id = 1
+
+        self._lease_owner = None
+        self._lease_sequence = 0
+
+        self._estop_config = estop_pb2.EstopConfig(unique_id='1')
+        self._estop_checkins = {}  # endpoint unique id -> (robot time, stop level)
+        self._next_estop_id = 1
+
+    def time(self):
+        """Robot clock in seconds."""
+        return time.time() + self.clock_skew
+
+    def timestamp(self):
+        return nsec_to_timestamp(sec_to_nsec(self.time()))
+
+    # Kinematic model
+
+    def update(self):
+        """Advance the model to the current time."""
+        with self._lock:
+            now = self.time()
+            dt = now - self._last_update
+            self._last_update = now
+            if self.estop_level() != estop_pb2.ESTOP_LEVEL_NONE:
+                self.motor_power = False
+            command = self._active
+            self.body_velocity = (0.0, 0.0, 0.0)
+            if command is None or not self.motor_power:
+                if not self.motor_power:
+                    self.standing = False
+                return
+            if command.kind == 'velocity':
+                if now < command.end_time:
+                    self._integrate(command.velocity, dt)
+            elif command.kind == 'trajectory':
+                self._follow(command, now, dt)
+            elif command.kind == 'stand':
+                if now - command.start >= STAND_TIME:
+                    self.standing = True
+            elif command.kind in ('sit', 'safe_power_off'):
+                if now - command.start >= STAND_TIME:
+                    self.standing = False
+                    if command.kind == 'safe_power_off':
+                        self.motor_power = False
+
+    def _integrate(self, velocity, dt):
+        v_x, v_y, v_rot = velocity
+        yaw = self.pose[2]
+        self.pose[0] += (v_x * math.cos(yaw) - v_y * math.sin(yaw)) * dt
+        self.pose[1] += (v_x * math.sin(yaw) + v_y * math.cos(yaw)) * dt
+        self.pose[2] = _wrap(yaw + v_rot * dt)
+        self.body_velocity = velocity
+
+    def _follow(self, command, now, dt):
+        if now > command.end_time:
+            return
+        target = self._trajectory_target(command.waypoints, now)
+        x, y, yaw = self.pose
+        dx, dy = target[0] - x, target[1] - y
+        dist = math.hypot(dx, dy)
+        dyaw = _wrap(target[2] - yaw)
+        step = min(dist, TRAJECTORY_SPEED * dt)
+        turn = max(-TRAJECTORY_ROTATION * dt, min(TRAJECTORY_ROTATION * dt, dyaw))
+        if dist > 0:
+            self.pose[0] += dx / dist * step
+            self.pose[1] += dy / dist * step
+        self.pose[2] = _wrap(yaw + turn)
+        if dt > 0:
+            cos_yaw, sin_yaw = math.cos(yaw), math.sin(yaw)
+            v_x = (dx / dist * step if dist else 0.0) / dt
+            v_y = (dy / dist * step if dist else 0.0) / dt
+            self.body_velocity = (cos_yaw * v_x + sin_yaw * v_y, -sin_yaw * v_x + cos_yaw * v_y,
+                                  turn / dt)
+
+        final_time, final = command.waypoints[-1]
+        distance = math.hypot(final[0] - self.pose[0], final[1] - self.pose[1])
+        at_goal = (now >= final_time and distance < GOAL_TOLERANCE and
+                   abs(_wrap(final[2] - self.pose[2])) < GOAL_TOLERANCE)
+        if at_goal and command.at_goal_time is None:
+            command.at_goal_time = now
+        elif not at_goal:
+            command.at_goal_time = None
+
+    @staticmethod
+    def _trajectory_target(waypoints, now):
+        """Pose the trajectory should be at `now`, interpolated between timed waypoints."""
+        for (t0, p0), (t1, p1) in zip(waypoints, waypoints[1:]):
+            if now < t1:
+                if t1 <= t0:
+                    return p1
+                s = max(0.0, (now - t0) / (t1 - t0))
+                return (p0[0] + s * (p1[0] - p0[0]), p0[1] + s * (p1[1] - p0[1]),
+                        p0[2] + s * _wrap(p1[2] - p0[2]))
+        return waypoints[-1][1]
+
+    # Robot command service
+
+    def command(self, request):
+        """Accept a RobotCommandRequest. Returns (status, command id)."""
+        with self._lock:
+            self.update()
+            now = self.time()
+            cmd = request.command
+            kind, kwargs = self._parse_command(cmd, now)
+            if kind is None:
+                return robot_command_pb2.RobotCommandResponse.STATUS_UNSUPPORTED, 0
+            if kind != 'stop' and not self.motor_power:
+                return robot_command_pb2.RobotCommandResponse.STATUS_NOT_POWERED_ON, 0
+            command = _Command(self._next_command_id, kind, now, **kwargs)
+            self._next_command_id += 1
+            if self._active is not None:
+                self._active.overridden = True
+            self._commands[command.id] = command
+            self._active = command
+            if kind in ('velocity', 'trajectory'):
+                # Moving commands stand the robot up first, like the real robot does.
+                self.standing = True
+            return robot_command_pb2.RobotCommandResponse.STATUS_OK, command.id
+
+    def received_time(self, command_id):
+        """Robot clock time at which command `command_id` arrived, or None if unknown."""
+        with self._lock:
+            command = self._commands.get(command_id)
+            return command.start if command is not None else None
+
+    def _parse_command(self, cmd, now):
+        if cmd.HasField('full_body_command'):
+            full_body = cmd.full_body_command
+            if full_body.HasField('stop_request'):
+                return 'stop', {}
+            if full_body.HasField('safe_power_off_request'):
+                return 'safe_power_off', {}
+            return None, {}
+        mobility = cmd.synchronized_command.mobility_command
+        if mobility.HasField('se2_velocity_request'):
+            req = mobility.se2_velocity_request
+            velocity = (req.velocity.linear.x, req.velocity.linear.y, req.velocity.angular)
+            return 'velocity', dict(end_time=timestamp_to_sec(req.end_time), velocity=velocity)
+        if mobility.HasField('se2_trajectory_request'):
+            req = mobility.se2_trajectory_request
+            traj = req.trajectory
+            reference = (timestamp_to_sec(traj.reference_time)
+                         if traj.HasField('reference_time') else now)
+            waypoints = [(now, tuple(self.pose))]
+            if req.se2_frame_name not in (ODOM_FRAME_NAME, VISION_FRAME_NAME):
+                return None, {}
+            for point in traj.points:
+                t = reference + point.time_since_reference.seconds + \
+                    point.time_since_reference.nanos * 1e-9
+                pose = (point.pose.position.x, point.pose.position.y, point.pose.angle)
+                waypoints.append((max(t, waypoints[-1][0]), pose))
+            return 'trajectory', dict(end_time=timestamp_to_sec(req.end_time), waypoints=waypoints)
+        if mobility.HasField('stand_request'):
+            return 'stand', {}
+        if mobility.HasField('sit_request'):
+            return 'sit', {}
+        return None, {}
+
+    def feedback(self, command_id, response):
+        """Fill a RobotCommandFeedbackResponse for `command_id`."""
+        with self._lock:
+            self.update()
+            now = self.time()
+            command = self._commands.get(command_id, self._active if not command_id else None)
+            if command is None:
+                return
+            if command.kind in ('stop', 'safe_power_off'):
+                response.feedback.full_body_feedback.status = \
+                    robot_command_pb2.RobotCommandFeedbackStatus.STATUS_PROCESSING
+                return
+            mobility = response.feedback.synchronized_feedback.mobility_command_feedback
+            status = basic_command_pb2.RobotCommandFeedbackStatus
+            if command.overridden:
+                mobility.status = status.STATUS_COMMAND_OVERRIDDEN
+                return
+            if command.end_time is not None and now > command.end_time:
+                mobility.status = status.STATUS_COMMAND_TIMED_OUT
+                return
+            mobility.status = status.STATUS_PROCESSING
+            if command.kind == 'velocity':
+                mobility.se2_velocity_feedback.SetInParent()
+            elif command.kind == 'trajectory':
+                traj = mobility.se2_trajectory_feedback
+                if command.at_goal_time is None:
+                    traj.status = traj.STATUS_GOING_TO_GOAL
+                    traj.body_movement_status = traj.BODY_STATUS_MOVING
+                else:
+                    traj.status = traj.STATUS_AT_GOAL
+                    traj.body_movement_status = (traj.BODY_STATUS_SETTLED
+                                                 if now - command.at_goal_time >= SETTLE_TIME else
+                                                 traj.BODY_STATUS_MOVING)
+            elif command.kind == 'stand':
+                feedback = mobility.stand_feedback
+                feedback.status = (feedback.STATUS_IS_STANDING
+                                   if self.standing else feedback.STATUS_IN_PROGRESS)
+            elif command.kind == 'sit':
+                feedback = mobility.sit_feedback
+                feedback.status = (feedback.STATUS_IS_SITTING
+                                   if not self.standing else feedback.STATUS_IN_PROGRESS)
+
+    # Power
+
+    def power(self, request):
+        with self._lock:
+            self.update()
+            if request in (power_pb2.PowerCommandRequest.REQUEST_ON,
+                           power_pb2.PowerCommandRequest.REQUEST_ON_MOTORS):
+                if self.estop_level() != estop_pb2.ESTOP_LEVEL_NONE:
+                    return power_pb2.STATUS_ESTOPPED
+                self.motor_power = True
+            else:
+                self.motor_power = False
+                self.standing = False
+            return power_pb2.STATUS_SUCCESS
+
+    # Lease
+
+    def acquire_lease(self, client_name, take=False):
+        """Returns (success, Lease proto)."""
+        with self._lock:
+            if self._lease_owner not in (None, client_name) and not take:
+                return False, None
+            self._lease_owner = client_name
+            self._lease_sequence += 1
+            return True, self.lease()
+
+    def return_lease(self):
+        with self._lock:
+            self._lease_owner = None
+
+    def lease(self):
+        return lease_pb2.Lease(resource='body', epoch='fake-epoch', sequence=[self._lease_sequence],
+                               client_names=[self._lease_owner or ''])
+
+    @property
+    def lease_owner(self):
+        return self._lease_owner
+
+    # Estop
+
+    def estop_config(self):
+        with self._lock:
+            config = estop_pb2.EstopConfig()
+            config.CopyFrom(self._estop_config)
+            return config
+
+    def set_estop_config(self, config, target_config_id):
+        with self._lock:
+            if target_config_id and target_config_id != self._estop_config.unique_id:
+                return estop_pb2.SetEstopConfigResponse.STATUS_INVALID_ID
+            if self.motor_power:
+                return estop_pb2.SetEstopConfigResponse.STATUS_MOTORS_ON
+            new_config = estop_pb2.EstopConfig()
+            new_config.CopyFrom(config)
+            for endpoint in new_config.endpoints:
+                endpoint.unique_id = str(self._next_estop_id)
+                self._next_estop_id += 1
+            new_config.unique_id = str(int(self._estop_config.unique_id) + 1)
+            self._estop_config = new_config
+            self._estop_checkins = {}
+            return estop_pb2.SetEstopConfigResponse.STATUS_SUCCESS
+
+    def estop_check_in(self, endpoint, stop_level):
+        with self._lock:
+            self._estop_checkins[endpoint.unique_id] = (self.time(), stop_level)
+            if stop_level != estop_pb2.ESTOP_LEVEL_NONE:
+                self.motor_power = False
+                self.standing = False
+
+    def estop_level(self):
+        """Combined stop level: any cutting or timed-out endpoint estops the robot."""
+        with self._lock:
+            now = self.time()
+            for endpoint in self._estop_config.endpoints:
+                checkin = self._estop_checkins.get(endpoint.unique_id)
+                timeout = endpoint.timeout.seconds + endpoint.timeout.nanos * 1e-9
+                if checkin is None or now - checkin[0] > timeout:
+                    return estop_pb2.ESTOP_LEVEL_CUT
+                if checkin[1] != estop_pb2.ESTOP_LEVEL_NONE:
+                    return checkin[1]
+            return estop_pb2.ESTOP_LEVEL_NONE
+
+    def estop_status(self, status):
+        with self._lock:
+            now = self.time()
+            for endpoint in self._estop_config.endpoints:
+                entry = status.endpoints.add(endpoint=endpoint)
+                checkin = self._estop_checkins.get(endpoint.unique_id)
+                entry.stop_level = checkin[1] if checkin else estop_pb2.ESTOP_LEVEL_CUT
+                if checkin:
+                    entry.time_since_valid_response.CopyFrom(seconds_to_duration(now - checkin[0]))
+            status.stop_level = self.estop_level()
+
+    # Robot state
+
+    def state(self):
+        with self._lock:
+            self.update()
+            timestamp = self.timestamp()
+            state = robot_state_pb2.RobotState()
+            state.power_state.timestamp.CopyFrom(timestamp)
+            state.power_state.motor_power_state = (robot_state_pb2.PowerState.STATE_ON
+                                                   if self.motor_power else
+                                                   robot_state_pb2.PowerState.STATE_OFF)
+            state.power_state.locomotion_charge_percentage.value = self.battery
+            battery = state.battery_states.add(identifier='fake-battery')
+            battery.timestamp.CopyFrom(timestamp)
+            battery.charge_percentage.value = self.battery
+            battery.status = robot_state_pb2.BatteryState.STATUS_DISCHARGING
+            estopped = self.estop_level() != estop_pb2.ESTOP_LEVEL_NONE
+            estop = state.estop_states.add(name='software_estop',
+                                           type=robot_state_pb2.EStopState.TYPE_SOFTWARE)
+            estop.timestamp.CopyFrom(timestamp)
+            estop.state = (robot_state_pb2.EStopState.STATE_ESTOPPED
+                           if estopped else robot_state_pb2.EStopState.STATE_NOT_ESTOPPED)
+
+            kinematic = state.kinematic_state
+            kinematic.acquisition_timestamp.CopyFrom(timestamp)
+            for name in JOINT_NAMES:
+                joint = kinematic.joint_states.add(name=name)
+                joint.position.value = 0.0
+                joint.velocity.value = 0.0
+            x, y, yaw = self.pose
+            v_x, v_y, v_rot = self.body_velocity
+            velocity = kinematic.velocity_of_body_in_odom
+            velocity.linear.x = v_x * math.cos(yaw) - v_y * math.sin(yaw)
+            velocity.linear.y = v_x * math.sin(yaw) + v_y * math.cos(yaw)
+            velocity.angular.z = v_rot
+            kinematic.velocity_of_body_in_vision.CopyFrom(velocity)
+
+            edges = kinematic.transforms_snapshot.child_to_parent_edge_map
+            edges[ODOM_FRAME_NAME].parent_frame_name = ''
+            edges[VISION_FRAME_NAME].parent_frame_name = ODOM_FRAME_NAME
+            edges[VISION_FRAME_NAME].parent_tform_child.CopyFrom(_se3_from_se2(0.0, 0.0, 0.0))
+            edges[BODY_FRAME_NAME].parent_frame_name = ODOM_FRAME_NAME
+            edges[BODY_FRAME_NAME].parent_tform_child.CopyFrom(_se3_from_se2(x, y, yaw))
+            edges[GRAV_ALIGNED_BODY_FRAME_NAME].parent_frame_name = BODY_FRAME_NAME
+            edges[GRAV_ALIGNED_BODY_FRAME_NAME].parent_tform_child.CopyFrom(
+                _se3_from_se2(0.0, 0.0, 0.0))
+            return state
+
+
+class _Servicer():
+    """Common response header handling for the fake services."""
+
+    def __init__(self, robot):
+        self.robot = robot
+
+    def _header(self, request, response):
+        received = self.robot.timestamp()
+        response.header.request_header.CopyFrom(request.header)
+        response.header.request_received_timestamp.CopyFrom(received)
+        response.header.response_timestamp.CopyFrom(self.robot.timestamp())
+        response.header.error.code = header_pb2.CommonError.CODE_OK
+        return response
+
+
+class _RobotIdServicer(_Servicer, robot_id_service_pb2_grpc.RobotIdServiceServicer):
+
+    def GetRobotId(self, request, context):
+        response = robot_id_pb2.RobotIdResponse()
+        response.robot_id.serial_number = 'fake-spot-0001'
+        response.robot_id.species = 'spot'
+        response.robot_id.nickname = 'fake-spot'
+        response.robot_id.software_release.version.major_version = 5
+        return self._header(request, response)
+
+
+class _AuthServicer(_Servicer, auth_service_pb2_grpc.AuthServiceServicer):
+
+    def GetAuthToken(self, request, context):
+        response = auth_pb2.GetAuthTokenResponse(status=auth_pb2.GetAuthTokenResponse.STATUS_OK,
+                                                 token='fake-spot-token')
+        return self._header(request, response)
+
+
+class _DirectoryServicer(_Servicer, directory_service_pb2_grpc.DirectoryServiceServicer):
+
+    def __init__(self, robot, services):
+        super().__init__(robot)
+        self.entries = [
+            directory_pb2.ServiceEntry(name=name, type=service_type, authority=AUTHORITY,
+                                       user_token_required=True) for name, service_type in services
+        ]
+
+    def ListServiceEntries(self, request, context):
+        response = directory_pb2.ListServiceEntriesResponse(service_entries=self.entries)
+        return self._header(request, response)
+
+    def GetServiceEntry(self, request, context):
+        response = directory_pb2.GetServiceEntryResponse(
+            status=directory_pb2.GetServiceEntryResponse.STATUS_NONEXISTENT_SERVICE)
+        for entry in self.entries:
+            if entry.name == request.service_name:
+                response.status = directory_pb2.GetServiceEntryResponse.STATUS_OK
+                response.service_entry.CopyFrom(entry)
+        return self._header(request, response)
+
+
+class _TimeSyncServicer(_Servicer, time_sync_service_pb2_grpc.TimeSyncServiceServicer):
+
+    def TimeSyncUpdate(self, request, context):
+        response = time_sync_pb2.TimeSyncUpdateResponse(clock_identifier=CLOCK_IDENTIFIER)
+        response.state.measurement_time.CopyFrom(self.robot.timestamp())
+        if request.HasField('previous_round_trip'):
+            trip = request.previous_round_trip
+            rtt = ((timestamp_to_nsec(trip.client_rx) - timestamp_to_nsec(trip.client_tx)) -
+                   (timestamp_to_nsec(trip.server_tx) - timestamp_to_nsec(trip.server_rx)))
+            estimate = response.state.best_estimate
+            estimate.round_trip_time.CopyFrom(seconds_to_duration(max(rtt, 0) * 1e-9))
+            estimate.clock_skew.CopyFrom(seconds_to_duration(self.robot.clock_skew))
+            response.previous_estimate.CopyFrom(estimate)
+            response.state.status = time_sync_pb2.TimeSyncState.STATUS_OK
+        else:
+            response.state.status = time_sync_pb2.TimeSyncState.STATUS_MORE_SAMPLES_NEEDED
+        return self._header(request, response)
+
+
+class _RobotStateServicer(_Servicer, robot_state_service_pb2_grpc.RobotStateServiceServicer):
+
+    def GetRobotState(self, request, context):
+        response = robot_state_pb2.RobotStateResponse(robot_state=self.robot.state())
+        return self._header(request, response)
+
+
+class _LeaseServicer(_Servicer, lease_service_pb2_grpc.LeaseServiceServicer):
+
+    def AcquireLease(self, request, context):
+        response = lease_pb2.AcquireLeaseResponse()
+        ok, lease = self.robot.acquire_lease(request.header.client_name)
+        if ok:
+            response.status = lease_pb2.AcquireLeaseResponse.STATUS_OK
+            response.lease.CopyFrom(lease)
+        else:
+            response.status = lease_pb2.AcquireLeaseResponse.STATUS_RESOURCE_ALREADY_CLAIMED
+        response.lease_owner.client_name = self.robot.lease_owner or ''
+        return self._header(request, response)
+
+    def TakeLease(self, request, context):
+        response = lease_pb2.TakeLeaseResponse(status=lease_pb2.TakeLeaseResponse.STATUS_OK)
+        _, lease = self.robot.acquire_lease(request.header.client_name, take=True)
+        response.lease.CopyFrom(lease)
+        response.lease_owner.client_name = self.robot.lease_owner or ''
+        return self._header(request, response)
+
+    def ReturnLease(self, request, context):
+        self.robot.return_lease()
+        response = lease_pb2.ReturnLeaseResponse(status=lease_pb2.ReturnLeaseResponse.STATUS_OK)
+        return self._header(request, response)
+
+    def RetainLease(self, request, context):
+        response = lease_pb2.RetainLeaseResponse()
+        response.lease_use_result.status = lease_pb2.LeaseUseResult.STATUS_OK
+        response.lease_use_result.attempted_lease.CopyFrom(request.lease)
+        return self._header(request, response)
+
+    def ListLeases(self, request, context):
+        response = lease_pb2.ListLeasesResponse()
+        resource = response.resources.add(resource='body')
+        if self.robot.lease_owner is not None:
+            resource.lease.CopyFrom(self.robot.lease())
+            resource.lease_owner.client_name = self.robot.lease_owner
+        return self._header(request, response)
+
+
+class _EstopServicer(_Servicer, estop_service_pb2_grpc.EstopServiceServicer):
+
+    def GetEstopConfig(self, request, context):
+        response = estop_pb2.GetEstopConfigResponse(active_config=self.robot.estop_config())
+        response.request.CopyFrom(request)
+        return self._header(request, response)
+
+    def SetEstopConfig(self, request, context):
+        status = self.robot.set_estop_config(request.config, request.target_config_id)
+        response = estop_pb2.SetEstopConfigResponse(status=status,
+                                                    active_config=self.robot.estop_config())
+        response.request.CopyFrom(request)
+        return self._header(request, response)
+
+    def RegisterEstopEndpoint(self, request, context):
+        response = estop_pb2.RegisterEstopEndpointResponse(
+            status=estop_pb2.RegisterEstopEndpointResponse.STATUS_SUCCESS)
+        response.request.CopyFrom(request)
+        response.new_endpoint.CopyFrom(request.new_endpoint)
+        for endpoint in self.robot.estop_config().endpoints:
+            if endpoint.unique_id == request.target_endpoint.unique_id:
+                response.new_endpoint.unique_id = endpoint.unique_id
+        return self._header(request, response)
+
+    def DeregisterEstopEndpoint(self, request, context):
+        response = estop_pb2.DeregisterEstopEndpointResponse(
+            status=estop_pb2.DeregisterEstopEndpointResponse.STATUS_SUCCESS)
+        response.request.CopyFrom(request)
+        return self._header(request, response)
+
+    def EstopCheckIn(self, request, context):
+        self.robot.estop_check_in(request.endpoint, request.stop_level)
+        response = estop_pb2.EstopCheckInResponse(status=estop_pb2.EstopCheckInResponse.STATUS_OK,
+                                                  challenge=random.getrandbits(63))
+        response.request.CopyFrom(request)
+        return self._header(request, response)
+
+    def GetEstopSystemStatus(self, request, context):
+        response = estop_pb2.GetEstopSystemStatusResponse()
+        self.robot.estop_status(response.status)
+        return self._header(request, response)
+
+
+class _PowerServicer(_Servicer, power_service_pb2_grpc.PowerServiceServicer):
+
+    def PowerCommand(self, request, context):
+        response = power_pb2.PowerCommandResponse(status=self.robot.power(request.request),
+                                                  power_command_id=1)
+        response.lease_use_result.status = lease_pb2.LeaseUseResult.STATUS_OK
+        response.lease_use_result.attempted_lease.CopyFrom(request.lease)
+        return self._header(request, response)
+
+    def PowerCommandFeedback(self, request, context):
+        response = power_pb2.PowerCommandFeedbackResponse(status=power_pb2.STATUS_SUCCESS)
+        return self._header(request, response)
+
+
+class _RobotCommandServicer(_Servicer, robot_command_service_pb2_grpc.RobotCommandServiceServicer):
+
+    def RobotCommand(self, request, context):
+        status, command_id = self.robot.command(request)
+        response = robot_command_pb2.RobotCommandResponse(status=status,
+                                                          robot_command_id=command_id)
+        response.lease_use_result.status = lease_pb2.LeaseUseResult.STATUS_OK
+        response.lease_use_result.attempted_lease.CopyFrom(request.lease)
+        return self._header(request, response)
+
+    def RobotCommandFeedback(self, request, context):
+        response = robot_command_pb2.RobotCommandFeedbackResponse()
+        self.robot.feedback(request.robot_command_id, response)
+        return self._header(request, response)
+
+    def ClearBehaviorFault(self, request, context):
+        response = robot_command_pb2.ClearBehaviorFaultResponse(
+            status=robot_command_pb2.ClearBehaviorFaultResponse.STATUS_CLEARED)
+        return self._header(request, response)
+
+
+class _ImageServicer(_Servicer, image_service_pb2_grpc.ImageServiceServicer):
+    """Serves one pre-encoded JPEG test pattern per camera."""
+
+    def __init__(self, robot):
+        super().__init__(robot)
+        self.frames = {}
+        rows, cols = np.mgrid[0:CAMERA_ROWS, 0:CAMERA_COLS]
+        for i, name in enumerate(CAMERA_SOURCES):
+            pattern = ((rows // 32 + cols // 32 + i) % 2 * 160 + 40).astype(np.uint8)
+            encoded = io.BytesIO()
+            Image.fromarray(pattern).save(encoded, format='JPEG', quality=75)
+            self.frames[name] = encoded.getvalue()
+
+    def ListImageSources(self, request, context):
+        response = image_pb2.ListImageSourcesResponse()
+        for name in CAMERA_SOURCES:
+            source = response.image_sources.add(name=name, rows=CAMERA_ROWS, cols=CAMERA_COLS)
+            source.image_type = image_pb2.ImageSource.IMAGE_TYPE_VISUAL
+            source.pixel_formats.append(image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8)
+            source.image_formats.append(image_pb2.Image.FORMAT_JPEG)
+        return self._header(request, response)
+
+    def GetImage(self, request, context):
+        response = image_pb2.GetImageResponse()
+        for image_request in request.image_requests:
+            image_response = response.image_responses.add()
+            name = image_request.image_source_name
+            image_response.source.name = name
+            if name not in self.frames:
+                image_response.status = image_pb2.ImageResponse.STATUS_UNKNOWN_CAMERA
+                continue
+            image_response.status = image_pb2.ImageResponse.STATUS_OK
+            image_response.source.rows = CAMERA_ROWS
+            image_response.source.cols = CAMERA_COLS
+            image_response.source.image_type = image_pb2.ImageSource.IMAGE_TYPE_VISUAL
+            shot = image_response.shot
+            shot.acquisition_time.CopyFrom(self.robot.timestamp())
+            shot.frame_name_image_sensor = name
+            shot.image.rows = CAMERA_ROWS
+            shot.image.cols = CAMERA_COLS
+            shot.image.format = image_pb2.Image.FORMAT_JPEG
+            shot.image.pixel_format = image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8
+            shot.image.data = self.frames[name]
+        return self._header(request, response)
+
+
+def _generate_certs(directory):
+    """Create a throwaway CA and a *.spot.robot server certificate signed by it with openssl."""
+    openssl = shutil.which('openssl')
+    if openssl is None:
+        raise RuntimeError('FakeSpot needs the openssl command line tool to create certificates')
+
+    def run(*args):
+        subprocess.run([openssl, *args], cwd=directory, check=True, capture_output=True)
+
+    with open(os.path.join(directory, 'san.ext'), 'w') as ext:
+        ext.write('subjectAltName=DNS:*.spot.robot,DNS:spot.robot\n')
+    run('req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '2', '-subj', '/CN=Fake Spot CA',
+        '-keyout', 'ca.key', '-out', 'ca.pem')
+    run('req', '-newkey', 'rsa:2048', '-nodes', '-subj', f'/CN={AUTHORITY}', '-keyout',
+        'server.key', '-out', 'server.csr')
+    run('x509', '-req', '-in', 'server.csr', '-CA', 'ca.pem', '-CAkey', 'ca.key',
+        '-CAcreateserial', '-days', '2', '-extfile', 'san.ext', '-out', 'server.pem')
+    return os.path.join(directory, 'ca.pem')
+
+
+class FakeSpot():
+    """gRPC server hosting the fake services on localhost."""
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, failure_rate=0.0, overrides=None,
+                 clock_skew=0.0, seed=None, max_workers=32):
+        self.robot = FakeRobot(clock_skew=clock_skew)
+        self.faults = FaultInjection(latency, jitter, failure_rate, overrides, seed)
+        self._requested_port = port
+        self._max_workers = max_workers
+        self._counts = defaultdict(int)
+        self._counts_lock = threading.Lock()
+        self._server = None
+        self._cert_dir = None
+        self.services = list(SERVICES)
+        self._extra_servicers = []
+        self.port = None
+        self.cert_path = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def add_servicer(self, name, service_type, add_fn, servicer):
+        """Register an extra service before start(), e.g. a stand-in for another SDK service."""
+        self.services.append((name, service_type))
+        self._extra_servicers.append((add_fn, servicer))
+
+    def start(self):
+        self._cert_dir = tempfile.mkdtemp(prefix='fake_spot_')
+        self.cert_path = _generate_certs(self._cert_dir)
+        with open(os.path.join(self._cert_dir, 'server.key'), 'rb') as key_file:
+            key = key_file.read()
+        with open(os.path.join(self._cert_dir, 'server.pem'), 'rb') as cert_file:
+            cert = cert_file.read()
+
+        interceptor = _FaultInterceptor(self.faults, self._counts, self._counts_lock)
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=self._max_workers),
+                                   interceptors=[interceptor])
+        robot = self.robot
+        robot_id_service_pb2_grpc.add_RobotIdServiceServicer_to_server(
+            _RobotIdServicer(robot), self._server)
+        auth_service_pb2_grpc.add_AuthServiceServicer_to_server(_AuthServicer(robot), self._server)
+        directory_service_pb2_grpc.add_DirectoryServiceServicer_to_server(
+            _DirectoryServicer(robot, self.services), self._server)
+        time_sync_service_pb2_grpc.add_TimeSyncServiceServicer_to_server(
+            _TimeSyncServicer(robot), self._server)
+        robot_state_service_pb2_grpc.add_RobotStateServiceServicer_to_server(
+            _RobotStateServicer(robot), self._server)
+        lease_service_pb2_grpc.add_LeaseServiceServicer_to_server(_LeaseServicer(robot),
+                                                                  self._server)
+        estop_service_pb2_grpc.add_EstopServiceServicer_to_server(_EstopServicer(robot),
+                                                                  self._server)
+        power_service_pb2_grpc.add_PowerServiceServicer_to_server(_PowerServicer(robot),
+                                                                  self._server)
+        robot_command_service_pb2_grpc.add_RobotCommandServiceServicer_to_server(
+            _RobotCommandServicer(robot), self._server)
+        image_service_pb2_grpc.add_ImageServiceServicer_to_server(_ImageServicer(robot),
+                                                                  self._server)
+        for add_fn, servicer in self._extra_servicers:
+            add_fn(servicer, self._server)
+
+        credentials = grpc.ssl_server_credentials([(key, cert)])
+        self.port = self._server.add_secure_port(f'127.0.0.1:{self._requested_port}', credentials)
+        self._server.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop(grace=None)
+            self._server = None
+        if self._cert_dir is not None:
+            shutil.rmtree(self._cert_dir, ignore_errors=True)
+            self._cert_dir = None
+
+    def create_robot(self, sdk, name=None):
+        """Create a bosdyn Robot from `sdk` that talks to this stand-in.
+
+        An sdk keeps one Robot per address and every stand-in is at 127.0.0.1, so use a separate
+        sdk for each stand-in when running several.
+        """
+        sdk.load_robot_cert(self.cert_path)
+        robot = sdk.create_robot('127.0.0.1', name=name)
+        robot.cert = sdk.cert
+        robot.update_secure_channel_port(self.port)
+        return robot
+
+    def rpc_counts(self):
+        """Dict of RPC name -> number of calls served so far."""
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def reset_counts(self):
+        with self._counts_lock:
+            self._counts.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=0, help='Port to listen on (0 picks one)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Injected latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Latency jitter in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Fraction of RPCs that fail with UNAVAILABLE')
+    parser.add_argument('--clock-skew', type=float, default=0.0,
+                        help='Robot clock offset from local time in seconds')
+    options = parser.parse_args()
+
+    with FakeSpot(options.port, options.latency, options.jitter, options.failure_rate,
+                  clock_skew=options.clock_skew) as spot:
+        # The certificate directory goes away on exit, so keep a copy next to the caller.
+        cert_copy = os.path.abspath('fake_spot_ca.pem')
+        shutil.copy(spot.cert_path, cert_copy)
+        print(f'Fake Spot listening on 127.0.0.1:{spot.port}, CA certificate {cert_copy}')
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,284 @@
+"""Drive several robots in lockstep from one controller.
+
+    python fleet.py 192.168.80.3 192.168.80.4 --routine dance
+    python fleet.py --fake 8                                   # local stand-ins from fake_spot.py
+"""
+import argparse
+import getpass
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import bosdyn.client
+from bosdyn.client.estop import EstopClient
+from bosdyn.client.lease import LeaseClient, LeaseKeepAlive
+from bosdyn.client.robot_command import RobotCommandClient, blocking_sit, blocking_stand
+from bosdyn.client.robot_state import RobotStateClient
+
+import choreography
+import dance
+from goal_wait import wait_for_goal
+from instrumentation import STATS, instrument_robot
+from robot_clock import RobotClock
+from robot_state_cache import AsyncRobotState
+from transforms import TransformCache
+from ui import EstopNoGui
+
+ESTOP_TIMEOUT = 9.0  # seconds
+STEP_LEAD = 0.25  # seconds between fanning a step out and the common start time
+
+
+class FleetMember():
+    """One robot of the fleet with its own clients, keepalives and RPC thread."""
+
+    def __init__(self, name, robot):
+        self.name = name
+        self.robot = robot
+        self.clock = RobotClock(robot)
+        # One thread per robot: steps for a robot stay in order, and a slow robot only delays
+        # itself.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'fleet-{name}')
+        self.estop = None
+        self.lease_keepalive = None
+        self.state_task = None
+        self.command_client = None
+        # Per robot: snapshots are keyed by timestamp, which robots can share.
+        self.transforms = TransformCache()
+
+    def connect(self, username, password):
+        """Authenticate, sync, take estop and lease, power on and stand."""
+        instrument_robot(self.robot)
+        self.robot.authenticate(username, password)
+        self.clock.wait_for_sync()
+        self.estop = EstopNoGui(self.robot.ensure_client(EstopClient.default_service_name),
+                                ESTOP_TIMEOUT, f'Fleet {self.name}')
+        self.state_task = AsyncRobotState(
+            self.robot.ensure_client(RobotStateClient.default_service_name))
+        self.state_task.start()
+        self.lease_keepalive = LeaseKeepAlive(
+            self.robot.ensure_client(LeaseClient.default_service_name), must_acquire=True,
+            return_at_exit=True)
+        self.robot.power_on(timeout_sec=20)
+        self.command_client = self.robot.ensure_client(RobotCommandClient.default_service_name)
+        blocking_stand(self.command_client, timeout_sec=10)
+
+    def disconnect(self):
+        """Sit, power off and release everything connect() took. Safe after a partial connect."""
+        try:
+            if self.command_client is not None:
+                blocking_sit(self.command_client, timeout_sec=10)
+                self.robot.power_off(cut_immediately=False)
+        finally:
+            if self.lease_keepalive is not None:
+                self.lease_keepalive.shutdown()
+            if self.state_task is not None:
+                self.state_task.stop()
+            if self.estop is not None:
+                self.estop.estop_keep_alive.shutdown()
+            self.executor.shutdown(wait=False)
+
+
+class Fleet():
+    """A set of robots connected in parallel and commanded in lockstep.
+
+    Every step is fanned out to each robot's own thread with a common start time on the local
+    clock; each robot converts that to its own robot clock and sends so the command arrives on
+    time. The spread of the measured arrival times is recorded per step.
+    """
+
+    def __init__(self, members):
+        self.members = members
+        self.step_spreads = []  # seconds between earliest and latest command start, per step
+        self.connect_times = {}
+
+    @classmethod
+    def from_hostnames(cls, hostnames, sdk=None):
+        if sdk is None:
+            sdk = bosdyn.client.create_standard_sdk('Fleet')
+        return cls([FleetMember(hostname, sdk.create_robot(hostname)) for hostname in hostnames])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    def _fan_out(self, fn):
+        """Run fn(member) on every member's thread. Returns {name: (result, exception)}."""
+        futures = {member.name: member.executor.submit(fn, member) for member in self.members}
+        wait(futures.values())
+        return {name: (None, future.exception()) if future.exception() else (future.result(), None)
+                for name, future in futures.items()}
+
+    def connect(self, username, password):
+        """Connect every robot concurrently. Raises the first failure after all attempts finish."""
+
+        def connect_one(member):
+            start = time.perf_counter()
+            member.connect(username, password)
+            return time.perf_counter() - start
+
+        results = self._fan_out(connect_one)
+        failures = []
+        for name, (elapsed, err) in results.items():
+            if err is None:
+                self.connect_times[name] = elapsed
+            else:
+                failures.append((name, err))
+        if failures:
+            name, err = failures[0]
+            raise RuntimeError(f'{len(failures)} robot(s) failed to connect; {name}: {err}')
+        return self.connect_times
+
+    def disconnect(self):
+        self._fan_out(lambda member: member.disconnect())
+
+    def step(self, build, duration, desc='step'):
+        """Start one command on every robot at the same moment.
+
+        Args:
+            build: RobotCommand for all robots, or callable(member) returning each robot's command.
+            duration: Seconds until the commands expire.
+
+        Returns:
+            Dict of robot name -> (command id, timing error in seconds), or None where the send
+            failed.
+        """
+        sent = self._send_step(build, duration, desc)
+        return {name: result for name, (result, _) in sent.items()}
+
+    def _send_step(self, build, duration, desc):
+        """step() that also returns why each failed robot failed: {name: (result, exception)}."""
+        start_local = time.time() + STEP_LEAD
+
+        def send(member):
+            command = build(member) if callable(build) else build
+            return member.clock.send_command(member.command_client, command,
+                                             member.clock.robot_time(start_local), duration,
+                                             desc=f'{member.name} {desc}')
+
+        # Submitted now, each thread then waits for the start time on its own.
+        sent = self._fan_out(send)
+        landed = [result[1] for result, _ in sent.values() if result is not None]
+        if landed:
+            self.step_spreads.append(max(landed) - min(landed))
+        return sent
+
+    def dance(self, cues):
+        """Dance `cues` on every robot; each cue starts at the same moment on all of them.
+
+        The whole routine is handed to each robot's thread up front, so a robot that falls behind
+        does not hold up the others.
+        """
+        start_local = time.time() + dance.START_DELAY
+
+        def run(member):
+            scheduler = dance.BeatScheduler(member.command_client, member.clock)
+            return scheduler.run(cues, member.clock.robot_time(start_local))
+
+        results = {name: result for name, (result, _) in self._fan_out(run).items()}
+        for i in range(len(cues)):
+            landed = [
+                result[i][2] for result in results.values()
+                if result is not None and result[i][2] is not None
+            ]
+            if landed:
+                self.step_spreads.append(max(landed) - min(landed))
+        return results
+
+    def choreography(self, steps):
+        """Run a choreography from each robot's own pose, all starting together.
+
+        Returns:
+            Dict of robot name -> goal_wait.GoalResult, or the exception that kept that robot's
+            command from being built or sent (e.g. robot_state_cache.NoStateError, RpcError).
+        """
+        routine = choreography.Choreography(steps)
+        duration = routine.duration + choreography.END_TIME_MARGIN
+
+        def build(member):
+            return routine.build(member.state_task.current(), member.transforms)
+
+        sent = self._send_step(build, duration, 'choreography')
+        end_time_secs = time.time() + duration
+
+        def settle(member):
+            result, err = sent[member.name]
+            if err is not None:
+                return err
+            return wait_for_goal(member.command_client, result[0], end_time_secs,
+                                 expected_secs=routine.duration)
+
+        return {name: err if err is not None else result
+                for name, (result, err) in self._fan_out(settle).items()}
+
+    def report_lines(self):
+        lines = [f'{len(self.members)} robots']
+        if self.connect_times:
+            slowest = max(self.connect_times.values())
+            lines.append(f'connect (parallel) slowest {slowest:.2f}s, sum '
+                         f'{sum(self.connect_times.values()):.2f}s')
+        if self.step_spreads:
+            spreads = sorted(self.step_spreads)
+            p99 = spreads[min(len(spreads) - 1, int(len(spreads) * 0.99))]
+            lines.append(f'{len(spreads)} steps, start spread p50 '
+                         f'{spreads[len(spreads) // 2] * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, '
+                         f'max {spreads[-1] * 1000:.2f} ms')
+        return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('hostnames', nargs='*', help='Robots to drive')
+    parser.add_argument('--fake', type=int, default=0,
+                        help='Start this many local fake robots instead of using hostnames')
+    parser.add_argument('--routine', choices=['dance', 'square'], default='dance')
+    parser.add_argument('--wav', help='Track for the dance routine (default: a 120 BPM click)')
+    parser.add_argument('--beats', type=int, default=32, help='Beats of the dance routine')
+    options = parser.parse_args()
+
+    fakes = []
+    if options.fake:
+        # Imported here so a real fleet does not need the fake's dependencies.
+        from fake_spot import FakeSpot
+        fakes = [FakeSpot(max_workers=8) for _ in range(options.fake)]
+        members = []
+        for i, spot in enumerate(fakes):
+            spot.start()
+            # The fakes all listen on 127.0.0.1, and an sdk keeps one robot per address.
+            sdk = bosdyn.client.create_standard_sdk(f'Fleet{i}')
+            members.append(FleetMember(f'fake{i}', spot.create_robot(sdk, name=f'fake{i}')))
+        fleet = Fleet(members)
+        username, password = 'user', 'password'
+    elif options.hostnames:
+        fleet = Fleet.from_hostnames(options.hostnames)
+        username = os.environ.get('BOSDYN_CLIENT_USERNAME') or input('Username: ')
+        password = os.environ.get('BOSDYN_CLIENT_PASSWORD') or getpass.getpass()
+    else:
+        parser.error('give hostnames or --fake N')
+
+    try:
+        with fleet:
+            fleet.connect(username, password)
+            if options.routine == 'dance':
+                if options.wav:
+                    samples, rate = dance.load_wav(options.wav)
+                else:
+                    samples, rate = dance.click_track(120.0, options.beats * 0.5 + 1.0), 44100
+                track = dance.analyze(samples, rate)
+                fleet.dance(dance.choreograph(track.beats[:options.beats]))
+            else:
+                for name, result in fleet.choreography(choreography.SQUARE).items():
+                    print(f'{name}: {result}')
+            print('\n'.join(fleet.report_lines()))
+    finally:
+        for spot in fakes:
+            spot.stop()
+    print('\n'.join(STATS.report_lines()))
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
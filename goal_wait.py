@@ -0,0 +1,96 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bosdyn.api.basic_command_pb2 import RobotCommandFeedbackStatus
+from bosdyn.client import ResponseError, RpcError
+
+from profiling import FEEDBACK, PROFILE
+
+FAST_POLL_PERIOD = 0.05  # seconds, used close to the expected arrival
+SLOW_POLL_PERIOD = 0.5  # seconds, used while the robot is still far from the goal
+LATE_POLL_PERIOD = 0.2  # seconds, used once the expected arrival has passed
+ARRIVAL_WINDOW = 0.5  # seconds either side of the expected arrival polled at the fast rate
+
+# Nominal speeds used to guess when an SE2 trajectory will arrive.
+NOMINAL_SPEED = 0.5  # m/s
+NOMINAL_ROTATION = 0.8  # rad/sec
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='goal_wait')
+
+
+class GoalResult():
+    """Outcome of waiting on an SE2 trajectory command."""
+
+    def __init__(self, reached, status, rpc_count, elapsed):
+        self.reached = reached
+        self.status = status  # 'at_goal', 'failed', 'deadline' or 'rpc_error'
+        self.rpc_count = rpc_count
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return (f'GoalResult(reached={self.reached}, status={self.status!r}, '
+                f'rpc_count={self.rpc_count}, elapsed={self.elapsed:.2f})')
+
+
+def expected_duration(dx, dy, dyaw):
+    """Rough time for the robot to cover a relative move at nominal speeds."""
+    return max(math.hypot(dx, dy) / NOMINAL_SPEED, abs(dyaw) / NOMINAL_ROTATION)
+
+
+def next_poll_delay(now, expected_arrival):
+    """Adaptive poll schedule: fast near the expected arrival, slow before it, moderate after."""
+    to_arrival = expected_arrival - now
+    if to_arrival > ARRIVAL_WINDOW:
+        # Sleep until the fast window opens, but never longer than the slow period.
+        return min(SLOW_POLL_PERIOD, to_arrival - ARRIVAL_WINDOW)
+    if to_arrival > -ARRIVAL_WINDOW:
+        return FAST_POLL_PERIOD
+    return LATE_POLL_PERIOD
+
+
+@PROFILE.timed(FEEDBACK)
+def wait_for_goal(command_client, cmd_id, end_time_secs, expected_secs=0.0):
+    """Block until the SE2 trajectory command `cmd_id` settles at its goal.
+
+    Feedback is polled on the schedule from next_poll_delay() rather than back to back, and never
+    past end_time_secs (local clock), so the number of feedback RPCs per move is bounded. A failed
+    feedback RPC is retried on the next poll; the wait only ends with 'rpc_error' if the deadline
+    passes without a good response.
+
+    Returns:
+        GoalResult with the final status and the number of feedback RPCs it took.
+    """
+    start = time.time()
+    expected_arrival = start + expected_secs
+    rpc_count = 0
+    while True:
+        rpc_count += 1
+        try:
+            feedback = command_client.robot_command_feedback(cmd_id)
+        except ResponseError:
+            return GoalResult(False, 'rpc_error', rpc_count, time.time() - start)
+        except RpcError:
+            now = time.time()
+            if now >= end_time_secs:
+                return GoalResult(False, 'rpc_error', rpc_count, now - start)
+            time.sleep(min(FAST_POLL_PERIOD, end_time_secs - now))
+            continue
+
+        mobility_feedback = feedback.feedback.synchronized_feedback.mobility_command_feedback
+        if mobility_feedback.status != RobotCommandFeedbackStatus.STATUS_PROCESSING:
+            return GoalResult(False, 'failed', rpc_count, time.time() - start)
+        traj_feedback = mobility_feedback.se2_trajectory_feedback
+        if (traj_feedback.status == traj_feedback.STATUS_AT_GOAL and
+                traj_feedback.body_movement_status == traj_feedback.BODY_STATUS_SETTLED):
+            return GoalResult(True, 'at_goal', rpc_count, time.time() - start)
+
+        now = time.time()
+        if now >= end_time_secs:
+            return GoalResult(False, 'deadline', rpc_count, now - start)
+        time.sleep(min(next_poll_delay(now, expected_arrival), end_time_secs - now))
+
+
+def wait_for_goal_async(command_client, cmd_id, end_time_secs, expected_secs=0.0):
+    """Non-blocking wait_for_goal(). Returns a concurrent.futures.Future resolving to GoalResult."""
+    return _executor.submit(wait_for_goal, command_client, cmd_id, end_time_secs, expected_secs)
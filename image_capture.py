@@ -0,0 +1,328 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bosdyn.api import image_pb2
+from bosdyn.client import ResponseError, RpcError
+from bosdyn.client.image import ImageClient
+from bosdyn.util import timestamp_to_sec
+
+from scheduler import BACKGROUND
+
+CAPTURE_RATE = 5.0  # Hz, batched requests while video mode is on
+RING_SIZE = 8  # frames kept per camera
+DECODE_WORKERS = 2
+MAX_PENDING_DECODES = 2  # frames per camera waiting for a worker before new ones are dropped
+
+# Channels per raw pixel format; other formats (depth) are not decoded.
+RAW_CHANNELS = {
+    image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8: 1,
+    image_pb2.Image.PIXEL_FORMAT_RGB_U8: 3,
+    image_pb2.Image.PIXEL_FORMAT_RGBA_U8: 4,
+}
+
+
+def decode_image(image):
+    """Decode an image_pb2.Image into a uint8 array of shape (rows, cols) or (rows, cols, channels).
+
+    Returns None for formats that are not decoded.
+    """
+    if image.format == image_pb2.Image.FORMAT_JPEG:
+        # Imported on first use: PIL is slow to import and not every script decodes images.
+        from PIL import Image
+        with Image.open(io.BytesIO(image.data)) as decoded:
+            return np.asarray(decoded)
+    if image.format == image_pb2.Image.FORMAT_RAW:
+        channels = RAW_CHANNELS.get(image.pixel_format)
+        if channels is None:
+            return None
+        pixels = np.frombuffer(image.data, dtype=np.uint8)
+        if channels == 1:
+            return pixels.reshape(image.rows, image.cols)
+        return pixels.reshape(image.rows, image.cols, channels)
+    return None
+
+
+class FrameRing():
+    """The latest frames from one camera, stored in one preallocated array.
+
+    The array is allocated for the first frame's shape and reused; a full ring overwrites its
+    oldest frame, and a frame older than the newest one already stored is dropped.
+    """
+
+    def __init__(self, capacity=RING_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._frames = None
+        self._times = np.zeros(capacity)  # acquisition time, robot clock seconds
+        self._next = 0
+        self._count = 0
+        self.dropped = 0
+
+    def push(self, frame, acquisition_time):
+        """Copy `frame` into the ring. Returns False if it was dropped as stale."""
+        with self._lock:
+            if self._count and acquisition_time <= self._times[(self._next - 1) % self.capacity]:
+                self.dropped += 1
+                return False
+            if self._frames is None or self._frames.shape[1:] != frame.shape:
+                # First frame, or the camera changed resolution.
+                self._frames = np.empty((self.capacity,) + frame.shape, dtype=np.uint8)
+                self._count = 0
+            np.copyto(self._frames[self._next], frame)
+            self._times[self._next] = acquisition_time
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            return True
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def latest(self):
+        """Return (frame copy, acquisition time) of the newest frame, or (None, None)."""
+        with self._lock:
+            if not self._count:
+                return None, None
+            index = (self._next - 1) % self.capacity
+            return self._frames[index].copy(), float(self._times[index])
+
+    def frames(self):
+        """Return (frames, acquisition times) oldest first, as new arrays."""
+        with self._lock:
+            if not self._count:
+                return np.empty((0,)), np.empty((0,))
+            order = (np.arange(self._next - self._count, self._next)) % self.capacity
+            return self._frames[order], self._times[order]
+
+
+class AsyncImageCapture():
+    """Fetches several cameras in one batched request per tick and decodes them off-thread.
+
+    A capture thread sends one get_image_from_sources() for every source and never has more than
+    one request in flight; JPEG decoding happens in a small worker pool, and frames that arrive
+    while the pool is backed up are dropped rather than queued. Nothing here runs on the caller's
+    thread, so the teleop loop only pays for the key binding. Given a scheduler.Scheduler, the
+    requests are a BACKGROUND task on it instead of the capture thread.
+    """
+
+    def __init__(self, robot, sources=None, rate_hz=CAPTURE_RATE, ring_size=RING_SIZE,
+                 decode_workers=DECODE_WORKERS, save_dir='.', scheduler=None):
+        """
+        Args:
+            robot: Robot to create the image client from.
+            sources: Image source names, or None for every visual source the robot lists.
+            rate_hz: Batched request rate while video mode is on.
+            ring_size: Frames kept per camera.
+            decode_workers: Threads decoding JPEG.
+            save_dir: Directory take_image() writes to.
+            scheduler: Optional scheduler.Scheduler to run the requests on.
+        """
+        self._client = robot.ensure_client(ImageClient.default_service_name)
+        self._sources = list(sources) if sources is not None else None
+        self._period = 1.0 / rate_hz
+        self._ring_size = ring_size
+        self._decode_workers = decode_workers
+        self.save_dir = save_dir
+        self._scheduler = scheduler
+        self._task = None
+        self._lock = threading.Lock()
+        self._capture_lock = threading.Lock()  # held for each batched request and its submits
+        self._rings = {}
+        self._pending = {}  # source name -> frames submitted but not yet decoded
+        self._executor = None
+        self._video = False
+        self._snapshot = False
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._error = None
+        self.requests = 0
+        self.decoded = 0
+        self.dropped = 0
+        self.saved = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Start the capture thread. Nothing is requested until video mode or take_image()."""
+        if self._thread is not None or self._task is not None:
+            return
+        self._stop_event.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self._decode_workers,
+                                            thread_name_prefix='image_decode')
+        if self._scheduler is not None:
+            self._task = self._scheduler.add('images', self._capture_once, 1.0 / self._period,
+                                             BACKGROUND, blocking=True)
+            return
+        self._thread = threading.Thread(target=self._capture, name='AsyncImageCapture',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop capturing and wait for an in-progress request and decodes."""
+        if self._task is not None:
+            self._task.remove()
+            self._task = None
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # A scheduled request may still be running on the scheduler's worker; let it finish
+        # submitting before the pool goes away.
+        with self._capture_lock:
+            pass
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @property
+    def sources(self):
+        """Source names being captured, or None until they have been listed."""
+        return self._sources
+
+    @property
+    def video_mode(self):
+        return self._video
+
+    @property
+    def error(self):
+        """Exception from the most recent request, or None if it succeeded."""
+        with self._lock:
+            return self._error
+
+    def take_image(self):
+        """Save the next batch of frames from every source to save_dir. Returns immediately."""
+        self.start()
+        self._snapshot = True
+        self._wake.set()
+        if self._task is not None:
+            self._task.run_now()
+
+    def toggle_video_mode(self):
+        """Switch continuous capture at rate_hz on or off."""
+        self.start()
+        self._video = not self._video
+        self._wake.set()
+        if self._task is not None and self._video:
+            self._task.run_now()
+        return self._video
+
+    def latest(self, source):
+        """Return (frame, acquisition time) of the newest decoded frame from `source`."""
+        ring = self._rings.get(source)
+        if ring is None:
+            return None, None
+        return ring.latest()
+
+    def frames(self, source):
+        """Return (frames, acquisition times), oldest first, for `source`."""
+        ring = self._rings.get(source)
+        if ring is None:
+            return np.empty((0,)), np.empty((0,))
+        return ring.frames()
+
+    def _list_sources(self):
+        image_sources = self._client.list_image_sources()
+        return [
+            source.name
+            for source in image_sources
+            if source.image_type in (image_pb2.ImageSource.IMAGE_TYPE_VISUAL,
+                                     image_pb2.ImageSource.IMAGE_TYPE_UNKNOWN)
+        ]
+
+    def _capture_once(self):
+        """Send one batched request if video mode or take_image() wants one."""
+        with self._capture_lock:
+            if self._stop_event.is_set() or not (self._video or self._snapshot):
+                return
+            save = self._snapshot
+            self._snapshot = False
+            try:
+                if self._sources is None:
+                    self._sources = self._list_sources()
+                # One batched request; waiting on it here keeps at most one in flight.
+                responses = self._client.get_image_from_sources(self._sources)
+            except (ResponseError, RpcError) as err:
+                with self._lock:
+                    self._error = err
+            else:
+                with self._lock:
+                    self._error = None
+                self.requests += 1
+                for response in responses:
+                    self._submit(response, save)
+
+    def _capture(self):
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            if not (self._video or self._snapshot):
+                self._wake.wait()
+                self._wake.clear()
+                next_time = time.monotonic()
+                continue
+            self._capture_once()
+
+            if self._video:
+                # Keep a fixed rate, but never try to catch up on missed requests.
+                next_time = max(next_time + self._period, time.monotonic())
+                self._wake.wait(next_time - time.monotonic())
+                self._wake.clear()
+
+    def _submit(self, response, save):
+        name = response.source.name
+        with self._lock:
+            pending = self._pending.get(name, 0)
+            if pending >= MAX_PENDING_DECODES and not save:
+                self.dropped += 1
+                return
+            self._pending[name] = pending + 1
+        self._executor.submit(self._decode, response, save)
+
+    def _decode(self, response, save):
+        name = response.source.name
+        try:
+            acquisition_time = timestamp_to_sec(response.shot.acquisition_time)
+            if save:
+                self._save(name, acquisition_time, response.shot.image)
+            frame = decode_image(response.shot.image)
+            if frame is None:
+                return
+            with self._lock:
+                ring = self._rings.get(name)
+                if ring is None:
+                    ring = self._rings[name] = FrameRing(self._ring_size)
+            pushed = ring.push(frame, acquisition_time)
+            with self._lock:
+                if pushed:
+                    self.decoded += 1
+                else:
+                    self.dropped += 1
+        finally:
+            with self._lock:
+                self._pending[name] -= 1
+
+    def _save(self, name, acquisition_time, image):
+        path = os.path.join(self.save_dir, f'{name}_{acquisition_time:.3f}')
+        if image.format == image_pb2.Image.FORMAT_JPEG:
+            # Already encoded; write the bytes as they came.
+            with open(path + '.jpg', 'wb') as out:
+                out.write(image.data)
+        else:
+            frame = decode_image(image)
+            if frame is None:
+                return
+            from PIL import Image
+            Image.fromarray(frame).save(path + '.png')
+        with self._lock:
+            self.saved += 1
@@ -0,0 +1,155 @@
+"""Where the interface loops get their keys: the terminal, a script, or synthetic bursts.
+
+basic.py, ui.py and testing.py read keys through an input source: getch() returns the next key or
+-1 without blocking, and wait_key(timeout) waits up to `timeout` seconds (forever if None) for
+one. After a key is returned, `pressed` is the monotonic time it was pressed or due, so
+key-to-command latency includes any time the key spent waiting for the loop to read it.
+
+CursesInput reads the terminal through a status_display.StatusScreen. ScriptedInput plays
+(seconds, key) events, from a script file (load_script()) or from burst_events(), and ends with
+[esc] so the loops exit by themselves. With a ScriptedInput and no screen the loops run headless.
+
+A script has one key per line, "<seconds> <key>": a single character, a name from KEY_NAMES or a
+decimal key code. Lines starting with # are comments. A basic.py --capture file works as a script
+too; its keys are replayed at their captured times.
+"""
+import curses
+import time
+
+import capture
+
+ESC = 27
+KEY_NAMES = {'esc': ESC, 'space': ord(' '), 'tab': ord('\t'), 'enter': ord('\n'),
+             'resize': curses.KEY_RESIZE}
+
+
+class CursesInput():
+    """Keys from the terminal, read through a StatusScreen so reads never overlap a redraw."""
+
+    def __init__(self, screen):
+        self._screen = screen
+        self.pressed = None
+
+    def getch(self):
+        key = self._screen.getch()
+        if key != -1:
+            self.pressed = time.monotonic()
+        return key
+
+    def wait_key(self, timeout=None):
+        key = self._screen.wait_key(timeout)
+        if key != -1:
+            self.pressed = time.monotonic()
+        return key
+
+
+class ScriptedInput():
+    """Plays (seconds, key) events in time order, timed from the first read.
+
+    Args:
+        events: Iterable of (seconds, key code).
+        speed: Playback speed; 2.0 plays the script in half the time.
+        end_key: Key played after the last event, so the loop reading it exits; None for none.
+    """
+
+    def __init__(self, events, speed=1.0, end_key=ESC):
+        events = sorted(events)
+        if end_key is not None:
+            events.append((events[-1][0] if events else 0.0, end_key))
+        self._times = [t / speed for t, _ in events]
+        self._keys = [key for _, key in events]
+        self._start = None
+        self._next = 0
+        self.pressed = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def delivered(self):
+        """Keys returned so far."""
+        return self._next
+
+    @property
+    def exhausted(self):
+        return self._next >= len(self._keys)
+
+    def start(self, now=None):
+        """Start the script clock; otherwise it starts on the first read."""
+        self._start = time.monotonic() if now is None else now
+
+    def getch(self):
+        now = time.monotonic()
+        if self._start is None:
+            self.start(now)
+        if self.exhausted or self._start + self._times[self._next] > now:
+            return -1
+        self.pressed = self._start + self._times[self._next]
+        self._next += 1
+        return self._keys[self._next - 1]
+
+    def wait_key(self, timeout=None):
+        """As getch(), after sleeping until the next key is due.
+
+        Once the script is exhausted this sleeps `timeout` and returns -1, like a terminal nobody
+        types on. Without a timeout it would never return, so it raises EOFError instead.
+        """
+        key = self.getch()
+        if key != -1:
+            return key
+        if self.exhausted:
+            if timeout is None:
+                raise EOFError('Key script exhausted')
+            time.sleep(timeout)
+            return -1
+        delay = self._start + self._times[self._next] - time.monotonic()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            return -1
+        time.sleep(max(delay, 0.0))
+        return self.getch()
+
+
+def parse_key(token):
+    """Key code for a script token: a single character, a KEY_NAMES name or a decimal code."""
+    if len(token) == 1:
+        return ord(token)
+    if token.lower() in KEY_NAMES:
+        return KEY_NAMES[token.lower()]
+    try:
+        return int(token)
+    except ValueError:
+        raise ValueError(f'Unknown key {token!r}') from None
+
+
+def load_script(path):
+    """(seconds, key) events from a script file, or from the keyed events of a capture (.jsonl)."""
+    if path.endswith('.jsonl'):
+        return [(event['t'], event['key']) for event in capture.load(path)
+                if event.get('key') is not None]
+    events = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            try:
+                seconds, token = line.split(None, 1)
+                events.append((float(seconds), parse_key(token.strip())))
+            except ValueError as err:
+                raise ValueError(f'{path}:{number}: {err}') from None
+    return events
+
+
+def burst_events(keys='wasdqe', bursts=10, burst_size=20, key_interval=0.002, burst_gap=0.5):
+    """Synthetic bursty typing: `bursts` runs of `burst_size` keys `key_interval` s apart.
+
+    Bursts start `burst_gap` s after the previous one ends and cycle through `keys`.
+    """
+    events = []
+    start = 0.0
+    for burst in range(bursts):
+        for i in range(burst_size):
+            key = keys[(burst * burst_size + i) % len(keys)]
+            events.append((start + i * key_interval, ord(key) if isinstance(key, str) else key))
+        start += burst_size * key_interval + burst_gap
+    return events
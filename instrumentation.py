@@ -0,0 +1,251 @@
+"""Per-RPC latency, error and in-flight accounting for the bosdyn clients used by the scripts.
+
+instrument_robot() wraps the RPC methods of every client the robot hands out (sync and async), so
+callers keep using the clients as before. Latencies go into log-linear histograms in the style of
+HdrHistogram: recording is a couple of integer operations with no allocation, and percentiles are
+accurate to about 3%.
+"""
+import json
+import threading
+import time
+from collections import Counter
+
+# Client methods that are timed when present on a client.
+INSTRUMENTED_METHODS = (
+    'robot_command',
+    'robot_command_feedback',
+    'get_robot_state',
+    'acquire',
+    'take',
+    'retain_lease',
+    'return_lease',
+    'check_in',
+    'get_status',
+    'power_command',
+    'power_command_feedback',
+    'get_image_from_sources',
+    'get_time_sync_update',
+)
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS  # values below this many microseconds are recorded exactly
+HALF_SUB_BUCKETS = SUB_BUCKETS // 2
+MAX_MICROSECONDS = 1 << 27  # about 134 s; slower calls land in the last bucket
+BUCKET_COUNT = ((MAX_MICROSECONDS.bit_length() - SUB_BUCKET_BITS) + 1) * HALF_SUB_BUCKETS
+
+DEFAULT_DUMP_PATH = 'rpc_stats.json'
+
+
+def _bucket_index(microseconds):
+    if microseconds < SUB_BUCKETS:
+        return microseconds
+    shift = microseconds.bit_length() - SUB_BUCKET_BITS
+    return shift * HALF_SUB_BUCKETS + (microseconds >> shift)
+
+
+def _bucket_value(index):
+    """Midpoint, in microseconds, of the values that land in `index`."""
+    if index < SUB_BUCKETS:
+        return float(index)
+    shift = index // HALF_SUB_BUCKETS - 1
+    low = (index - shift * HALF_SUB_BUCKETS) << shift
+    return low + ((1 << shift) - 1) / 2.0
+
+
+class LatencyHistogram():
+    """Fixed-size log-linear latency histogram with microsecond resolution."""
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        microseconds = min(int(seconds * 1e6), MAX_MICROSECONDS - 1)
+        self.counts[_bucket_index(microseconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Latency in seconds at quantile q (0-100), or None if nothing was recorded."""
+        if not self.count:
+            return None
+        target = max(1, int(round(self.count * q / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(_bucket_value(index) * 1e-6, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class _RpcRecord():
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.errors = Counter()
+        self.in_flight = 0
+
+
+class RpcStats():
+    """Latency histograms, error counts by exception class and in-flight counts per RPC name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}
+
+    def _record(self, name):
+        record = self._records.get(name)
+        if record is None:
+            record = self._records[name] = _RpcRecord()
+        return record
+
+    def begin(self, name):
+        """Mark an RPC as started. Returns the start time to pass to end()."""
+        with self._lock:
+            self._record(name).in_flight += 1
+        return time.perf_counter()
+
+    def end(self, name, start, error=None):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            record = self._record(name)
+            record.in_flight -= 1
+            if error is None:
+                record.histogram.record(elapsed)
+            else:
+                record.errors[type(error).__name__] += 1
+
+    def names(self):
+        with self._lock:
+            return sorted(self._records)
+
+    def histogram(self, name):
+        with self._lock:
+            return self._record(name).histogram
+
+    def summary(self):
+        """Dict of RPC name -> count, errors, in-flight and latency percentiles in milliseconds."""
+        result = {}
+        with self._lock:
+            for name, record in sorted(self._records.items()):
+                hist = record.histogram
+
+                def ms(value):
+                    return None if value is None else round(value * 1000, 3)
+
+                result[name] = dict(count=hist.count, in_flight=record.in_flight,
+                                    errors=dict(record.errors), mean_ms=ms(hist.mean),
+                                    p50_ms=ms(hist.percentile(50)), p90_ms=ms(hist.percentile(90)),
+                                    p99_ms=ms(hist.percentile(99)), max_ms=ms(hist.max))
+        return result
+
+    def report_lines(self):
+        """One formatted line per RPC, for printing or drawing."""
+        lines = [f'{"RPC":<24}{"count":>7}{"err":>5}{"fly":>4}{"p50 ms":>9}{"p99 ms":>9}'
+                 f'{"max ms":>9}']
+        for name, entry in self.summary().items():
+
+            def fmt(value):
+                return f'{value:>9.1f}' if value is not None else f'{"-":>9}'
+
+            lines.append(f'{name:<24}{entry["count"]:>7}{sum(entry["errors"].values()):>5}'
+                         f'{entry["in_flight"]:>4}{fmt(entry["p50_ms"])}{fmt(entry["p99_ms"])}'
+                         f'{fmt(entry["max_ms"])}')
+        return lines
+
+    def draw(self, stdscr, row, col=0):
+        """Draw the stats panel into a curses window starting at `row`."""
+        for i, line in enumerate(self.report_lines()):
+            try:
+                stdscr.addstr(row + i, col, line)
+            except Exception:
+                # Panel does not fit in the window; draw what fits.
+                break
+
+    def dump(self, path=DEFAULT_DUMP_PATH):
+        with open(path, 'w') as out:
+            json.dump(self.summary(), out, indent=2)
+
+
+# Shared by every script in the process.
+STATS = RpcStats()
+
+
+def _wrap_sync(stats, name, method):
+
+    def wrapper(*args, **kwargs):
+        start = stats.begin(name)
+        try:
+            result = method(*args, **kwargs)
+        except Exception as err:
+            stats.end(name, start, err)
+            raise
+        stats.end(name, start)
+        return result
+
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+def _wrap_async(stats, name, method):
+
+    def wrapper(*args, **kwargs):
+        start = stats.begin(name)
+        try:
+            future = method(*args, **kwargs)
+        except Exception as err:
+            stats.end(name, start, err)
+            raise
+
+        def done(fut):
+            try:
+                fut.result()
+            except Exception as err:
+                stats.end(name, start, err)
+            else:
+                stats.end(name, start)
+
+        future.add_done_callback(done)
+        return future
+
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+def instrument_client(client, stats=STATS):
+    """Wrap the instrumented RPC methods of one client instance in place. Idempotent."""
+    if getattr(client, '_rpc_stats', None) is not None:
+        return client
+    for name in INSTRUMENTED_METHODS:
+        method = getattr(client, name, None)
+        if callable(method):
+            setattr(client, name, _wrap_sync(stats, name, method))
+        async_method = getattr(client, name + '_async', None)
+        if callable(async_method):
+            setattr(client, name + '_async', _wrap_async(stats, name, async_method))
+    client._rpc_stats = stats
+    return client
+
+
+def instrument_robot(robot, stats=STATS):
+    """Instrument every client the robot has created and every client it creates from now on."""
+    for client in robot.service_clients_by_name.values():
+        instrument_client(client, stats)
+    ensure_client = robot.ensure_client
+
+    def instrumented_ensure_client(*args, **kwargs):
+        return instrument_client(ensure_client(*args, **kwargs), stats)
+
+    robot.ensure_client = instrumented_ensure_client
+    return stats
@@ -0,0 +1,187 @@
+"""Lease and estop keepalives run as SAFETY tasks on a scheduler.Scheduler.
+
+Drop-in replacements for the SDK's LeaseKeepAlive and EstopKeepAlive for the parts the scripts
+use, without a thread each: every check-in is an async RPC started from the scheduler loop, at the
+highest priority, so nothing else the scheduler runs can delay it.
+"""
+import logging
+import queue
+import threading
+
+from bosdyn.api.estop_pb2 import EstopStopLevel
+from bosdyn.client import ResponseError, RpcError
+from bosdyn.client.estop import EndpointUnknownError, EstopKeepAlive
+from bosdyn.client.lease import Error as LeaseBaseError
+from bosdyn.client.lease import LeaseNotOwnedByWallet, LeaseResponseError, NoSuchLease
+
+from scheduler import SAFETY
+
+LEASE_RETAIN_PERIOD = 2.0  # seconds, as LeaseKeepAlive
+RETURN_TIMEOUT = 2.0  # seconds
+STATUS_QUEUE_SIZE = 20
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ScheduledLeaseKeepAlive():
+    """Acquires the lease if needed and retains it from `scheduler` until shutdown()."""
+
+    def __init__(self, lease_client, scheduler, resource='body',
+                 rpc_interval_seconds=LEASE_RETAIN_PERIOD, on_failure_callback=None,
+                 must_acquire=False, return_at_exit=False):
+        self._lease_client = lease_client
+        self._resource = resource
+        self._return_at_exit = return_at_exit
+        self._on_failure = on_failure_callback or (lambda err: None)
+        try:
+            self.lease_wallet.get_lease(resource)
+        except LeaseBaseError:
+            try:
+                lease_client.acquire(resource)
+            except (LeaseBaseError, ResponseError, RpcError) as err:
+                if must_acquire:
+                    raise
+                LOGGER.error('Failed to acquire the lease: %s', err)
+        self._task = scheduler.add('lease', self._retain, 1.0 / rpc_interval_seconds, SAFETY)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    @property
+    def lease_wallet(self):
+        return self._lease_client.lease_wallet
+
+    @property
+    def task(self):
+        return self._task
+
+    def is_alive(self):
+        return self._task is not None
+
+    def shutdown(self):
+        """Stop retaining and, if asked to at construction, return the lease."""
+        if self._task is None:
+            return
+        self._task.remove()
+        self._task = None
+        if self._return_at_exit:
+            try:
+                self._lease_client.return_lease(self.lease_wallet.get_lease(self._resource),
+                                                timeout=RETURN_TIMEOUT)
+            except (LeaseResponseError, NoSuchLease, LeaseNotOwnedByWallet):
+                pass  # The lease is not ours any more, which is what returning it was for.
+            except RpcError as err:
+                LOGGER.error('Failed to return the lease: %s', err)
+
+    def _retain(self):
+        try:
+            lease = self.lease_wallet.get_lease(self._resource)
+        except LeaseBaseError as err:
+            self._on_failure(err)
+            return None
+        future = self._lease_client.retain_lease_async(lease)
+        future.add_done_callback(self._retained)
+        return future
+
+    def _retained(self, future):
+        err = future.exception()
+        if err is not None:
+            LOGGER.warning('Lease retain failed: %s', err)
+            self._on_failure(err)
+
+
+class ScheduledEstopKeepAlive():
+    """Checks an EstopEndpoint in at the desired stop level from `scheduler`.
+
+    Like EstopKeepAlive, check-ins run every third of the estop timeout, allow(), stop() and
+    settle_then_cut() check in right away, and each outcome is put on status_queue as
+    (EstopKeepAlive.KeepAliveStatus, message). Unlike it, the immediate check-ins are reported
+    too, so a reader of the queue learns of a stop level change as soon as the robot has it.
+    """
+
+    KeepAliveStatus = EstopKeepAlive.KeepAliveStatus
+
+    def __init__(self, endpoint, scheduler, rpc_interval_seconds=None):
+        self._endpoint = endpoint
+        self._lock = threading.Lock()  # held from sending a check-in to its response
+        self._level = EstopStopLevel.ESTOP_LEVEL_NONE
+        self.status_queue = queue.Queue(maxsize=STATUS_QUEUE_SIZE)
+        period = rpc_interval_seconds or endpoint.estop_timeout / 3.0
+        self._task = scheduler.add('estop', self._check_in_async, 1.0 / period, SAFETY)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    @property
+    def endpoint(self):
+        return self._endpoint
+
+    @property
+    def task(self):
+        return self._task
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.remove()
+            self._task = None
+
+    # The name EstopNoGui.__exit__ calls.
+    end_periodic_check_in = shutdown
+
+    def allow(self):
+        self._set_level(EstopStopLevel.ESTOP_LEVEL_NONE)
+
+    def stop(self):
+        self._set_level(EstopStopLevel.ESTOP_LEVEL_CUT)
+
+    def settle_then_cut(self):
+        self._set_level(EstopStopLevel.ESTOP_LEVEL_SETTLE_THEN_CUT)
+
+    def _set_level(self, level):
+        """Check in at `level` now, on the caller's thread, raising as EstopKeepAlive does."""
+        # Each check-in answers the challenge of the one before, so they go one at a time.
+        with self._lock:
+            self._level = level
+            try:
+                self._endpoint.check_in_at_level(level, timeout=self._endpoint.estop_timeout)
+            except Exception as err:
+                self._update_status(self.KeepAliveStatus.ERROR, f'Check-in failed: {err}')
+                raise
+        self._update_status(self.KeepAliveStatus.OK)
+
+    def _check_in_async(self):
+        if not self._lock.acquire(blocking=False):
+            return None  # A check-in from allow() or stop() is under way; it counts for this one.
+        try:
+            future = self._endpoint.check_in_at_level_async(self._level)
+        except Exception:
+            self._lock.release()
+            raise
+        future.add_done_callback(self._checked_in)
+        return future
+
+    def _checked_in(self, future):
+        self._lock.release()
+        err = future.exception()
+        if err is None:
+            self._update_status(self.KeepAliveStatus.OK)
+        elif isinstance(err, EndpointUnknownError):
+            # As EstopKeepAlive: this endpoint can no longer stop the robot, so stop trying.
+            self._update_status(self.KeepAliveStatus.DISABLED, str(err))
+            self.shutdown()
+        else:
+            self._update_status(self.KeepAliveStatus.ERROR, f'Check-in failed: {err}')
+
+    def _update_status(self, status, message=''):
+        try:
+            if self.status_queue.full():
+                self.status_queue.get_nowait()
+            self.status_queue.put_nowait((status, message))
+        except (queue.Empty, queue.Full):
+            pass
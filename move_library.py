@@ -0,0 +1,325 @@
+"""Compiled move libraries: routines stored as serialized command templates, loaded with mmap.
+
+A routine description is JSON naming each move once and then listing the routine by name:
+
+    {"moves": {"bob":     {"stand": {"body_height": -0.1}, "duration": 0.5},
+               "twist":   {"stand": {"yaw": 0.3}},
+               "sway":    {"velocity": {"v_y": 0.3}, "duration": 0.5},
+               "forward": {"relative": {"dx": 0.5, "dyaw_deg": 0}, "stairs": false}},
+     "routine": ["bob", "twist", "sway", "forward"],
+     "repeat": 4}
+
+Move kinds are stand (body_height, yaw, roll, pitch), velocity (v_x, v_y, v_rot), sit and stop,
+which compile to serialized RobotCommands, and relative (dx, dy, dyaw_deg), which compiles to its
+SE2 offset and serialized MobilityParams because its goal depends on where the robot is. Every
+move has a duration, its slot in the routine (default DEFAULT_DURATION, or the nominal time of a
+relative move).
+
+The compiled file is telemetry.py's layout: magic, a JSON header with the move names, then a
+fixed-size record per move, the routine as move numbers and the serialized protos. load() maps it,
+and a move's proto is only parsed the first time it is sent.
+
+    python move_library.py routine.json routine.moves           # compile
+    python move_library.py routine.moves                        # summarize
+    python move_library.py routine.moves --hostname 192.168.80.3 # dance it
+"""
+import argparse
+import getpass
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+import bosdyn.client
+from bosdyn.api import robot_command_pb2
+from bosdyn.api.spot import robot_command_pb2 as spot_command_pb2
+from bosdyn.client import math_helpers
+from bosdyn.client.frame_helpers import BODY_FRAME_NAME, ODOM_FRAME_NAME
+from bosdyn.client.robot_command import (RobotCommandBuilder, RobotCommandClient, blocking_sit,
+                                         blocking_stand)
+from bosdyn.geometry import EulerZXY
+
+import dance
+from goal_wait import expected_duration
+from startup import connect
+from transforms import TRANSFORMS
+
+MAGIC = b'SPOTMOV1'
+HEADER_ALIGN = 64  # bytes; the move table starts on this boundary
+SECTION_ALIGN = 8  # bytes; the routine and the protos start on this boundary
+DEFAULT_DURATION = 0.5  # seconds per move when the description gives none
+
+COMMAND = 0  # serialized stand, sit or stop RobotCommand
+VELOCITY = 1  # serialized velocity RobotCommand; only safe sent with an end time
+RELATIVE = 2  # SE2 offset from the previous goal plus serialized MobilityParams
+KIND_NAMES = {COMMAND: 'command', VELOCITY: 'velocity', RELATIVE: 'relative'}
+
+MOVE_DTYPE = np.dtype([
+    ('kind', '<u4'),
+    ('length', '<u4'),  # bytes of serialized proto
+    ('blob', '<u8'),  # start of the serialized proto, from the start of the proto section
+    ('duration', '<f8'),  # seconds
+    ('offset', '<f8', (3,)),  # dx (m), dy (m), dyaw (rad) of relative moves
+])
+
+
+def _build(name, spec):
+    """(kind, duration, offset, serialized proto) of one move description."""
+    kinds = [kind for kind in ('stand', 'velocity', 'sit', 'stop', 'relative') if kind in spec]
+    if len(kinds) != 1:
+        raise ValueError(f'Move {name!r} needs exactly one of stand, velocity, sit, stop or '
+                         f'relative')
+    kind = kinds[0]
+    args = spec[kind] or {}
+    duration = spec.get('duration')
+    offset = (0.0, 0.0, 0.0)
+    if kind == 'stand':
+        footprint_R_body = EulerZXY(yaw=args.get('yaw', 0.0), roll=args.get('roll', 0.0),
+                                    pitch=args.get('pitch', 0.0))
+        proto = RobotCommandBuilder.synchro_stand_command(
+            body_height=args.get('body_height', 0.0), footprint_R_body=footprint_R_body)
+        code = COMMAND
+    elif kind == 'velocity':
+        proto = RobotCommandBuilder.synchro_velocity_command(
+            v_x=args.get('v_x', 0.0), v_y=args.get('v_y', 0.0), v_rot=args.get('v_rot', 0.0))
+        code = VELOCITY
+    elif kind == 'sit':
+        proto = RobotCommandBuilder.synchro_sit_command()
+        code = COMMAND
+    elif kind == 'stop':
+        proto = RobotCommandBuilder.stop_command()
+        code = COMMAND
+    else:
+        offset = (args.get('dx', 0.0), args.get('dy', 0.0),
+                  math.radians(args.get('dyaw_deg', 0.0)))
+        proto = RobotCommandBuilder.mobility_params(stair_hint=spec.get('stairs', False))
+        code = RELATIVE
+        if duration is None:
+            duration = expected_duration(*offset)
+    return code, DEFAULT_DURATION if duration is None else duration, offset, \
+        proto.SerializeToString()
+
+
+def compile_routine(description):
+    """Compile a routine description (see the module docstring) into library file bytes."""
+    moves = description['moves']
+    names = list(moves)
+    number = {name: i for i, name in enumerate(names)}
+    try:
+        steps = [number[name] for name in description['routine']]
+    except KeyError as err:
+        raise ValueError(f'Routine uses undefined move {err.args[0]!r}') from None
+    routine = np.array(steps * description.get('repeat', 1), dtype='<i4')
+
+    table = np.zeros(len(names), MOVE_DTYPE)
+    blobs = []
+    position = 0
+    for i, name in enumerate(names):
+        kind, duration, offset, blob = _build(name, moves[name])
+        table[i] = (kind, len(blob), position, duration, offset)
+        blobs.append(blob + b'\0' * (-len(blob) % SECTION_ALIGN))
+        position += len(blobs[-1])
+
+    header = json.dumps({'names': names, 'moves': len(names), 'steps': len(routine),
+                         'description': description.get('name', ''), 'created': time.time()})
+    header = header.encode()
+    size = len(MAGIC) + 4 + len(header)
+    header += b' ' * (-size % HEADER_ALIGN)
+    routine_bytes = routine.tobytes()
+    routine_bytes += b'\0' * (-len(routine_bytes) % SECTION_ALIGN)
+    return b''.join([MAGIC, struct.pack('<I', len(header)), header, table.tobytes(),
+                     routine_bytes] + blobs)
+
+
+def write(path, description):
+    """Compile `description` to `path`. Returns the size in bytes."""
+    data = compile_routine(description)
+    with open(path, 'wb') as out:
+        out.write(data)
+    return len(data)
+
+
+class MoveLibrary():
+    """A compiled library mapped into memory; see load()."""
+
+    def __init__(self, mapped, names, moves, routine, blob_offset):
+        self._map = mapped
+        self.names = names
+        self.moves = moves  # MOVE_DTYPE array, one row per move
+        self.routine = routine  # array of move numbers
+        self._number = {name: i for i, name in enumerate(names)}
+        self._blob_offset = blob_offset
+        self._decoded = {}  # move number -> RobotCommand or MobilityParams
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.routine)
+
+    @property
+    def duration(self):
+        """Seconds the routine lasts, slot by slot."""
+        return float(self.moves['duration'][self.routine].sum())
+
+    def close(self):
+        """Unmap the file. Moves already parsed can still be sent; others can no longer be read."""
+        self._map.close()
+
+    def number(self, move):
+        """Move number of a name, or the number itself."""
+        return self._number[move] if isinstance(move, str) else int(move)
+
+    def proto(self, move):
+        """The move's RobotCommand, or MobilityParams for a relative move, parsed once."""
+        number = self.number(move)
+        proto = self._decoded.get(number)
+        if proto is None:
+            entry = self.moves[number]
+            start = self._blob_offset + int(entry['blob'])
+            proto = (spot_command_pb2.MobilityParams() if entry['kind'] == RELATIVE else
+                     robot_command_pb2.RobotCommand())
+            proto.ParseFromString(self._map[start:start + int(entry['length'])])
+            self._decoded[number] = proto
+        return proto
+
+    def cues(self, out_tform_body=None, frame_name=ODOM_FRAME_NAME, start=0, slot_times=None):
+        """dance.Cue per routine step from `start`, for dance.BeatScheduler.run().
+
+        Cues are made as they are asked for, so the first is ready without touching the rest.
+
+        Args:
+            out_tform_body: math_helpers.SE2Pose of the body in `frame_name`; needed only for
+                relative moves, which chain each goal off the previous one.
+            slot_times: Optional start time of each step, e.g. beat times; by default each step
+                starts when the previous one's duration is up.
+        """
+        goal = out_tform_body
+        elapsed = 0.0
+        for step in range(start, len(self.routine)):
+            number = int(self.routine[step])
+            entry = self.moves[number]
+            duration = float(entry['duration'])
+            slot = elapsed if slot_times is None else float(slot_times[step - start])
+            if entry['kind'] == RELATIVE:
+                if goal is None:
+                    raise ValueError('Relative moves need the starting body pose')
+                dx, dy, dyaw = (float(value) for value in entry['offset'])
+                goal = goal * math_helpers.SE2Pose(x=dx, y=dy, angle=dyaw)
+                command = RobotCommandBuilder.synchro_se2_trajectory_point_command(
+                    goal_x=goal.x, goal_y=goal.y, goal_heading=goal.angle, frame_name=frame_name,
+                    params=self.proto(number))
+            else:
+                command = self.proto(number)
+            yield dance.Cue(slot, self.names[number], command, duration)
+            elapsed += duration
+
+    def summary(self):
+        counts = np.bincount(self.moves['kind'][self.routine], minlength=len(KIND_NAMES))
+        return {
+            'moves': len(self.names),
+            'steps': len(self.routine),
+            'duration_s': self.duration,
+            **{f'{KIND_NAMES[kind]}_steps': int(count) for kind, count in enumerate(counts)},
+        }
+
+
+def load(path):
+    """Map the library at `path`.
+
+    The move table and routine, a few bytes per step, are copied out so no array keeps the map
+    open; the serialized protos stay in the map until a move is first sent.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:len(MAGIC)] != MAGIC:
+        mapped.close()
+        raise ValueError(f'{path} is not a move library')
+    (length,) = struct.unpack_from('<I', mapped, len(MAGIC))
+    offset = len(MAGIC) + 4
+    header = json.loads(mapped[offset:offset + length])
+    offset += length
+    moves = np.frombuffer(mapped, MOVE_DTYPE, count=header['moves'], offset=offset).copy()
+    offset += moves.nbytes
+    routine = np.frombuffer(mapped, '<i4', count=header['steps'], offset=offset).copy()
+    offset += routine.nbytes + (-routine.nbytes % SECTION_ALIGN)
+    return MoveLibrary(mapped, header['names'], moves, routine, offset)
+
+
+def dance_description(steps, step_distance=0.3):
+    """Description of dance.py's ROUTINE repeated over `steps` moves, plus a step forward and back
+    every bar."""
+    moves = {
+        'bob': {'stand': {'body_height': dance.BOB_HEIGHT}},
+        'rise': {'stand': {'body_height': 0.0}},
+        'twist_left': {'stand': {'yaw': dance.TWIST_YAW}},
+        'twist_right': {'stand': {'yaw': -dance.TWIST_YAW}},
+        'sway_left': {'velocity': {'v_y': dance.DANCE_SPEED}},
+        'sway_right': {'velocity': {'v_y': -dance.DANCE_SPEED}},
+        'spin_left': {'velocity': {'v_rot': dance.DANCE_ROTATION}},
+        'spin_right': {'velocity': {'v_rot': -dance.DANCE_ROTATION}},
+        'step_forward': {'relative': {'dx': step_distance}},
+        'step_back': {'relative': {'dx': -step_distance}},
+    }
+    bar = dance.ROUTINE[:8] + ['step_forward'] + dance.ROUTINE[8:] + ['step_back']
+    return {'name': 'dance', 'moves': moves,
+            'routine': [bar[i % len(bar)] for i in range(steps)]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('source', help='Routine description (.json) to compile, or a library')
+    parser.add_argument('output', nargs='?', help='Library file to write when compiling')
+    parser.add_argument('--hostname', help='Robot to dance the library on')
+    options = parser.parse_args()
+
+    path = options.source
+    if options.source.endswith('.json'):
+        with open(options.source) as f:
+            description = json.load(f)
+        path = options.output or os.path.splitext(options.source)[0] + '.moves'
+        start = time.perf_counter()
+        size = write(path, description)
+        print(f'Compiled {options.source} to {path} ({size} bytes) in '
+              f'{(time.perf_counter() - start) * 1000:.1f} ms')
+
+    start = time.perf_counter()
+    library = load(path)
+    elapsed = time.perf_counter() - start
+    print(f'Loaded {path} in {elapsed * 1000:.2f} ms')
+    for key, value in library.summary().items():
+        print(f'{key:<18}{value:.2f}' if isinstance(value, float) else f'{key:<18}{value}')
+    if options.hostname is None:
+        return True
+
+    sdk = bosdyn.client.create_standard_sdk('MoveLibrary')
+    robot = sdk.create_robot(options.hostname)
+    username = os.environ.get('BOSDYN_CLIENT_USERNAME') or input('Username: ')
+    password = os.environ.get('BOSDYN_CLIENT_PASSWORD') or getpass.getpass()
+    with connect(robot, username, password) as session, library:
+        robot.power_on(timeout_sec=20)
+        command_client = session.clients[RobotCommandClient.default_service_name]
+        blocking_stand(command_client, timeout_sec=10)
+
+        state = session.state_task.current()
+        out_tform_body = TRANSFORMS.se2_a_tform_b(state, ODOM_FRAME_NAME, BODY_FRAME_NAME)
+        scheduler = dance.BeatScheduler(command_client, session.clock)
+        scheduler.run(library.cues(out_tform_body))
+        print('\n'.join(scheduler.report()[-1:]))
+
+        blocking_sit(command_client, timeout_sec=10)
+        robot.power_off(cut_immediately=False)
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,175 @@
+"""Relative moves sent back to back, each one blended into the next instead of settling.
+
+relative_move() waits for STATUS_AT_GOAL and BODY_STATUS_SETTLED before it returns, and reads a
+fresh body pose for the next goal, so a sequence stops dead at every corner and picks up whatever
+error the last move left. MoveExecutor chains each goal off the previous commanded goal and sends
+the next one as soon as the body, as seen in the shared state cache, is within a blend radius of
+the current goal or expected to reach it within a blend time. Only the last move settles.
+"""
+import math
+import time
+from collections import namedtuple
+
+from bosdyn.api.basic_command_pb2 import RobotCommandFeedbackStatus
+from bosdyn.client import ResponseError, RpcError, math_helpers
+from bosdyn.client.frame_helpers import BODY_FRAME_NAME, ODOM_FRAME_NAME
+from bosdyn.client.robot_command import RobotCommandBuilder
+
+from goal_wait import expected_duration, wait_for_goal
+from transforms import TRANSFORMS
+
+BLEND_RADIUS = 0.2  # m from the current goal at which the next one is sent
+BLEND_ANGLE = math.radians(15)  # heading error allowed within the blend radius
+BLEND_TIME = 0.3  # seconds; the next goal is also sent once arrival is expected within this
+MOVE_MARGIN = 5.0  # seconds past its expected duration before a move is given up on
+STATE_WAIT = 0.5  # seconds to wait for a fresh state snapshot before checking the deadline
+FEEDBACK_PERIOD = 0.25  # seconds between command feedback checks while waiting to blend
+
+Move = namedtuple('Move', ['dx', 'dy', 'dyaw'])
+Move.__doc__ = 'A body-relative SE2 offset (m, m, rad) from the previous goal.'
+
+MoveResult = namedtuple('MoveResult', ['index', 'status', 'elapsed'])
+MoveResult.__doc__ = ("How one move ended ('blended', 'at_goal', 'failed', 'deadline' or "
+                      "'rpc_error') and seconds from sending it to that.")
+
+
+def square(side, turn=math.radians(90)):
+    """The four sides and quarter turns of tutorial.walk_square."""
+    return [Move(side, 0, 0), Move(0, 0, turn)] * 4
+
+
+def _heading_error(angle):
+    return abs(math.atan2(math.sin(angle), math.cos(angle)))
+
+
+class MoveExecutor():
+    """Sends a queue of relative moves, blending each goal into the next.
+
+    Args:
+        command_client: RobotCommandClient to send the goals on.
+        state_task: robot_state_cache.AsyncRobotState the body pose is read from.
+        blend_radius, blend_angle: The next goal goes out once the body is this close to the
+            current one.
+        blend_time: ... or once the body is expected to reach it within this many seconds.
+    """
+
+    def __init__(self, command_client, state_task, frame_name=ODOM_FRAME_NAME, stairs=False,
+                 blend_radius=BLEND_RADIUS, blend_angle=BLEND_ANGLE, blend_time=BLEND_TIME,
+                 transforms=TRANSFORMS):
+        self._command_client = command_client
+        self._state_task = state_task
+        self._frame_name = frame_name
+        self._params = RobotCommandBuilder.mobility_params(stair_hint=stairs)
+        self._blend_radius = blend_radius
+        self._blend_angle = blend_angle
+        self._blend_time = blend_time
+        self._transforms = transforms
+        self.results = []
+        self.elapsed = 0.0
+
+    @property
+    def moves_per_minute(self):
+        return len(self.results) * 60.0 / self.elapsed if self.elapsed else 0.0
+
+    def _send(self, goal, end_time_secs):
+        command = RobotCommandBuilder.synchro_se2_trajectory_point_command(
+            goal_x=goal.x, goal_y=goal.y, goal_heading=goal.angle, frame_name=self._frame_name,
+            params=self._params)
+        return self._command_client.robot_command(command=command, end_time_secs=end_time_secs)
+
+    def _feedback_status(self, future):
+        """'failed' or 'rpc_error' if the command behind a feedback future has ended, else None."""
+        try:
+            feedback = future.result()
+        except ResponseError:
+            return 'rpc_error'
+        except RpcError:
+            return None  # Asked again at the next check.
+        mobility_feedback = feedback.feedback.synchronized_feedback.mobility_command_feedback
+        if mobility_feedback.status != RobotCommandFeedbackStatus.STATUS_PROCESSING:
+            return 'failed'
+        return None
+
+    def _wait_blend(self, goal, cmd_id, sent, end_time_secs):
+        """Wait on the state cache until the body is close enough to `goal` to move on.
+
+        Command feedback is checked every FEEDBACK_PERIOD alongside, so a goal the robot rejects
+        or gives up on ends the wait then instead of at the deadline.
+        """
+        after = sent
+        feedback = None
+        next_feedback = sent
+        while True:
+            if feedback is None and time.time() >= next_feedback:
+                feedback = self._command_client.robot_command_feedback_async(cmd_id)
+            elif feedback is not None and feedback.done():
+                status = self._feedback_status(feedback)
+                if status is not None:
+                    return status
+                feedback = None
+                next_feedback = time.time() + FEEDBACK_PERIOD
+            state, timestamp = self._state_task.wait_for_update(
+                after=after, timeout=min(STATE_WAIT, FEEDBACK_PERIOD))
+            body = None
+            if state is not None:
+                after = timestamp
+                body = self._transforms.se2_a_tform_b(state, self._frame_name, BODY_FRAME_NAME)
+            if body is not None:
+                body_tform_goal = body.inverse() * goal
+                distance = math.hypot(body_tform_goal.x, body_tform_goal.y)
+                turn = _heading_error(body_tform_goal.angle)
+                if ((distance <= self._blend_radius and turn <= self._blend_angle) or
+                        expected_duration(distance, 0, turn) <= self._blend_time):
+                    return 'blended'
+            if time.time() >= end_time_secs:
+                return 'deadline'
+
+    def run(self, moves):
+        """Send every move in turn; the sequence stops at the first move that does not end well.
+
+        Returns:
+            List of MoveResult, one per move attempted.
+        """
+        state = self._state_task.current()
+        goal = self._transforms.se2_a_tform_b(state, self._frame_name, BODY_FRAME_NAME)
+        start = time.time()
+        self.results = []
+        for i, (dx, dy, dyaw) in enumerate(moves):
+            # Chain off the commanded goal, not the measured pose, so errors do not accumulate.
+            goal = goal * math_helpers.SE2Pose(x=dx, y=dy, angle=dyaw)
+            expected = expected_duration(dx, dy, dyaw)
+            sent = time.time()
+            end_time_secs = sent + expected + MOVE_MARGIN
+            cmd_id = self._send(goal, end_time_secs)
+            if i == len(moves) - 1:
+                status = wait_for_goal(self._command_client, cmd_id, end_time_secs,
+                                       expected_secs=expected).status
+            else:
+                status = self._wait_blend(goal, cmd_id, sent, end_time_secs)
+            self.results.append(MoveResult(i, status, time.time() - sent))
+            if status not in ('blended', 'at_goal'):
+                break
+        self.elapsed = time.time() - start
+        return self.results
+
+
+def compare(moves, command_client, state_task, frame_name=ODOM_FRAME_NAME, **blend):
+    """Run `moves` pipelined and then one settled relative_move at a time.
+
+    The robot ends each run displaced by the moves, so use a closed sequence (like square()) with
+    room to move.
+
+    Returns:
+        Dict of {'pipelined': moves per minute, 'settled': moves per minute}.
+    """
+    # Imported here: tutorial imports this module, so a top-level import would be circular.
+    from tutorial import relative_move
+
+    executor = MoveExecutor(command_client, state_task, frame_name, **blend)
+    executor.run(moves)
+
+    start = time.time()
+    for dx, dy, dyaw in moves:
+        relative_move(dx, dy, dyaw, frame_name, command_client, state_task)
+    settled = len(moves) * 60.0 / (time.time() - start)
+    return {'pipelined': executor.moves_per_minute, 'settled': settled}
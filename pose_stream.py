@@ -0,0 +1,340 @@
+"""Stream body pose curves -- sway, bob and twist -- to a standing robot at a fixed rate.
+
+A PoseCurve is yaw, roll, pitch and body height sampled at the send rate, built ahead of time with
+numpy from parametric functions of time (parametric(), wave()) or from keyframes (keyframed()),
+and layered with +. PoseStreamer sends one short-deadline stand command per sample. It keeps at
+most one command in flight: a tick that finds the last one unanswered sends nothing, and a late
+tick sends the sample due now, so a slow RPC costs dropped samples instead of a queue that
+leaves the robot dancing behind the beat.
+
+    python pose_stream.py --bpm 120 --beats 16                         # build and summarize
+    python pose_stream.py --bpm 120 --beats 16 --hostname 192.168.80.3 # and dance it
+"""
+import argparse
+import getpass
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import bosdyn.client
+from bosdyn.client import ResponseError, RpcError
+from bosdyn.client.lease import Error as LeaseBaseError
+from bosdyn.client.robot_command import (RobotCommandBuilder, RobotCommandClient, blocking_sit,
+                                         blocking_stand)
+from bosdyn.geometry import EulerZXY
+
+from startup import connect
+
+SEND_RATE = 30.0  # Hz
+MIN_RATE = 20.0  # Hz; slower and the pose visibly steps
+MAX_RATE = 50.0  # Hz
+DEADLINE_TICKS = 3  # each command expires this many ticks after it is sent
+LATENCY_SAMPLES = 1000  # most recent RPC round trips kept for report()
+
+AXES = ('yaw', 'roll', 'pitch', 'height')
+LIMITS = np.array([0.5, 0.3, 0.3, 0.15])  # rad, rad, rad, m; curves are clipped to +-these
+
+SWAY_ROLL = 0.15  # rad
+BOB_DEPTH = -0.08  # m
+TWIST_YAW = 0.3  # rad
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class PoseCurve():
+    """Body poses at a fixed rate: an (N, 4) array of yaw, roll, pitch (rad) and height (m)."""
+
+    def __init__(self, samples, rate_hz=SEND_RATE):
+        if not MIN_RATE <= rate_hz <= MAX_RATE:
+            raise ValueError(f'Pose rate {rate_hz} Hz is outside {MIN_RATE}-{MAX_RATE} Hz')
+        self.samples = np.asarray(samples, dtype=float).reshape(-1, len(AXES))
+        self.rate_hz = rate_hz
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __add__(self, other):
+        """Layer two curves at the same rate; the shorter one holds zero once it runs out."""
+        if other.rate_hz != self.rate_hz:
+            raise ValueError('Only curves at the same rate can be layered')
+        total = np.zeros((max(len(self), len(other)), len(AXES)))
+        total[:len(self)] += self.samples
+        total[:len(other)] += other.samples
+        return PoseCurve(total, self.rate_hz)
+
+    @property
+    def duration(self):
+        return len(self) / self.rate_hz
+
+    @property
+    def times(self):
+        """Seconds from the start of the curve to each sample."""
+        return np.arange(len(self)) / self.rate_hz
+
+    def repeat(self, count):
+        return PoseCurve(np.tile(self.samples, (count, 1)), self.rate_hz)
+
+    def clipped(self, limits=LIMITS):
+        return PoseCurve(np.clip(self.samples, -limits, limits), self.rate_hz)
+
+    def commands(self):
+        """One synchro stand command per sample, in order."""
+        return [RobotCommandBuilder.synchro_stand_command(
+            body_height=height, footprint_R_body=EulerZXY(yaw=yaw, roll=roll, pitch=pitch))
+                for yaw, roll, pitch, height in self.samples.tolist()]
+
+
+def wave(amplitude, period, phase=0.0):
+    """amplitude * sin(2 pi t / period + phase), for parametric()."""
+    return lambda t: amplitude * np.sin(2 * np.pi * t / period + phase)
+
+
+def parametric(duration, rate_hz=SEND_RATE, **axes):
+    """Sample functions of time over `duration` seconds.
+
+    Args:
+        axes: yaw, roll, pitch and/or height, each a function of an array of times in seconds
+            returning an array of values (or a constant). Axes not given stay at zero.
+    """
+    unknown = set(axes) - set(AXES)
+    if unknown:
+        raise ValueError(f'Unknown pose axes: {", ".join(sorted(unknown))}')
+    t = np.arange(int(round(duration * rate_hz))) / rate_hz
+    columns = [np.broadcast_to(np.asarray(axes[axis](t), dtype=float), t.shape)
+               if axis in axes else np.zeros_like(t) for axis in AXES]
+    return PoseCurve(np.stack(columns, axis=1), rate_hz)
+
+
+def keyframed(times, poses, rate_hz=SEND_RATE):
+    """Ease between keyframes with a smoothstep, so the pose starts and stops each segment at rest.
+
+    Args:
+        times: Increasing keyframe times in seconds; the curve runs from 0 to the last one and
+            holds the first pose before the first keyframe.
+        poses: One (yaw, roll, pitch, height) per keyframe.
+    """
+    times = np.asarray(times, dtype=float)
+    poses = np.asarray(poses, dtype=float).reshape(-1, len(AXES))
+    if len(times) != len(poses) or len(times) < 2 or np.any(np.diff(times) <= 0):
+        raise ValueError('Need two or more keyframes with increasing times')
+    t = np.arange(int(round(times[-1] * rate_hz)) + 1) / rate_hz
+    segment = np.clip(np.searchsorted(times, t, side='right') - 1, 0, len(times) - 2)
+    u = np.clip((t - times[segment]) / (times[segment + 1] - times[segment]), 0.0, 1.0)
+    ease = u * u * (3 - 2 * u)
+    samples = poses[segment] + (poses[segment + 1] - poses[segment]) * ease[:, None]
+    return PoseCurve(samples, rate_hz)
+
+
+def groove(bpm, beats, rate_hz=SEND_RATE):
+    """Bob on every beat, sway side to side every two and twist every four, starting level."""
+    beat = 60.0 / bpm
+    curve = parametric(
+        beats * beat, rate_hz, yaw=wave(TWIST_YAW, 4 * beat), roll=wave(SWAY_ROLL, 2 * beat),
+        height=lambda t: BOB_DEPTH * (1 - np.cos(2 * np.pi * t / beat)) / 2)
+    return curve.clipped()
+
+
+class PoseStreamer():
+    """Sends a PoseCurve at its rate from a background thread, dropping samples under backpressure.
+
+    Tick k sends sample k when the previous command has been answered. Otherwise the tick passes,
+    and after a late tick the next send is the sample due at that moment, so the robot tracks the
+    curve in time and the samples it missed are counted in `dropped`.
+    """
+
+    def __init__(self, command_client, clock=None, deadline_ticks=DEADLINE_TICKS, on_error=None):
+        """
+        Args:
+            command_client: RobotCommandClient used to send stand commands.
+            clock: Optional robot_clock.RobotClock; deadlines then allow for the trip to the robot.
+            deadline_ticks: Each command expires this many sample periods after it is sent.
+            on_error: Optional callable(err) for failed sends.
+        """
+        self._command_client = command_client
+        self._clock = clock
+        self._deadline_ticks = deadline_ticks
+        self._on_error = on_error
+        self._idle = threading.Event()  # set while no command is in flight
+        self._idle.set()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._commands = []
+        self._period = 1.0 / SEND_RATE
+        self._started = None
+        self._finished = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # seconds per answered command
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.ticks = 0
+        self.late_ticks = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def send_rate(self):
+        """Commands sent per second over the stream so far."""
+        if self._started is None:
+            return 0.0
+        elapsed = (self._finished or time.monotonic()) - self._started
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def start(self, curve):
+        """Build every command for `curve`, then stream it from a daemon thread."""
+        self.stop()
+        self._commands = curve.commands()
+        self._period = 1.0 / curve.rate_hz
+        self.latencies.clear()
+        self.sent = self.dropped = self.errors = self.ticks = self.late_ticks = 0
+        self._started = self._finished = None
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='PoseStreamer', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """Block until the stream ends. Returns False on timeout."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def play(self, curve):
+        """Stream `curve` to the end and return report()."""
+        self.start(curve)
+        self.wait()
+        return self.report()
+
+    def report(self):
+        """Achieved send rate, dropped samples and RPC round trip percentiles."""
+        report = {'samples': len(self._commands), 'sent': self.sent, 'dropped': self.dropped,
+                  'errors': self.errors, 'target_hz': 1.0 / self._period,
+                  'send_hz': self.send_rate, 'late_ticks': self.late_ticks}
+        values = sorted(self.latencies)
+        if values:
+            report.update(rtt_p50_ms=_percentile(values, 0.5) * 1000,
+                          rtt_p99_ms=_percentile(values, 0.99) * 1000)
+        return report
+
+    def _deadline(self):
+        if self._clock is not None:
+            return self._clock.deadline(self._deadline_ticks * self._period)
+        return time.time() + self._deadline_ticks * self._period
+
+    def _send(self, index):
+        self._idle.clear()
+        sent = time.monotonic()
+        try:
+            future = self._command_client.robot_command_async(command=self._commands[index],
+                                                              end_time_secs=self._deadline())
+        except (ResponseError, RpcError, LeaseBaseError) as err:
+            self._failed(err)
+            return
+        self.sent += 1
+        future.add_done_callback(lambda future: self._answered(future, sent))
+
+    def _answered(self, future, sent):
+        err = future.exception()
+        if err is None:
+            self.latencies.append(time.monotonic() - sent)
+            self._idle.set()
+        else:
+            self._failed(err)
+
+    def _failed(self, err):
+        self.errors += 1
+        self._idle.set()
+        if self._on_error is not None:
+            self._on_error(err)
+
+    def _run(self):
+        count = len(self._commands)
+        self._started = next_tick = time.monotonic()
+        last = index = -1
+        while not self._stop_event.is_set():
+            # The sample due now, wherever the previous send left off.
+            index = int((time.monotonic() - self._started) / self._period)
+            if index >= count:
+                break
+            if index > last and self._idle.is_set():
+                self.dropped += index - last - 1
+                self._send(index)
+                last = index
+            self.ticks += 1
+
+            next_tick += self._period
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # Skip missed ticks instead of bursting to catch up.
+                self.late_ticks += 1
+                next_tick = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+        # Samples that came due after the last send; a stop() leaves the rest unsent, not dropped.
+        self.dropped += max(0, min(index, count) - 1 - last)
+        self._finished = time.monotonic()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--bpm', type=float, default=120.0, help='Tempo of the groove')
+    parser.add_argument('--beats', type=int, default=16, help='Beats to dance')
+    parser.add_argument('--rate', type=float, default=SEND_RATE,
+                        help=f'Pose send rate, {MIN_RATE:g}-{MAX_RATE:g} Hz')
+    parser.add_argument('--hostname', help='Robot to dance on')
+    options = parser.parse_args()
+
+    start = time.perf_counter()
+    curve = groove(options.bpm, options.beats, options.rate)
+    built = time.perf_counter() - start
+    commands = curve.commands()
+    compiled = time.perf_counter() - start - built
+    peaks = np.abs(curve.samples).max(axis=0)
+    print(f'{len(curve)} poses over {curve.duration:.1f}s at {curve.rate_hz:g} Hz '
+          f'(curve {built * 1000:.1f} ms, {len(commands)} commands {compiled * 1000:.1f} ms)')
+    print('peak ' + ', '.join(f'{axis} {peak:.3f}' for axis, peak in zip(AXES, peaks)))
+    if options.hostname is None:
+        return True
+
+    sdk = bosdyn.client.create_standard_sdk('PoseStream')
+    robot = sdk.create_robot(options.hostname)
+    username = os.environ.get('BOSDYN_CLIENT_USERNAME') or input('Username: ')
+    password = os.environ.get('BOSDYN_CLIENT_PASSWORD') or getpass.getpass()
+    with connect(robot, username, password) as session:
+        robot.power_on(timeout_sec=20)
+        command_client = session.clients[RobotCommandClient.default_service_name]
+        blocking_stand(command_client, timeout_sec=10)
+
+        with PoseStreamer(command_client, session.clock, on_error=print) as streamer:
+            report = streamer.play(curve)
+        print(f'sent {report["sent"]}/{report["samples"]} poses at {report["send_hz"]:.1f} Hz '
+              f'(target {report["target_hz"]:g} Hz), dropped {report["dropped"]}, '
+              f'errors {report["errors"]}')
+
+        blocking_stand(command_client, timeout_sec=10)
+        blocking_sit(command_client, timeout_sec=10)
+        robot.power_off(cut_immediately=False)
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
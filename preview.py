@@ -0,0 +1,253 @@
+"""Preview a routine offline: predicted path, duration and final pose, checked before it runs.
+
+Relative moves (tutorial.relative_move, move_pipeline.Move, choreography.Step) are simulated as
+min-jerk point-to-point motions, each as quick as the speed and acceleration limits allow, or
+taking its Step duration when it has one. Velocity steps (basic.py keys, a capture.CommandCapture
+log) go through smoothing.smooth(), the same acceleration limiting used to drive them. Either way
+the whole routine is one vectorized pass over a SAMPLE_PERIOD grid; check() then flags commanded
+or simulated motion beyond the limits and any pose that leaves the allowed area.
+
+    python preview.py --square 1.0 --repeat 4       # tutorial.walk_square, four times round
+    python preview.py run.jsonl --area 6            # a captured teleop session, in a 6 m square
+"""
+import argparse
+import curses
+import math
+import sys
+import time
+
+import numpy as np
+
+import capture
+from basic import BASE_ROTATION, BASE_SPEED
+from move_pipeline import square
+from smoothing import MAX_ACCELERATION, MIN_JERK_PEAK, SAMPLE_PERIOD, smooth, steps_from_capture
+
+SPEED_LIMITS = (BASE_SPEED, BASE_SPEED, BASE_ROTATION)  # m/s forward, m/s sideways, rad/s
+LIMIT_TOLERANCE = 1.02  # simulated motion may exceed a limit by this factor before it is flagged
+AREA = 4.0  # m; default side of the square allowed area, centered on the start
+MAX_ISSUES = 10  # issues reported per check() before the rest are summarized
+
+# Peak acceleration of a min-jerk move of distance d over time T is this times d / T^2.
+MIN_JERK_ACCEL = 10 / math.sqrt(3)
+
+HEADING_MARKS = '>/^\\</v\\'  # end marker by heading, counter-clockwise from +x in 45 degree steps
+
+
+def limits_from_params(params, default=SPEED_LIMITS):
+    """Speed limits of a spot.MobilityParams, falling back to `default` on axes it leaves unset."""
+    if params is None or not params.HasField('vel_limit'):
+        return default
+    max_vel = params.vel_limit.max_vel
+    return (abs(max_vel.linear.x) or default[0], abs(max_vel.linear.y) or default[1],
+            abs(max_vel.angular) or default[2])
+
+
+class Preview():
+    """A simulated routine: poses (N + 1, 3) of x, y (m) and yaw (rad) in the start frame."""
+
+    def __init__(self, poses, dt=SAMPLE_PERIOD, commanded=None):
+        self.poses = poses
+        self.dt = dt
+        self.commanded = commanded  # (M, 3) commanded body velocities, for velocity routines
+        self.issues = []
+
+    @property
+    def duration(self):
+        return (len(self.poses) - 1) * self.dt
+
+    @property
+    def final_pose(self):
+        return tuple(float(value) for value in self.poses[-1])
+
+    @property
+    def velocities(self):
+        """(N, 3) body-frame velocities between consecutive poses."""
+        delta = np.diff(self.poses, axis=0) / self.dt
+        heading = self.poses[:-1, 2] + delta[:, 2] * self.dt / 2
+        cos_h, sin_h = np.cos(heading), np.sin(heading)
+        return np.stack([cos_h * delta[:, 0] + sin_h * delta[:, 1],
+                         -sin_h * delta[:, 0] + cos_h * delta[:, 1], delta[:, 2]], axis=1)
+
+    @property
+    def ok(self):
+        return not self.issues
+
+    def summary(self):
+        x, y, yaw = self.final_pose
+        return (f'{self.duration:.1f}s, ends at x {x:+.2f} m, y {y:+.2f} m, '
+                f'yaw {math.degrees(yaw):+.0f} deg; ' +
+                ('ok' if self.ok else f'{len(self.issues)} issue(s)'))
+
+
+def simulate_moves(moves, limits=SPEED_LIMITS, max_acceleration=MAX_ACCELERATION,
+                   dt=SAMPLE_PERIOD):
+    """Simulate relative moves, each chained off the previous goal as MoveExecutor does.
+
+    Args:
+        moves: (dx, dy, dyaw) or (dx, dy, dyaw, duration) tuples, body-relative to the previous
+            goal; without a duration a move takes the least time the limits allow.
+
+    Returns:
+        Preview. The body travels straight to each goal in the previous goal's frame while it
+        turns, and comes to rest there; settling time on the robot is not included.
+    """
+    table = np.array([tuple(move) + (0.0,) * (4 - len(move)) for move in moves],
+                     dtype=float).reshape(-1, 4)
+    dx, dy, dyaw, given = table.T
+    distance = np.hypot(dx, dy)
+    # Per axis, the shortest min-jerk time within both the speed and the acceleration limit.
+    needed = np.maximum.reduce([
+        MIN_JERK_PEAK * np.abs(dx) / limits[0], MIN_JERK_PEAK * np.abs(dy) / limits[1],
+        MIN_JERK_PEAK * np.abs(dyaw) / limits[2],
+        np.sqrt(MIN_JERK_ACCEL * distance / min(max_acceleration[:2])),
+        np.sqrt(MIN_JERK_ACCEL * np.abs(dyaw) / max_acceleration[2])])
+    durations = np.where(given > 0, given, needed)
+    counts = np.maximum(np.ceil(durations / dt - 1e-9).astype(int), 1)
+    index = np.repeat(np.arange(len(table)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    tau = np.minimum(local * dt / np.maximum(durations[index], dt), 1.0)
+    s = tau**3 * (10 - 15 * tau + 6 * tau**2)
+
+    # Goal k - 1 is where move k starts.
+    start_yaw = np.concatenate([[0.0], np.cumsum(dyaw)[:-1]])
+    start_x = np.concatenate([[0.0], np.cumsum(dx * np.cos(start_yaw) -
+                                                dy * np.sin(start_yaw))[:-1]])
+    start_y = np.concatenate([[0.0], np.cumsum(dx * np.sin(start_yaw) +
+                                                dy * np.cos(start_yaw))[:-1]])
+    cos_s, sin_s = np.cos(start_yaw[index]), np.sin(start_yaw[index])
+    poses = np.stack([start_x[index] + s * (dx[index] * cos_s - dy[index] * sin_s),
+                      start_y[index] + s * (dx[index] * sin_s + dy[index] * cos_s),
+                      start_yaw[index] + s * dyaw[index]], axis=1)
+    return Preview(np.vstack([np.zeros((1, 3)), poses]), dt)
+
+
+def simulate_steps(steps, max_acceleration=MAX_ACCELERATION, dt=SAMPLE_PERIOD):
+    """Simulate smoothing.VelocityStep commands, ramped as smoothing.smooth() ramps them."""
+    path = smooth(steps, max_acceleration, dt)
+    commanded = np.asarray([step[:3] for step in steps], dtype=float).reshape(-1, 3)
+    return Preview(path.poses, dt, commanded)
+
+
+def check(preview, area=AREA, limits=SPEED_LIMITS, max_acceleration=MAX_ACCELERATION):
+    """Fill preview.issues with limit violations and exits from the allowed area.
+
+    Args:
+        area: Side of the allowed square around the start in m, or (x_min, y_min, x_max, y_max)
+            in the start frame.
+
+    Returns:
+        preview.issues, a list of strings; empty when the routine is fine.
+    """
+    bounds = (-area / 2, -area / 2, area / 2, area / 2) if np.isscalar(area) else area
+    issues = []
+    names = ('forward speed', 'sideways speed', 'turn rate')
+    if preview.commanded is not None:
+        over = np.abs(preview.commanded) > np.asarray(limits)
+        for step, axis in zip(*np.nonzero(over)):
+            issues.append(f'step {step} commands {names[axis]} {preview.commanded[step, axis]:+.2f}'
+                          f' over the {limits[axis]:.2f} limit')
+    if len(preview.poses) > 1:
+        velocities = preview.velocities
+        speed = np.abs(velocities).max(axis=0)
+        padded = np.vstack([np.zeros((1, 3)), velocities, np.zeros((1, 3))])
+        accel = np.abs(np.diff(padded, axis=0)).max(axis=0) / preview.dt
+        for axis in range(3):
+            if speed[axis] > limits[axis] * LIMIT_TOLERANCE:
+                issues.append(f'peak {names[axis]} {speed[axis]:.2f} over the '
+                              f'{limits[axis]:.2f} limit')
+            if accel[axis] > max_acceleration[axis] * LIMIT_TOLERANCE:
+                issues.append(f'peak {names[axis]} change {accel[axis]:.2f}/s over the '
+                              f'{max_acceleration[axis]:.2f}/s limit')
+    x, y = preview.poses[:, 0], preview.poses[:, 1]
+    outside = np.nonzero((x < bounds[0]) | (y < bounds[1]) | (x > bounds[2]) | (y > bounds[3]))[0]
+    if len(outside):
+        first = outside[0]
+        issues.append(f'leaves the area at {first * preview.dt:.1f}s (x {x[first]:+.2f} m, '
+                      f'y {y[first]:+.2f} m) and is outside for {len(outside) * preview.dt:.1f}s')
+    if len(issues) > MAX_ISSUES:
+        issues = issues[:MAX_ISSUES] + [f'... and {len(issues) - MAX_ISSUES} more']
+    preview.issues = issues
+    return issues
+
+
+def render(preview, width=60, height=24, area=AREA):
+    """Top-down ASCII map, +x to the right and +y up, framing the area and the whole path.
+
+    S marks the start, the end is an arrow-like mark for the final heading, and path cells outside
+    the area are drawn as x.
+    """
+    bounds = (-area / 2, -area / 2, area / 2, area / 2) if np.isscalar(area) else area
+    x, y = preview.poses[:, 0], preview.poses[:, 1]
+    low_x, low_y = min(bounds[0], x.min()), min(bounds[1], y.min())
+    high_x, high_y = max(bounds[2], x.max()), max(bounds[3], y.max())
+    # One scale for both axes; terminal cells are about twice as tall as they are wide.
+    scale = max((high_x - low_x) / (width - 1), 2 * (high_y - low_y) / (height - 1), 1e-6)
+
+    def cell(px, py):
+        column = np.clip(np.rint((np.asarray(px) - low_x) / scale).astype(int), 0, width - 1)
+        row = np.clip(height - 1 - np.rint((np.asarray(py) - low_y) / (2 * scale)).astype(int),
+                      0, height - 1)
+        return row, column
+
+    grid = np.full((height, width), ' ')
+    (top, bottom), (left, right) = cell([bounds[0], bounds[2]], [bounds[3], bounds[1]])
+    grid[[top, bottom], left:right + 1] = '-'
+    grid[top:bottom + 1, [left, right]] = '|'
+    grid[[top, top, bottom, bottom], [left, right, left, right]] = '+'
+    inside = ((x >= bounds[0]) & (y >= bounds[1]) & (x <= bounds[2]) & (y <= bounds[3]))
+    rows, columns = cell(x, y)
+    grid[rows, columns] = np.where(inside, '.', 'x')
+    grid[rows[0], columns[0]] = 'S'
+    octant = int(round(preview.poses[-1, 2] / (math.pi / 4))) % 8
+    grid[rows[-1], columns[-1]] = HEADING_MARKS[octant]
+    return [''.join(row) for row in grid]
+
+
+def show(stdscr, preview, area=AREA):
+    """Draw the map, summary and issues in curses and wait for a key."""
+    curses.curs_set(0)
+    rows, columns = stdscr.getmaxyx()
+    text = [preview.summary()] + [f'  {issue}' for issue in preview.issues]
+    lines = render(preview, max(columns - 1, 10), max(rows - len(text) - 2, 5), area)
+    for row, line in enumerate(lines + [''] + text + ['Press any key to exit.']):
+        if row < rows:
+            stdscr.addstr(row, 0, line[:columns - 1])
+    stdscr.refresh()
+    stdscr.getch()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('capture', nargs='?', help='Capture file written by basic.py --capture')
+    parser.add_argument('--square', type=float, help='Preview walk_square with this side (m)')
+    parser.add_argument('--repeat', type=int, default=1, help='Run the routine this many times')
+    parser.add_argument('--area', type=float, default=AREA,
+                        help='Side of the allowed square around the start (m)')
+    parser.add_argument('--text', action='store_true', help='Print the map instead of curses')
+    options = parser.parse_args()
+    if (options.capture is None) == (options.square is None):
+        parser.error('give either a capture file or --square')
+
+    start = time.perf_counter()
+    if options.square is not None:
+        preview = simulate_moves(square(options.square) * options.repeat)
+    else:
+        preview = simulate_steps(steps_from_capture(capture.load(options.capture)) *
+                                 options.repeat)
+    check(preview, options.area)
+    elapsed = time.perf_counter() - start
+
+    if options.text:
+        print('\n'.join(render(preview, area=options.area)))
+    else:
+        curses.wrapper(show, preview, options.area)
+    print(f'{preview.summary()} (simulated in {elapsed * 1000:.1f} ms)')
+    for issue in preview.issues:
+        print(f'  {issue}')
+    return preview.ok
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
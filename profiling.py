@@ -0,0 +1,352 @@
+"""Per-stage timers for the control and UI loops, turned on by the entry points' --profile option.
+
+Loops mark their stages -- input read, dispatch, command build, RPC send, feedback wait, redraw,
+sleep -- with PROFILE.stage() or @PROFILE.timed(), and call PROFILE.loop() once per pass. Until
+start() both cost one attribute check. Once started, each stage records its calls, total time and
+self time (total minus the stages nested in it) per thread, and each loop records the distribution
+of its period. profile_robot() and profile_builders() time the RPCs and RobotCommandBuilder calls
+without touching the code that makes them.
+
+start() can also run cProfile on the calling thread, or a sampler that records SAMPLE_RATE times a
+second which function and stage the main thread, and any other thread inside a stage, is in.
+stop() followed by write() puts the report in a file.
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from bosdyn.client.robot_command import RobotCommandBuilder
+
+from instrumentation import INSTRUMENTED_METHODS, LatencyHistogram
+
+INPUT = 'input'
+DISPATCH = 'dispatch'
+BUILD = 'build'
+RPC = 'rpc'
+FEEDBACK = 'feedback'
+REDRAW = 'redraw'
+SLEEP = 'sleep'
+
+MODES = ('timers', 'cprofile', 'sample')
+SAMPLE_RATE = 200.0  # Hz; stack samples per thread in 'sample' mode
+TOP_ENTRIES = 20  # functions listed from the sampler and cProfile
+DEFAULT_REPORT_PATH = 'profile_report.txt'
+
+
+class _NullStage():
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage():
+    """Context manager for one stage name; the timing state lives on the profiler, per thread."""
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self._profiler._enter(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._profiler._exit()
+        return False
+
+
+class _StageRecord():
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.self_total = 0.0
+
+
+class Profiler():
+    """Stage timers, loop periods and optional cProfile or sampling capture."""
+
+    def __init__(self):
+        self.enabled = False
+        self.mode = None
+        self._lock = threading.Lock()
+        self._stacks = {}  # thread ident -> [[stage, start, nested seconds], ...]
+        self._stages = {}  # stage name -> _Stage
+        self._records = {}  # (thread name, stage) -> _StageRecord
+        self._loops = {}  # loop name -> [last pass time, LatencyHistogram of periods]
+        self._started = None
+        self._elapsed = 0.0
+        self._cprofile = None
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self._samples = Counter()  # (thread name, stage, function) -> samples
+        self._sample_count = 0
+
+    def stage(self, name):
+        """Context manager timing `name` on this thread; nothing is recorded until start()."""
+        if not self.enabled:
+            return _NULL_STAGE
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(self, name)
+        return stage
+
+    def timed(self, name):
+        """Decorator: time every call of the function as stage `name`."""
+
+        def decorator(fn):
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def loop(self, name):
+        """Mark one pass of loop `name`; the time since the previous pass is its period."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            entry = self._loops.get(name)
+            if entry is None:
+                self._loops[name] = [now, LatencyHistogram()]
+                return
+            entry[1].record(now - entry[0])
+            entry[0] = now
+
+    def start(self, mode='timers'):
+        """Start timing. mode 'cprofile' also profiles the calling thread; 'sample' samples stacks."""
+        if mode not in MODES:
+            raise ValueError(f'Unknown profile mode {mode!r}; expected one of {", ".join(MODES)}')
+        if self.enabled:
+            return self
+        self.mode = mode
+        self._started = time.perf_counter()
+        self.enabled = True
+        if mode == 'cprofile':
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif mode == 'sample':
+            self._stop_sampling.clear()
+            self._sampler = threading.Thread(target=self._sample, name='ProfileSampler',
+                                             daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._elapsed += time.perf_counter() - self._started
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def _enter(self, name):
+        stack = self._stacks.get(threading.get_ident())
+        if stack is None:
+            stack = self._stacks[threading.get_ident()] = []
+        stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit(self):
+        stack = self._stacks[threading.get_ident()]
+        name, start, nested = stack.pop()
+        elapsed = time.perf_counter() - start
+        if stack:
+            stack[-1][2] += elapsed
+        key = (threading.current_thread().name, name)
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                record = self._records[key] = _StageRecord()
+            record.histogram.record(elapsed)
+            record.self_total += elapsed - nested
+
+    def _sample(self):
+        period = 1.0 / SAMPLE_RATE
+        own = threading.get_ident()
+        main = threading.main_thread().ident
+        while not self._stop_sampling.wait(period):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if ident == own:
+                    continue
+                try:
+                    stage = self._stacks[ident][-1][0]
+                except (KeyError, IndexError):
+                    # Between stages only the main loop is of interest; workers are idle.
+                    if ident != main:
+                        continue
+                    stage = '-'
+                code = frame.f_code
+                where = f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+                self._samples[(names.get(ident, ident), stage, where)] += 1
+            self._sample_count += 1
+
+    @property
+    def elapsed(self):
+        """Seconds profiled so far."""
+        if self.enabled:
+            return self._elapsed + time.perf_counter() - self._started
+        return self._elapsed
+
+    def report_lines(self):
+        """Per-thread stage time shares, loop period distributions and any capture's top entries."""
+        wall = self.elapsed
+        lines = [f'Profiled {wall:.1f}s ({self.mode or "off"}). Share is self time (nested stages '
+                 f'excluded) over wall time, per thread.', '',
+                 f'{"thread":<18}{"stage":<10}{"calls":>8}{"total s":>9}{"self s":>9}'
+                 f'{"share":>7}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}']
+        with self._lock:
+            records = sorted(self._records.items(),
+                             key=lambda item: (item[0][0], -item[1].self_total))
+            loops = sorted((name, entry[1]) for name, entry in self._loops.items())
+        for (thread, stage), record in records:
+            hist = record.histogram
+            share = record.self_total / wall * 100 if wall else 0.0
+            lines.append(f'{thread[:17]:<18}{stage:<10}{hist.count:>8}{hist.total:>9.2f}'
+                         f'{record.self_total:>9.2f}{share:>6.1f}%'
+                         f'{hist.percentile(50) * 1000:>9.2f}{hist.percentile(99) * 1000:>9.2f}'
+                         f'{hist.max * 1000:>9.2f}')
+
+        if loops:
+            lines += ['', f'{"loop":<18}{"passes":>8}{"mean Hz":>9}{"p50 ms":>9}{"p90 ms":>9}'
+                          f'{"p99 ms":>9}{"max ms":>9}']
+            for name, hist in loops:
+                if not hist.count:
+                    continue
+                lines.append(f'{name[:17]:<18}{hist.count:>8}{1.0 / hist.mean:>9.1f}'
+                             f'{hist.percentile(50) * 1000:>9.2f}'
+                             f'{hist.percentile(90) * 1000:>9.2f}'
+                             f'{hist.percentile(99) * 1000:>9.2f}{hist.max * 1000:>9.2f}')
+
+        if self._sample_count:
+            lines += ['', f'Stack samples at {SAMPLE_RATE:g} Hz ({self._sample_count} rounds), '
+                          f'top {TOP_ENTRIES}:',
+                      f'{"share":>7}  {"thread":<18}{"stage":<10}function']
+            for (thread, stage, where), count in self._samples.most_common(TOP_ENTRIES):
+                lines.append(f'{count / self._sample_count * 100:>6.1f}%  {str(thread)[:17]:<18}'
+                             f'{stage:<10}{where}')
+
+        if self._cprofile is not None:
+            out = io.StringIO()
+            pstats.Stats(self._cprofile, stream=out).sort_stats('cumulative').print_stats(
+                TOP_ENTRIES)
+            lines += ['', 'cProfile of the main loop thread, by cumulative time:']
+            lines += [line for line in out.getvalue().splitlines() if line.strip()]
+        return lines
+
+    def write(self, path=DEFAULT_REPORT_PATH):
+        """Write report_lines() to `path`, and the cProfile data, if any, next to it."""
+        with open(path, 'w') as out:
+            out.write('\n'.join(self.report_lines()) + '\n')
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(os.path.splitext(path)[0] + '.pstats')
+        return path
+
+
+# Shared by every module in the process.
+PROFILE = Profiler()
+
+
+def _wrap(profiler, stage, method):
+
+    def wrapper(*args, **kwargs):
+        if not profiler.enabled:
+            return method(*args, **kwargs)
+        with profiler.stage(stage):
+            return method(*args, **kwargs)
+
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+def profile_client(client, profiler=PROFILE):
+    """Time the client's RPC calls as 'rpc', or 'feedback' for feedback RPCs. Idempotent.
+
+    Async calls are timed only until the request is on its way, which is what the caller waits
+    for.
+    """
+    if getattr(client, '_profiler', None) is not None:
+        return client
+    for name in INSTRUMENTED_METHODS:
+        stage = FEEDBACK if name.endswith('_feedback') else RPC
+        for attribute in (name, name + '_async'):
+            method = getattr(client, attribute, None)
+            if callable(method):
+                setattr(client, attribute, _wrap(profiler, stage, method))
+    client._profiler = profiler
+    return client
+
+
+def profile_robot(robot, profiler=PROFILE):
+    """Profile every client the robot has created and every client it creates from now on."""
+    for client in robot.service_clients_by_name.values():
+        profile_client(client, profiler)
+    ensure_client = robot.ensure_client
+
+    def profiled_ensure_client(*args, **kwargs):
+        return profile_client(ensure_client(*args, **kwargs), profiler)
+
+    robot.ensure_client = profiled_ensure_client
+    return profiler
+
+
+def profile_builders(profiler=PROFILE):
+    """Time RobotCommandBuilder's command constructors as 'build'. Idempotent."""
+    if getattr(RobotCommandBuilder, '_profiler', None) is not None:
+        return
+    for name, method in list(vars(RobotCommandBuilder).items()):
+        if isinstance(method, staticmethod) and name.endswith(('_command', '_params')):
+            setattr(RobotCommandBuilder, name,
+                    staticmethod(_wrap(profiler, BUILD, method.__func__)))
+    RobotCommandBuilder._profiler = profiler
+
+
+def add_profile_argument(parser):
+    """Add --profile [MODE] and --profile-report PATH to an argparse parser."""
+    parser.add_argument('--profile', nargs='?', const='timers', choices=MODES,
+                        help='Time each loop stage and write a report on exit; optionally with '
+                        'a cProfile or stack-sampling capture')
+    parser.add_argument('--profile-report', default=DEFAULT_REPORT_PATH, metavar='PATH',
+                        help='File the --profile report is written to')
+
+
+def start_profiling(mode, robot=None, profiler=PROFILE):
+    """Start `profiler` in --profile `mode`, timing `robot`'s RPCs and the builder; None is off."""
+    if not mode:
+        return None
+    profile_builders(profiler)
+    if robot is not None:
+        profile_robot(robot, profiler)
+    return profiler.start(mode)
+
+
+def finish_profiling(path=DEFAULT_REPORT_PATH, profiler=PROFILE):
+    """Stop `profiler` and write its report to `path`, if it was started."""
+    if profiler.mode is None:
+        return None
+    profiler.stop()
+    profiler.write(path)
+    print(f'Profile report written to {path}')
+    return path
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from bosdyn.client.time_sync import NotEstablishedError, TimedOutError
+from bosdyn.util import duration_to_seconds, timestamp_to_sec
+
+LOGGER = logging.getLogger(__name__)
+
+SYNC_TIMEOUT = 3.0  # seconds
+SYNC_POLL_PERIOD = 0.005  # seconds between checks while waiting for sync
+SPIN_WINDOW = 0.002  # seconds before a scheduled send spent busy-waiting instead of sleeping
+TIMING_LOG_SIZE = 1000  # scheduled-command timing errors kept for timing_report()
+TRANSIT_WINDOW = 16  # recent measured transit times the send lead is the median of
+
+
+class _ReceiveTimes():
+    """Response processor that keeps, per thread, the robot clock time the last request arrived."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def mutate(self, response):
+        header = getattr(response, 'header', None)
+        if header is not None and header.HasField('request_received_timestamp'):
+            self._local.received = timestamp_to_sec(header.request_received_timestamp)
+
+    def take(self):
+        """Return and clear this thread's last receive time, or None."""
+        received = getattr(self._local, 'received', None)
+        self._local.received = None
+        return received
+
+
+class RobotClock():
+    """Local <-> robot clock conversion from the robot's time sync.
+
+    The SDK converts a command's end_time_secs to robot time with the same clock skew, so a local
+    deadline from here lands at the intended robot time. On top of that, deadline() credits the
+    one-way trip (half the measured round trip) so a short command is not shortened by the
+    network, and schedule() sends a command so it arrives at a given robot-clock time.
+
+    Scheduled sends lead the target by the median transit time actually observed (send start to
+    the robot's request_received_timestamp), which also covers client-side request processing;
+    until a transit has been measured the lead is the one-way estimate.
+    """
+
+    def __init__(self, robot):
+        self._robot = robot
+        self._received = _ReceiveTimes()
+        self._transits = deque(maxlen=TRANSIT_WINDOW)
+        self.timing_errors = deque(maxlen=TIMING_LOG_SIZE)  # seconds, arrival minus target
+
+    def wait_for_sync(self, timeout_sec=SYNC_TIMEOUT):
+        """Block until time sync is established. robot.time_sync starts the sync thread if needed.
+
+        Raises:
+            TimedOutError: Sync was not established within timeout_sec.
+        """
+        time_sync = self._robot.time_sync
+        deadline = time.monotonic() + timeout_sec
+        # TimeSyncThread.wait_for_sync() checks every 100 ms; sync usually lands well inside that.
+        while not time_sync.has_established_time_sync:
+            if time_sync.stopped:
+                # Raises the sync thread's error.
+                time_sync.wait_for_sync(timeout_sec=0)
+            if time.monotonic() > deadline:
+                raise TimedOutError
+            time.sleep(SYNC_POLL_PERIOD)
+        return self
+
+    @property
+    def has_sync(self):
+        return self._robot.time_sync.has_established_time_sync
+
+    @property
+    def offset(self):
+        """Robot clock minus local clock, in seconds.
+
+        Raises:
+            NotEstablishedError: Time sync has not been established yet.
+        """
+        return duration_to_seconds(self._robot.time_sync.endpoint.clock_skew)
+
+    @property
+    def round_trip(self):
+        """Latest measured time sync round trip in seconds, or 0.0 before the first estimate."""
+        round_trip = self._robot.time_sync.endpoint.round_trip_time
+        return duration_to_seconds(round_trip) if round_trip is not None else 0.0
+
+    @property
+    def one_way(self):
+        """Estimated time for a request to reach the robot."""
+        return self.round_trip / 2
+
+    def robot_time(self, local_secs=None):
+        """Robot clock seconds at local time `local_secs` (default now)."""
+        if local_secs is None:
+            local_secs = time.time()
+        return local_secs + self.offset
+
+    def local_time(self, robot_secs):
+        """Local time.time() seconds at robot clock time `robot_secs`."""
+        return robot_secs - self.offset
+
+    def deadline(self, duration):
+        """Local end_time_secs for a command that should run `duration` s once it reaches the robot.
+
+        Before the first round trip measurement the trip is taken as zero.
+        """
+        return time.time() + self.one_way + duration
+
+    @property
+    def send_lead(self):
+        """How long before the target robot time a scheduled send starts."""
+        if not self._transits:
+            return self.one_way
+        return sorted(self._transits)[len(self._transits) // 2]
+
+    def attach(self, client):
+        """Record robot receive times on `client`'s responses so schedule() can measure arrival."""
+        if self._received not in client.response_processors:
+            client.response_processors.append(self._received)
+        return client
+
+    def sleep_until(self, local_secs):
+        """Sleep until local time `local_secs`, busy-waiting the last SPIN_WINDOW for precision."""
+        # Work on perf_counter so a wall clock adjustment mid-wait cannot stretch the sleep.
+        target = time.perf_counter() + (local_secs - time.time())
+        remaining = target - time.perf_counter()
+        if remaining > SPIN_WINDOW:
+            time.sleep(remaining - SPIN_WINDOW)
+        while time.perf_counter() < target:
+            # Yield the GIL on every turn so other threads' sends are not held up by the spin.
+            time.sleep(0)
+
+    def schedule(self, robot_secs, send, desc='command'):
+        """Call `send()` so its request reaches the robot at robot clock time `robot_secs`.
+
+        The achieved error (robot arrival minus target) is logged and kept in timing_errors. Arrival
+        is the robot's receive timestamp when `send` calls a client passed to attach(), and an
+        estimate from the send time otherwise.
+
+        Returns:
+            (result of send(), timing error in seconds)
+        """
+        lead = self.send_lead
+        self.sleep_until(self.local_time(robot_secs) - lead)
+        self._received.take()
+        sent = self.robot_time()
+        result = send()
+        arrival = self._received.take()
+        if arrival is None:
+            arrival = sent + lead
+        else:
+            self._transits.append(arrival - sent)
+        error = arrival - robot_secs
+        self.timing_errors.append(error)
+        LOGGER.info('%s: timing error %+.2f ms (lead %.2f ms)', desc, error * 1000, lead * 1000)
+        return result, error
+
+    def send_command(self, command_client, command, robot_secs, duration, desc='command'):
+        """Send `command` to start at robot time `robot_secs` and end `duration` s later.
+
+        Returns:
+            (command id, timing error in seconds)
+        """
+        self.attach(command_client)
+        end_time_secs = self.local_time(robot_secs + duration)
+        return self.schedule(
+            robot_secs,
+            lambda: command_client.robot_command(command=command, end_time_secs=end_time_secs),
+            desc)
+
+    def describe(self):
+        """One-line offset and round trip summary for display."""
+        try:
+            offset = self.offset
+        except NotEstablishedError:
+            return 'Clock: not synced'
+        return f'Clock offset {offset * 1000:+.1f} ms, round trip {self.round_trip * 1000:.1f} ms'
+
+    def timing_report(self):
+        """Summarize the timing errors of scheduled commands so far."""
+        if not self.timing_errors:
+            return 'No scheduled commands'
+        errors = sorted(abs(error) for error in self.timing_errors)
+        p99 = errors[min(len(errors) - 1, int(len(errors) * 0.99))]
+        return (f'{len(errors)} scheduled commands, |error| p50 {errors[len(errors) // 2] * 1000:.2f}'
+                f' ms, p99 {p99 * 1000:.2f} ms, max {errors[-1] * 1000:.2f} ms')
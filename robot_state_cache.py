@@ -0,0 +1,197 @@
+import threading
+import time
+
+from bosdyn.client import ResponseError, RpcError
+
+from scheduler import CONTROL
+
+STATE_POLL_RATE = 12.5  # Hz; 80 ms leaves room for the round trip in 100 ms estop detection
+FIRST_STATE_TIMEOUT = 2.0  # seconds current() waits for the first snapshot
+
+
+class NoStateError(RuntimeError):
+    """No robot state has arrived in time to act on."""
+
+
+class AsyncRobotState():
+    """Polls the robot state service in a background thread and caches the latest snapshot.
+
+    Every consumer (estop display, battery readout, relative moves) reads the cached RobotState
+    instead of making its own get_robot_state() call, so the robot only sees one poll stream.
+    Given a scheduler.Scheduler, polling is a CONTROL task on it instead of a thread of its own.
+    """
+
+    def __init__(self, client, rate_hz=STATE_POLL_RATE, scheduler=None):
+        self._client = client
+        self._scheduler = scheduler
+        self._task = None
+        self._period = 1.0 / rate_hz
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+        self._proto = None
+        self._timestamp = None
+        self._error = None
+        self._count = 0
+        self._listeners = []
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Begin polling in a daemon thread, or on the scheduler."""
+        if self._scheduler is not None:
+            if self._task is None:
+                self._task = self._scheduler.add('robot_state', self._poll_async, self.rate_hz,
+                                                 CONTROL)
+            return
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._poll, name='AsyncRobotState', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling and wait for the thread to exit."""
+        if self._task is not None:
+            self._task.remove()
+            self._task = None
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def proto(self):
+        """Latest RobotState, or None if no poll has succeeded yet. Never blocks on the network."""
+        with self._lock:
+            return self._proto
+
+    @property
+    def error(self):
+        """Exception raised by the most recent poll, or None if it succeeded."""
+        with self._lock:
+            return self._error
+
+    @property
+    def rate_hz(self):
+        return 1.0 / self._period
+
+    @property
+    def poll_count(self):
+        """Number of successful polls since start()."""
+        with self._lock:
+            return self._count
+
+    def latest(self):
+        """Return (RobotState, timestamp) of the latest snapshot without blocking.
+
+        The timestamp is the local time.time() at which the response arrived.
+        """
+        with self._lock:
+            return self._proto, self._timestamp
+
+    def current(self, timeout=FIRST_STATE_TIMEOUT):
+        """Latest RobotState, waiting up to `timeout` seconds if none has arrived yet.
+
+        Raises:
+            NoStateError: if no snapshot arrives in time.
+        """
+        state, _ = self.latest()
+        if state is None:
+            state, _ = self.wait_for_update(timeout=timeout)
+        if state is None:
+            error = self.error
+            raise NoStateError(f'No robot state after {timeout:g}s' +
+                               (f': {error}' if error is not None else ''))
+        return state
+
+    def age(self):
+        """Seconds since the latest snapshot arrived, or None if there is none yet."""
+        with self._lock:
+            if self._timestamp is None:
+                return None
+            return time.time() - self._timestamp
+
+    def add_listener(self, listener):
+        """Call listener(state, timestamp) on the polling thread after every successful poll.
+
+        Listeners run before the next poll, so they should only do quick, non-blocking work. Under
+        a scheduler they run on the thread the response arrived on.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def poll_now(self):
+        """Poll as soon as possible instead of at the next scheduled time.
+
+        The schedule restarts from that poll, so the average rate only rises if this is called
+        more often than the polling period.
+        """
+        if self._task is not None:
+            self._task.run_now()
+        self._wake.set()
+
+    def wait_for_update(self, after=None, timeout=None):
+        """Block until a snapshot newer than `after` (a timestamp) is cached.
+
+        Returns (RobotState, timestamp), or (None, None) on timeout.
+        """
+        with self._updated:
+            ready = self._updated.wait_for(
+                lambda: self._timestamp is not None and (after is None or self._timestamp > after),
+                timeout=timeout)
+            if not ready:
+                return None, None
+            return self._proto, self._timestamp
+
+    def _store(self, state):
+        with self._updated:
+            self._proto = state
+            self._timestamp = timestamp = time.time()
+            self._error = None
+            self._count += 1
+            self._updated.notify_all()
+        for listener in self._listeners:
+            listener(state, timestamp)
+
+    def _poll_async(self):
+        future = self._client.get_robot_state_async()
+        future.add_done_callback(self._on_response)
+        return future
+
+    def _on_response(self, future):
+        try:
+            state = future.result()
+        except (ResponseError, RpcError) as err:
+            with self._lock:
+                self._error = err
+        else:
+            self._store(state)
+
+    def _poll(self):
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                state = self._client.get_robot_state()
+            except (ResponseError, RpcError) as err:
+                with self._lock:
+                    self._error = err
+            else:
+                self._store(state)
+
+            # Keep a fixed rate, but never try to catch up on missed polls.
+            next_time = max(next_time + self._period, time.monotonic())
+            if self._wake.wait(next_time - time.monotonic()):
+                self._wake.clear()
+                next_time = time.monotonic()
@@ -0,0 +1,290 @@
+"""One event loop for all periodic background work, with per-task rates, priorities and jitter.
+
+Scheduler runs an asyncio loop on a single thread. Each task has a rate and a priority; when
+several are due together they start in priority order, so an estop check-in is never queued
+behind a camera request. A task either returns quickly from the loop thread -- typically by
+starting an async RPC and returning its future, which keeps the task in flight until the response
+arrives -- or is marked blocking and runs on a worker thread reserved for its priority, where slow
+camera or disk work cannot hold up anything more important. A task still in flight when it next
+falls due skips that run rather than queueing a second one, and missed runs are not caught up.
+
+Every run records its jitter, how late it started against its schedule, and report_lines() shows
+the spread per task.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+SAFETY = 0  # estop check-in, lease retain
+CONTROL = 1  # robot state polling
+DISPLAY = 2  # status screen refresh
+BACKGROUND = 3  # cameras, telemetry
+PRIORITY_NAMES = {SAFETY: 'safety', CONTROL: 'control', DISPLAY: 'display',
+                  BACKGROUND: 'background'}
+
+JITTER_SAMPLES = 1000  # most recent start delays kept per task
+STOP_TIMEOUT = 2.0  # seconds stop() waits for the loop thread
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class ScheduledTask():
+    """A periodic task; created by Scheduler.add(). Counters are read from any thread."""
+
+    def __init__(self, scheduler, name, fn, rate_hz, priority, blocking):
+        self._scheduler = scheduler
+        self.name = name
+        self.fn = fn
+        self.period = 1.0 / rate_hz
+        self.priority = priority
+        self.blocking = blocking
+        self.jitter = deque(maxlen=JITTER_SAMPLES)  # seconds each run started after it was due
+        self.runs = 0
+        self.skipped = 0  # runs dropped because the previous one was still in flight
+        self.errors = 0
+        self.in_flight = False
+        self.kick_pending = False  # run_now() came while in flight; run again once it finishes
+        self.generation = 0  # bumped to invalidate the queued run when rescheduled
+
+    @property
+    def rate_hz(self):
+        return 1.0 / self.period
+
+    def run_now(self):
+        """Run as soon as possible instead of at the next scheduled time. Safe from any thread.
+
+        While a run is in flight, the next one starts as soon as it finishes.
+        """
+        self._scheduler.run_now(self)
+
+    def remove(self):
+        self._scheduler.remove(self)
+
+    def stats(self):
+        values = sorted(self.jitter)
+        stats = {'name': self.name, 'priority': PRIORITY_NAMES.get(self.priority, self.priority),
+                 'rate_hz': self.rate_hz, 'runs': self.runs, 'skipped': self.skipped,
+                 'errors': self.errors}
+        if values:
+            stats.update(jitter_p50_ms=_percentile(values, 0.5) * 1000,
+                         jitter_p99_ms=_percentile(values, 0.99) * 1000,
+                         jitter_max_ms=values[-1] * 1000)
+        return stats
+
+
+class Scheduler():
+    """Owns the event loop thread and every periodic task registered with add()."""
+
+    def __init__(self, name='scheduler'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._heap = []  # (due, priority, sequence, generation, task)
+        self._sequence = itertools.count()
+        self._tasks = []
+        self._wake = None
+        self._executors = {}  # priority -> single-thread executor for blocking tasks
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def tasks(self):
+        with self._lock:
+            return list(self._tasks)
+
+    def start(self):
+        """Start the loop thread. Tasks added before this start with it."""
+        if self._thread is not None:
+            return self
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        """Stop running tasks and wait for blocking ones in progress to finish."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._ready.clear()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=STOP_TIMEOUT)
+        self._thread = None
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        self._executors.clear()
+
+    def add(self, name, fn, rate_hz, priority=BACKGROUND, blocking=False):
+        """Call fn() `rate_hz` times a second, the first time as soon as possible.
+
+        Args:
+            fn: Called on the loop thread; must not block. It may return a future (an async RPC's
+                or a concurrent.futures.Future) or a coroutine, and the task then counts as in
+                flight until that completes.
+            priority: SAFETY, CONTROL, DISPLAY or BACKGROUND; lower runs first when tasks are due
+                together.
+            blocking: Run fn() on this priority's worker thread instead of the loop thread.
+
+        Returns:
+            ScheduledTask, for run_now(), remove() and its statistics.
+        """
+        task = ScheduledTask(self, name, fn, rate_hz, priority, blocking)
+        with self._lock:
+            self._tasks.append(task)
+        self._call(self._push, task, None)
+        return task
+
+    def remove(self, task):
+        """Stop scheduling `task`. A run already in progress finishes."""
+        with self._lock:
+            if task in self._tasks:
+                self._tasks.remove(task)
+        task.generation += 1
+
+    def run_now(self, task):
+        self._call(self._kick, task)
+
+    def report_lines(self):
+        """Per-task rate, run counts and jitter percentiles."""
+        lines = [f'{"task":<16}{"priority":<11}{"Hz":>6}{"runs":>7}{"skip":>6}{"err":>5}'
+                 f'{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}']
+        for task in self.tasks:
+            stats = task.stats()
+            line = (f'{stats["name"]:<16}{stats["priority"]:<11}{stats["rate_hz"]:>6.1f}'
+                    f'{stats["runs"]:>7}{stats["skipped"]:>6}{stats["errors"]:>5}')
+            if 'jitter_p50_ms' in stats:
+                line += (f'{stats["jitter_p50_ms"]:>9.2f}{stats["jitter_p99_ms"]:>9.2f}'
+                         f'{stats["jitter_max_ms"]:>9.2f}')
+            lines.append(line)
+        return lines
+
+    def _call(self, fn, *args):
+        """Run fn(*args) on the loop thread. Before start(), _run() queues every task itself."""
+        with self._lock:
+            if self._thread is None or not self._ready.is_set():
+                return
+            if threading.current_thread() is not self._thread:
+                self._loop.call_soon_threadsafe(fn, *args)
+                return
+        fn(*args)
+
+    def _push(self, task, due):
+        if task not in self._tasks:
+            return
+        task.generation += 1
+        if due is None:
+            due = self._loop.time()
+        heapq.heappush(self._heap,
+                       (due, task.priority, next(self._sequence), task.generation, task))
+        self._wake.set()
+
+    def _kick(self, task):
+        if task.in_flight:
+            task.kick_pending = True
+            # Read again: _finish() may have cleared in_flight on its thread before the flag was up.
+            if task.in_flight:
+                return
+            task.kick_pending = False
+        self._push(task, None)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wake = asyncio.Event()
+        with self._lock:
+            for task in self._tasks:
+                self._push(task, None)
+            self._ready.set()
+        dispatcher = self._loop.create_task(self._dispatch())
+        try:
+            self._loop.run_forever()
+        finally:
+            dispatcher.cancel()
+            self._loop.run_until_complete(asyncio.gather(dispatcher, return_exceptions=True))
+            self._loop.close()
+
+    async def _dispatch(self):
+        while True:
+            now = self._loop.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if entry[3] == entry[4].generation:
+                    due.append(entry)
+            # Everything due starts now, most important first.
+            for when, _, _, _, task in sorted(due, key=lambda entry: entry[1:3]):
+                self._start(task, when)
+                # Keep a fixed rate, but never try to catch up on missed runs.
+                heapq.heappush(self._heap, (max(when + task.period, now), task.priority,
+                                            next(self._sequence), task.generation, task))
+            self._wake.clear()
+            timeout = self._heap[0][0] - self._loop.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, task, due):
+        if task.in_flight:
+            task.skipped += 1
+            return
+        task.in_flight = True
+        if task.blocking:
+            executor = self._executors.get(task.priority)
+            if executor is None:
+                executor = self._executors[task.priority] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f'{self.name}-'
+                    f'{PRIORITY_NAMES.get(task.priority, task.priority)}')
+            future = executor.submit(self._call_blocking, task, due)
+            future.add_done_callback(lambda future: self._finish(task, future))
+            return
+        task.jitter.append(self._loop.time() - due)
+        task.runs += 1
+        try:
+            result = task.fn()
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception('%s failed', task.name)
+            task.errors += 1
+            task.in_flight = False
+            return
+        if asyncio.iscoroutine(result):
+            result = self._loop.create_task(result)
+        if hasattr(result, 'add_done_callback'):
+            result.add_done_callback(lambda future: self._finish(task, future))
+        else:
+            task.in_flight = False
+
+    def _call_blocking(self, task, due):
+        # The loop clock is time.monotonic(), so the delay can be measured on the worker.
+        task.jitter.append(time.monotonic() - due)
+        task.runs += 1
+        return task.fn()
+
+    def _finish(self, task, future):
+        try:
+            failed = future.exception() is not None
+        except (Exception, asyncio.CancelledError):  # pylint: disable=broad-except
+            failed = True
+        if failed:
+            task.errors += 1
+        task.in_flight = False
+        if task.kick_pending:
+            task.kick_pending = False
+            self._call(self._push, task, None)
@@ -0,0 +1,234 @@
+"""Compile stepwise teleop velocities into smooth, acceleration-limited trajectories.
+
+Keyboard teleop produces constant velocity steps, one RPC each, with an instant change of speed
+between them. smooth() samples the steps on a fine grid, blends every change with a min-jerk
+transition just long enough to respect MAX_ACCELERATION, integrates the result into a path and
+thins it to a trajectory point every POINT_SPACING seconds. SmoothPath.send() hands that path to
+the robot as a few multi-point trajectory commands on one shared reference time.
+
+    python smoothing.py run.jsonl                          # compare a capture before and after
+    python smoothing.py run.jsonl --hostname 192.168.80.3  # and drive the smoothed path
+"""
+import argparse
+import getpass
+import math
+import os
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import bosdyn.client
+from bosdyn.api import trajectory_pb2
+from bosdyn.client import math_helpers
+from bosdyn.client.frame_helpers import BODY_FRAME_NAME, ODOM_FRAME_NAME
+from bosdyn.client.robot_command import RobotCommandClient, blocking_sit, blocking_stand
+
+import capture
+from choreography import trajectory_command
+from goal_wait import wait_for_goal
+from startup import connect
+from transforms import TRANSFORMS
+
+SAMPLE_PERIOD = 0.02  # seconds between samples of the velocity profile
+MAX_ACCELERATION = (0.5, 0.5, 1.0)  # m/s^2 forward, m/s^2 sideways, rad/s^2
+POINT_SPACING = 0.4  # seconds between trajectory points
+POINTS_PER_COMMAND = 50
+COMMAND_LEAD = 0.5  # seconds each command is sent before its first new point is due
+END_MARGIN = 1.0  # seconds a command outlives its last point
+
+# Peak acceleration of a min-jerk change of velocity dv over time T is this times dv / T.
+MIN_JERK_PEAK = 1.875
+
+VelocityStep = namedtuple('VelocityStep', ['v_x', 'v_y', 'v_rot', 'duration'])
+VelocityStep.__doc__ = 'Constant body velocity (m/s, m/s, rad/s) held for `duration` seconds.'
+
+
+def steps_from_capture(events):
+    """Velocity steps of a capture.CommandCapture log, with stops where nothing was commanded.
+
+    Each velocity command lasts until it expires or the next one replaces it. Other events (stand,
+    power, ...) are not part of the path and are left out.
+    """
+    moves = [event for event in events if event['kind'] == capture.VELOCITY]
+    steps = []
+    for event, following in zip(moves, moves[1:] + [None]):
+        held = event['duration']
+        if following is not None:
+            gap = following['t'] - event['t']
+            held = min(held, gap)
+        steps.append(VelocityStep(*event['velocity'], held))
+        if following is not None and gap > held:
+            steps.append(VelocityStep(0.0, 0.0, 0.0, gap - held))
+    return steps
+
+
+def sample_steps(steps, dt=SAMPLE_PERIOD):
+    """(N, 3) array of the step velocities sampled every `dt` seconds."""
+    if not steps:
+        return np.zeros((0, 3))
+    table = np.asarray(steps, dtype=float)
+    counts = np.maximum(np.rint(table[:, 3] / dt).astype(int), 0)
+    return np.repeat(table[:, :3], counts, axis=0)
+
+
+def min_jerk_kernel(width, dt=SAMPLE_PERIOD):
+    """Convolution kernel turning a step into a min-jerk ramp lasting `width` seconds."""
+    samples = max(int(math.ceil(width / dt)), 1)
+    tau = (np.arange(samples) + 0.5) / samples
+    kernel = 30 * tau**2 * (1 - tau)**2  # derivative of 10t^3 - 15t^4 + 6t^5
+    return kernel / kernel.sum()
+
+
+def integrate(velocities, dt=SAMPLE_PERIOD):
+    """SE2 poses (N + 1, 3) reached by body-frame velocities from the origin, one per sample."""
+    v_x, v_y, v_rot = velocities.T
+    yaw = np.concatenate([[0.0], np.cumsum(v_rot * dt)])
+    # Rotate each step by its midpoint heading.
+    heading = yaw[:-1] + v_rot * dt / 2
+    cos_h, sin_h = np.cos(heading), np.sin(heading)
+    x = np.concatenate([[0.0], np.cumsum((v_x * cos_h - v_y * sin_h) * dt)])
+    y = np.concatenate([[0.0], np.cumsum((v_x * sin_h + v_y * cos_h) * dt)])
+    return np.stack([x, y, yaw], axis=1)
+
+
+def peak_acceleration(velocities, dt=SAMPLE_PERIOD):
+    """Largest per-axis change of velocity per second, including starting and stopping."""
+    padded = np.vstack([np.zeros((1, 3)), velocities, np.zeros((1, 3))])
+    return np.abs(np.diff(padded, axis=0)).max(axis=0) / dt
+
+
+class SmoothPath():
+    """A smoothed velocity profile and the path it drives, starting at rest at the origin."""
+
+    def __init__(self, velocities, dt=SAMPLE_PERIOD):
+        self.velocities = velocities
+        self.dt = dt
+        self.poses = integrate(velocities, dt)  # body start frame; pose i at time i * dt
+
+    @property
+    def duration(self):
+        return len(self.velocities) * self.dt
+
+    def points(self, spacing=POINT_SPACING):
+        """(times, poses) thinned to one point every `spacing` seconds, always keeping the end."""
+        stride = max(int(round(spacing / self.dt)), 1)
+        index = np.arange(stride, len(self.poses), stride)
+        if not len(index) or index[-1] != len(self.poses) - 1:
+            index = np.append(index, len(self.poses) - 1)
+        return index * self.dt, self.poses[index]
+
+    def commands(self, out_tform_start, reference_time, frame_name=ODOM_FRAME_NAME,
+                 spacing=POINT_SPACING, points_per_command=POINTS_PER_COMMAND):
+        """Split the path into trajectory commands sharing reference time `reference_time`.
+
+        Args:
+            out_tform_start: math_helpers.SE2Pose of the body in `frame_name` at the start.
+            reference_time: Local time.time() seconds; RobotCommandClient.robot_command converts
+                it to robot time when each command is sent.
+
+        Returns:
+            List of (RobotCommand, time of its first new point, time of its last point), times in
+            seconds after reference_time. Each command repeats the points of the previous one
+            that are still ahead when it is sent, so the hand-over does not cut a corner.
+        """
+        times, poses = self.points(spacing)
+        cos_s, sin_s = math.cos(out_tform_start.angle), math.sin(out_tform_start.angle)
+        x = out_tform_start.x + cos_s * poses[:, 0] - sin_s * poses[:, 1]
+        y = out_tform_start.y + sin_s * poses[:, 0] + cos_s * poses[:, 1]
+        yaw = out_tform_start.angle + poses[:, 2]
+        waypoints = [(math_helpers.SE2Pose(x=float(x[i]), y=float(y[i]), angle=float(yaw[i])),
+                      float(times[i])) for i in range(len(times))]
+        overlap = int(math.ceil(COMMAND_LEAD / spacing)) + 1
+        new_points = max(points_per_command - overlap, 1)
+        commands = []
+        for first in range(0, len(waypoints), new_points):
+            chunk = waypoints[max(first - overlap, 0):first + new_points]
+            command = trajectory_command(chunk, frame_name, reference_time=reference_time,
+                                         interpolation=trajectory_pb2.POS_INTERP_CUBIC)
+            commands.append((command, waypoints[first][1], chunk[-1][1]))
+        return commands
+
+    def send(self, command_client, clock, state, frame_name=ODOM_FRAME_NAME):
+        """Drive the path from the body pose in RobotState `state`, each command sent just in time.
+
+        Returns:
+            List of (command id, timing error in seconds) per command.
+        """
+        out_tform_start = TRANSFORMS.se2_a_tform_b(state, frame_name, BODY_FRAME_NAME)
+        # The commands carry local time, as the client converts it; sends are timed on the robot.
+        reference_time = time.time() + COMMAND_LEAD
+        robot_reference = clock.robot_time(reference_time)
+        sent = []
+        for command, first, last in self.commands(out_tform_start, reference_time, frame_name):
+            target = robot_reference + first - COMMAND_LEAD
+            sent.append(clock.send_command(command_client, command, target,
+                                           last - first + COMMAND_LEAD + END_MARGIN,
+                                           desc=f'trajectory to {last:.1f}s'))
+        return sent
+
+
+def smooth(steps, max_acceleration=MAX_ACCELERATION, dt=SAMPLE_PERIOD):
+    """Smooth velocity steps into an acceleration-limited SmoothPath.
+
+    Every change of velocity becomes a min-jerk blend whose length is set by the largest change on
+    any axis, so all axes blend together and the path keeps its shape. Blending conserves the
+    distance each axis travels and adds one blend length at the end for the final stop.
+    """
+    velocities = sample_steps(steps, dt)
+    if not len(velocities):
+        return SmoothPath(velocities, dt)
+    jumps = peak_acceleration(velocities, dt) * dt
+    width = max(MIN_JERK_PEAK * jump / limit for jump, limit in zip(jumps, max_acceleration))
+    kernel = min_jerk_kernel(width, dt)
+    smoothed = np.stack([np.convolve(velocities[:, axis], kernel) for axis in range(3)], axis=1)
+    return SmoothPath(smoothed, dt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('capture', help='Capture file written by basic.py --capture')
+    parser.add_argument('--hostname', help='Robot to drive the smoothed path on')
+    options = parser.parse_args()
+
+    steps = steps_from_capture(capture.load(options.capture))
+    start = time.perf_counter()
+    path = smooth(steps)
+    elapsed = time.perf_counter() - start
+    raw = sample_steps(steps)
+    commands = path.commands(math_helpers.SE2Pose(0, 0, 0), 0.0)
+    print(f'{len(steps)} steps over {len(raw) * SAMPLE_PERIOD:.1f}s -> {len(commands)} trajectory '
+          f'commands over {path.duration:.1f}s (smoothing {elapsed * 1000:.1f} ms)')
+    print(f'peak acceleration {np.round(peak_acceleration(raw), 2)} -> '
+          f'{np.round(peak_acceleration(path.velocities), 2)}')
+    end_error = path.poses[-1] - integrate(raw)[-1]
+    print(f'end pose difference x {end_error[0]:+.3f} m, y {end_error[1]:+.3f} m, '
+          f'yaw {end_error[2]:+.3f} rad')
+    if options.hostname is None:
+        return True
+
+    sdk = bosdyn.client.create_standard_sdk('Smoothing')
+    robot = sdk.create_robot(options.hostname)
+    username = os.environ.get('BOSDYN_CLIENT_USERNAME') or input('Username: ')
+    password = os.environ.get('BOSDYN_CLIENT_PASSWORD') or getpass.getpass()
+    with connect(robot, username, password) as session:
+        robot.power_on(timeout_sec=20)
+        command_client = session.clients[RobotCommandClient.default_service_name]
+        blocking_stand(command_client, timeout_sec=10)
+
+        state = session.state_task.current()
+        sent = path.send(command_client, session.clock, state)
+        end_time_secs = time.time() + path.duration + END_MARGIN
+        result = wait_for_goal(command_client, sent[-1][0], end_time_secs,
+                               expected_secs=path.duration)
+        print(f'{len(sent)} commands sent: {result}')
+
+        blocking_sit(command_client, timeout_sec=10)
+        robot.power_off(cut_immediately=False)
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,234 @@
+"""Concurrent robot startup with a per-phase timing breakdown.
+
+connect() runs the steps every script needs before its first command -- authenticate, time sync,
+directory, client creation, lease, first robot state -- as a dependency graph, so independent
+RPCs overlap instead of running one after another. The lease keepalive and state poll it starts
+run on the session's scheduler.Scheduler, which the caller can hand further periodic work.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import grpc
+
+from bosdyn.client.directory import DirectoryClient
+from bosdyn.client.estop import EstopClient
+from bosdyn.client.lease import LeaseClient
+from bosdyn.client.power import PowerClient
+from bosdyn.client.robot_command import RobotCommandClient
+from bosdyn.client.robot_id import RobotIdClient
+from bosdyn.client.robot_state import RobotStateClient
+from bosdyn.client.auth import AuthClient
+from bosdyn.client.time_sync import TimeSyncClient
+
+from instrumentation import instrument_robot
+from keepalive import ScheduledLeaseKeepAlive
+from robot_clock import RobotClock
+from robot_state_cache import AsyncRobotState, STATE_POLL_RATE
+from scheduler import Scheduler
+
+STARTUP_WORKERS = 8
+CHANNEL_TIMEOUT = 5.0  # seconds to wait for the API channel to connect
+FIRST_STATE_TIMEOUT = 5.0  # seconds
+
+# Clients every script uses; created in one go once the directory is known.
+DEFAULT_SERVICES = (
+    RobotCommandClient.default_service_name,
+    RobotStateClient.default_service_name,
+    LeaseClient.default_service_name,
+    EstopClient.default_service_name,
+    PowerClient.default_service_name,
+    TimeSyncClient.default_service_name,
+)
+
+
+class Startup():
+    """Runs named phases on a thread pool, each as soon as the phases it depends on are done."""
+
+    def __init__(self, max_workers=STARTUP_WORKERS):
+        self._max_workers = max_workers
+        self._phases = {}  # name -> (fn, dependencies)
+        self.results = {}
+        self.timings = {}  # name -> (start, end), seconds since run() began
+        self.total = None
+
+    def add(self, name, fn, after=()):
+        """Add phase `name` running fn() once every phase in `after` has finished."""
+        self._phases[name] = (fn, tuple(after))
+        return self
+
+    def run(self):
+        """Run every phase. Raises the first phase error once nothing else is running.
+
+        Returns:
+            Dict of phase name -> return value of its function.
+        """
+        start = time.perf_counter()
+
+        def timed(name, fn):
+            begin = time.perf_counter() - start
+            try:
+                return fn()
+            finally:
+                self.timings[name] = (begin, time.perf_counter() - start)
+
+        pending = dict(self._phases)
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self._max_workers,
+                                thread_name_prefix='startup') as executor:
+            while pending or running:
+                if error is None:
+                    for name, (fn, after) in list(pending.items()):
+                        if all(dep in self.results for dep in after):
+                            running[executor.submit(timed, name, fn)] = name
+                            del pending[name]
+                if not running:
+                    if error is None:
+                        raise ValueError(f'Startup phases cannot run: {sorted(pending)}')
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                    else:
+                        self.results[name] = future.result()
+        self.total = time.perf_counter() - start
+        if error is not None:
+            raise error
+        return self.results
+
+    def report_lines(self):
+        """Phase start/end offsets in milliseconds, in start order, then the total."""
+        lines = [f'{"phase":<14}{"start ms":>10}{"end ms":>10}{"took ms":>10}']
+        for name, (begin, end) in sorted(self.timings.items(), key=lambda item: item[1]):
+            lines.append(f'{name:<14}{begin * 1000:>10.1f}{end * 1000:>10.1f}'
+                         f'{(end - begin) * 1000:>10.1f}')
+        if self.total is not None:
+            lines.append(f'{"total":<14}{"":>10}{self.total * 1000:>10.1f}')
+        return lines
+
+
+class Session():
+    """Everything connect() sets up. Close it to stop the state poll and return the lease.
+
+    Closing also stops the scheduler if connect() created it.
+    """
+
+    def __init__(self, robot, scheduler=None):
+        self.robot = robot
+        self._owns_scheduler = scheduler is None
+        self.scheduler = Scheduler() if scheduler is None else scheduler
+        self.clock = RobotClock(robot)
+        self.clients = {}
+        self.robot_id = None
+        self.state_task = None
+        self.lease_keepalive = None
+        self.startup = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.lease_keepalive is not None:
+            self.lease_keepalive.shutdown()
+            self.lease_keepalive = None
+        if self.state_task is not None:
+            self.state_task.stop()
+            self.state_task = None
+        if self._owns_scheduler:
+            self.scheduler.stop()
+
+
+def _is_estopped(state):
+    return any(estop.state == estop.STATE_ESTOPPED for estop in state.estop_states)
+
+
+def connect(robot, username, password, services=DEFAULT_SERVICES, acquire_lease=True,
+            state_rate=STATE_POLL_RATE, max_workers=STARTUP_WORKERS, scheduler=None):
+    """Bring `robot` from created to ready-to-command.
+
+    Authentication, the robot id lookup and the TLS handshake of the API channel overlap; once
+    the directory has been read in one call, the clients are created without further lookups and
+    the lease, time sync and first robot state are fetched together while any channel not yet
+    connected is warmed. max_workers=1 runs the same phases one after another.
+
+    The state poll and lease keepalive run on `scheduler`, or on a new one the session owns.
+
+    Returns:
+        Session with the clients (by service name), clock, scheduler, state task and lease
+        keepalive.
+
+    Raises:
+        RuntimeError: The robot is estopped.
+    """
+    session = Session(robot, scheduler)
+    session.scheduler.start()
+    startup = session.startup = Startup(max_workers)
+
+    def prepare():
+        instrument_robot(robot)
+        # Created up front so concurrent phases never race to create the same channel.
+        for name in (AuthClient.default_service_name, RobotIdClient.default_service_name,
+                     DirectoryClient.default_service_name):
+            robot.ensure_client(name)
+
+    warmed = set()
+
+    def warm(channel):
+        if id(channel) not in warmed:
+            grpc.channel_ready_future(channel).result(timeout=CHANNEL_TIMEOUT)
+            warmed.add(id(channel))
+
+    def warm_channel():
+        warm(robot.ensure_client(DirectoryClient.default_service_name).channel)
+
+    def warm_clients():
+        # Services on another authority get their own channel; connect those before first use.
+        for client in session.clients.values():
+            warm(client.channel)
+
+    def robot_id():
+        session.robot_id = robot.get_id()
+
+    def clients():
+        for name in services:
+            session.clients[name] = robot.ensure_client(name)
+
+    def lease():
+        session.lease_keepalive = ScheduledLeaseKeepAlive(
+            session.clients[LeaseClient.default_service_name], session.scheduler,
+            must_acquire=True, return_at_exit=True)
+
+    def first_state():
+        session.state_task = AsyncRobotState(
+            session.clients[RobotStateClient.default_service_name], rate_hz=state_rate,
+            scheduler=session.scheduler)
+        session.state_task.start()
+        state, _ = session.state_task.wait_for_update(timeout=FIRST_STATE_TIMEOUT)
+        # Never skip the estop check: without a state in time, ask the robot directly.
+        estopped = robot.is_estopped() if state is None else _is_estopped(state)
+        if estopped:
+            raise RuntimeError('Robot is estopped. Please use an external E-Stop client, such as '
+                               'the estop SDK example, to configure E-Stop.')
+
+    startup.add('prepare', prepare)
+    startup.add('channel', warm_channel, after=['prepare'])
+    startup.add('robot_id', robot_id, after=['prepare'])
+    startup.add('authenticate', lambda: robot.authenticate(username, password), after=['prepare'])
+    startup.add('directory', robot.sync_with_directory, after=['authenticate', 'channel'])
+    startup.add('clients', clients, after=['directory'])
+    startup.add('time_sync', session.clock.wait_for_sync, after=['clients'])
+    startup.add('state', first_state, after=['clients'])
+    startup.add('channels', warm_clients, after=['clients'])
+    if acquire_lease:
+        startup.add('lease', lease, after=['clients'])
+    try:
+        startup.run()
+    except Exception:
+        session.close()
+        raise
+    return session
@@ -0,0 +1,269 @@
+"""Change-driven estop, motor power and lease monitoring.
+
+StateWatcher reads the snapshots the shared AsyncRobotState poll already fetches, plus the local
+lease wallet and estop keepalive status queue, so it adds no RPCs of its own. Each state is kept
+as an enum and listeners are called on the transition itself, from the thread that saw it.
+"""
+import enum
+import logging
+import queue
+import threading
+import time
+
+from bosdyn.api import robot_state_pb2
+from bosdyn.client.estop import EstopKeepAlive
+from bosdyn.client.lease import Error as LeaseBaseError
+from bosdyn.client.lease import LeaseState
+
+from scheduler import SAFETY
+
+ESTOP = 'estop'
+POWER = 'power'
+LEASE = 'lease'
+ESTOP_KEEPALIVE = 'estop_keepalive'
+
+KEEPALIVE_WAIT = 0.1  # seconds the keepalive reader blocks before checking for stop()
+KEEPALIVE_DRAIN_RATE = 50.0  # Hz the status queue is emptied at when on a scheduler
+ESTOP_DETECTION_TARGET = 0.1  # seconds from any estop to its transition
+CHANGE_LOG_SIZE = 100  # transitions kept in StateWatcher.changes
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Estop(enum.IntEnum):
+    """Combined state of every estop on the robot; ESTOPPED if any one is."""
+    UNKNOWN = robot_state_pb2.EStopState.STATE_UNKNOWN
+    ESTOPPED = robot_state_pb2.EStopState.STATE_ESTOPPED
+    NOT_ESTOPPED = robot_state_pb2.EStopState.STATE_NOT_ESTOPPED
+
+
+class MotorPower(enum.IntEnum):
+    UNKNOWN = robot_state_pb2.PowerState.STATE_UNKNOWN
+    OFF = robot_state_pb2.PowerState.STATE_OFF
+    ON = robot_state_pb2.PowerState.STATE_ON
+    POWERING_ON = robot_state_pb2.PowerState.STATE_POWERING_ON
+    POWERING_OFF = robot_state_pb2.PowerState.STATE_POWERING_OFF
+    ERROR = robot_state_pb2.PowerState.STATE_ERROR
+
+
+def estop_from_state(state):
+    """Estop value of a RobotState."""
+    if not state.estop_states:
+        return Estop.UNKNOWN
+    states = {estop.state for estop in state.estop_states}
+    if Estop.ESTOPPED in states:
+        return Estop.ESTOPPED
+    if Estop.UNKNOWN in states:
+        return Estop.UNKNOWN
+    return Estop.NOT_ESTOPPED
+
+
+def power_from_state(state):
+    """MotorPower value of a RobotState."""
+    try:
+        return MotorPower(state.power_state.motor_power_state)
+    except ValueError:
+        return MotorPower.UNKNOWN
+
+
+class StateWatcher():
+    """Keeps estop, motor power and lease state and reports every transition.
+
+    Estop and power come from each robot state snapshot as it arrives, so a change is seen at
+    worst one gap between snapshots after it happens: a poll period plus a round trip, about
+    80 ms plus the round trip at the default 12.5 Hz. That covers an estop from another client or
+    the hardware button. start() refuses a poll too slow for `detection_target`, and every gap
+    longer than it is counted in late_snapshots and logged, so a slow link does not quietly stretch
+    the guarantee. Every result the estop keepalive reports also triggers an early poll, so an
+    estop set or cleared through that keepalive, or a failed check-in, is seen one state round trip
+    after the check-in returns. The lease is read from the local wallet, which every command
+    response updates.
+    """
+
+    def __init__(self, state_task, lease_wallet=None, estop_keepalive=None, resource='body',
+                 detection_target=ESTOP_DETECTION_TARGET, scheduler=None):
+        """
+        Args:
+            state_task: Started or unstarted robot_state_cache.AsyncRobotState to read.
+            lease_wallet: Optional LeaseWallet to track `resource` in, e.g.
+                lease_client.lease_wallet.
+            estop_keepalive: Optional EstopKeepAlive whose status queue this watcher takes over.
+            detection_target: Seconds within which an estop must be seen.
+            scheduler: Optional scheduler.Scheduler to read the keepalive status on instead of a
+                thread of its own.
+        """
+        self._state_task = state_task
+        self._lease_wallet = lease_wallet
+        self._estop_keepalive = estop_keepalive
+        self._resource = resource
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._values = {ESTOP: Estop.UNKNOWN, POWER: MotorPower.UNKNOWN}
+        if lease_wallet is not None:
+            self._values[LEASE] = LeaseState.Status.UNOWNED
+        if estop_keepalive is not None:
+            self._values[ESTOP_KEEPALIVE] = EstopKeepAlive.KeepAliveStatus.OK
+        self._listeners = []  # (kinds or None, callable)
+        self._stop_event = threading.Event()
+        self._keepalive_thread = None
+        self._scheduler = scheduler
+        self._keepalive_task = None
+        self._detection_target = detection_target
+        self._last_snapshot = None  # local time of the previous snapshot
+        self._late = False  # the latest gap was too long; warn once per run of them
+        self.late_snapshots = 0  # gaps between snapshots longer than detection_target
+        self.keepalive_message = ''
+        self.changes = []  # (local time seen, kind, old, new), latest CHANGE_LOG_SIZE
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Hook into the state poll and start reading the estop keepalive status, if any.
+
+        Raises:
+            ValueError: if the state poll is too slow to see an estop within detection_target.
+        """
+        if self._state_task is not None:
+            if 1.0 / self._state_task.rate_hz >= self._detection_target:
+                raise ValueError(f'Robot state polled at {self._state_task.rate_hz:g} Hz cannot '
+                                 f'show an estop within {self._detection_target * 1000:g} ms')
+            self._last_snapshot = None
+            self._state_task.add_listener(self._on_state)
+            state, timestamp = self._state_task.latest()
+            if state is not None:
+                self._on_state(state, timestamp)
+        if self._estop_keepalive is None:
+            return
+        if self._scheduler is not None:
+            if self._keepalive_task is None:
+                # Emptying a queue is cheap enough to do often on the loop thread.
+                self._keepalive_task = self._scheduler.add('estop_status', self._drain_keepalive,
+                                                           KEEPALIVE_DRAIN_RATE, SAFETY)
+            return
+        if self._keepalive_thread is None:
+            self._stop_event.clear()
+            self._keepalive_thread = threading.Thread(target=self._read_keepalive,
+                                                      name='StateWatcher', daemon=True)
+            self._keepalive_thread.start()
+
+    def stop(self):
+        if self._state_task is not None:
+            self._state_task.remove_listener(self._on_state)
+        if self._keepalive_task is not None:
+            self._keepalive_task.remove()
+            self._keepalive_task = None
+        self._stop_event.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join()
+            self._keepalive_thread = None
+
+    def on_change(self, listener, kinds=None):
+        """Call listener(kind, old, new) on every transition, or only for the given kinds.
+
+        Listeners run on the thread that saw the change (the state poll, or the keepalive reader or
+        scheduler loop), so they should return quickly.
+        """
+        self._listeners.append((None if kinds is None else frozenset(kinds), listener))
+        return listener
+
+    def get(self, kind):
+        with self._lock:
+            return self._values[kind]
+
+    @property
+    def estop(self):
+        return self.get(ESTOP)
+
+    @property
+    def power(self):
+        return self.get(POWER)
+
+    @property
+    def lease(self):
+        return self.get(LEASE)
+
+    @property
+    def can_move(self):
+        """True when nothing known stops the robot from taking motion commands."""
+        with self._lock:
+            return (self._values[ESTOP] == Estop.NOT_ESTOPPED and
+                    self._values[POWER] == MotorPower.ON and
+                    self._values.get(LEASE, LeaseState.Status.SELF_OWNER) ==
+                    LeaseState.Status.SELF_OWNER)
+
+    def wait_for(self, kind, value, timeout=None):
+        """Block until `kind` equals `value`. Returns False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._values[kind] == value, timeout=timeout)
+
+    def lease_failed(self, err=None):
+        """LeaseKeepAlive on_failure_callback: re-read the wallet now, not at the next poll."""
+        self._check_lease()
+
+    def _set(self, kind, value):
+        with self._changed:
+            old = self._values[kind]
+            if old == value:
+                return
+            self._values[kind] = value
+            self.changes.append((time.time(), kind, old, value))
+            del self.changes[:-CHANGE_LOG_SIZE]
+            self._changed.notify_all()
+        for kinds, listener in self._listeners:
+            if kinds is None or kind in kinds:
+                listener(kind, old, value)
+
+    def _check_lease(self):
+        if self._lease_wallet is None:
+            return
+        try:
+            status = self._lease_wallet.get_lease_state(self._resource).lease_status
+        except LeaseBaseError:
+            status = LeaseState.Status.UNOWNED
+        self._set(LEASE, status)
+
+    def _on_state(self, state, timestamp):
+        gap = timestamp - self._last_snapshot if self._last_snapshot is not None else 0.0
+        self._last_snapshot = timestamp
+        if gap > self._detection_target:
+            self.late_snapshots += 1
+            if not self._late:
+                LOGGER.warning('Robot state arrived %.0f ms after the previous one; an estop may '
+                               'take that long to show', gap * 1000)
+        self._late = gap > self._detection_target
+        self._set(ESTOP, estop_from_state(state))
+        self._set(POWER, power_from_state(state))
+        self._check_lease()
+
+    def _read_keepalive(self):
+        status_queue = self._estop_keepalive.status_queue
+        while not self._stop_event.is_set():
+            try:
+                status, message = status_queue.get(timeout=KEEPALIVE_WAIT)
+            except queue.Empty:
+                continue
+            self._on_keepalive(status, message)
+
+    def _drain_keepalive(self):
+        status_queue = self._estop_keepalive.status_queue
+        while True:
+            try:
+                status, message = status_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._on_keepalive(status, message)
+
+    def _on_keepalive(self, status, message):
+        if message.strip():
+            self.keepalive_message = message.strip()
+        if self._state_task is not None:
+            # A check-in may have just changed the stop level, and a failed one usually means
+            # the robot is about to estop; look now. Check-ins come every few seconds, so
+            # the extra polls barely add to the poll rate.
+            self._state_task.poll_now()
+        self._set(ESTOP_KEEPALIVE, status)
@@ -0,0 +1,245 @@
+"""Flicker-free curses status screen drawn from a model on its own thread.
+
+StatusScreen keeps the text and attribute it last wrote on every row. Each frame it rebuilds the
+wanted rows from its sources and writes only the span of a row that differs, then flushes once;
+frames are capped at DRAW_RATE and nothing at all is written when nothing changed. Input is read
+through StatusScreen.getch(), which shares the drawing lock because curses is not thread safe.
+"""
+import curses
+import threading
+import time
+
+from instrumentation import STATS
+from profiling import PROFILE, REDRAW
+from scheduler import DISPLAY
+
+DRAW_RATE = 10.0  # Hz, upper bound on screen refreshes
+INPUT_POLL_PERIOD = 0.01  # seconds between getch() polls while waiting for a key
+
+# Styles a model line may ask for; mapped to color pairs when the terminal has colors.
+STYLE_COLORS = {
+    'ok': curses.COLOR_GREEN,
+    'warn': curses.COLOR_YELLOW,
+    'error': curses.COLOR_RED,
+}
+
+
+def _changed_span(old, new):
+    """(start, end) of the part of `new` to write over `old`, or None if they match.
+
+    `new` is padded with spaces to the length of `old` so shorter text erases the tail.
+    """
+    if old == new:
+        return None
+    new = new.ljust(len(old))
+    start = 0
+    while start < len(old) and old[start] == new[start]:
+        start += 1
+    end = len(new)
+    while end > start and end <= len(old) and old[end - 1] == new[end - 1]:
+        end -= 1
+    return start, end
+
+
+class StatusScreen():
+    """Draws rows from sources into a curses window, writing only cells that changed.
+
+    A source is a list of lines, or a callable returning one, drawn from a given row down. A line
+    is text, or (text, style) with a style from STYLE_COLORS. Given a scheduler.Scheduler, frames
+    are drawn by a DISPLAY task on it instead of a thread of its own.
+    """
+
+    def __init__(self, stdscr, rate_hz=DRAW_RATE, scheduler=None):
+        self._stdscr = stdscr
+        self._period = 1.0 / rate_hz
+        self._scheduler = scheduler
+        self._task = None
+        self._sources = []  # (row, lines or callable)
+        self._drawn = {}  # row -> (text, attr) currently on screen
+        self._styles = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.frames = 0  # refreshes that wrote something
+        self.cells = 0  # characters written
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def add(self, row, source):
+        """Draw `source` starting at `row`."""
+        self._sources.append((row, source))
+        return self
+
+    def start(self):
+        """Set up colors and begin drawing in a daemon thread, or on the scheduler."""
+        if self._thread is not None or self._task is not None:
+            return
+        if curses.has_colors():
+            curses.start_color()
+            for pair, (style, color) in enumerate(STYLE_COLORS.items(), start=1):
+                curses.init_pair(pair, color, curses.COLOR_BLACK)
+                self._styles[style] = curses.color_pair(pair)
+        if self._scheduler is not None:
+            # Blocking: a slow terminal holds up only the display worker, not the loop.
+            self._task = self._scheduler.add('status_screen', self.draw, 1.0 / self._period,
+                                             DISPLAY, blocking=True)
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='StatusScreen', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop drawing after one last frame."""
+        if self._task is not None:
+            self._task.remove()
+            self._task = None
+            self.draw()
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def getch(self):
+        """Non-blocking key read; -1 when no key is waiting."""
+        with self._lock:
+            return self._stdscr.getch()
+
+    def wait_key(self, timeout=None):
+        """Wait up to `timeout` seconds (forever if None) for a key. Returns -1 on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            key = self.getch()
+            if key != -1 or (deadline is not None and time.monotonic() >= deadline):
+                return key
+            time.sleep(INPUT_POLL_PERIOD)
+
+    def invalidate(self):
+        """Forget what is on screen so the next frame redraws everything, e.g. after a resize."""
+        with self._lock:
+            self._stdscr.clear()
+            self._drawn.clear()
+
+    def _wanted(self):
+        rows = {}
+        for row, source in self._sources:
+            lines = source() if callable(source) else source
+            for i, line in enumerate(lines):
+                text, style = (line, None) if isinstance(line, str) else line
+                rows[row + i] = (text, self._styles.get(style, curses.A_NORMAL))
+        return rows
+
+    @PROFILE.timed(REDRAW)
+    def draw(self):
+        """Write the differences between the sources and the screen. Returns cells written."""
+        PROFILE.loop('redraw')
+        wanted = self._wanted()
+        written = 0
+        # Skip the frame rather than wait on a key read, or on a signal handler that interrupted one.
+        if not self._lock.acquire(timeout=self._period):
+            return 0
+        try:
+            height, width = self._stdscr.getmaxyx()
+            for row in set(wanted) | set(self._drawn):
+                if row >= height:
+                    continue
+                # The last column is left alone: writing it scrolls or errors on some terminals.
+                text, attr = wanted.get(row, ('', curses.A_NORMAL))
+                text = text[:width - 1]
+                old_text, old_attr = self._drawn.get(row, ('', curses.A_NORMAL))
+                if attr != old_attr:
+                    span = (0, max(len(text), len(old_text)))
+                    text_out = text.ljust(span[1])
+                else:
+                    span = _changed_span(old_text, text)
+                    text_out = text.ljust(len(old_text))
+                if span is None:
+                    continue
+                start, end = span
+                self._stdscr.addstr(row, start, text_out[start:end], attr)
+                written += end - start
+                if row in wanted:
+                    self._drawn[row] = (text, attr)
+                else:
+                    del self._drawn[row]
+            if written:
+                self._stdscr.noutrefresh()
+                curses.doupdate()
+                self.frames += 1
+                self.cells += written
+        finally:
+            self._lock.release()
+        return written
+
+    def _run(self):
+        next_frame = time.monotonic()
+        while not self._stop_event.is_set():
+            self.draw()
+            next_frame = max(next_frame + self._period, time.monotonic())
+            self._stop_event.wait(next_frame - time.monotonic())
+        self.draw()
+
+
+def battery_status(state):
+    """Format the battery readout from a cached RobotState."""
+    if state is None or not state.battery_states:
+        return 'Battery: --'
+    battery = state.battery_states[0]
+    return f'Battery: {battery.charge_percentage.value:.0f}%'
+
+
+def estop_status(state):
+    """(text, style) of the estop line from a cached RobotState."""
+    if state is None:
+        return 'Estop: WAITING FOR STATE', 'warn'
+    names = {estop.State.Name(estop.state) for estop in state.estop_states}
+    if 'STATE_ESTOPPED' in names:
+        return 'Estop: STOPPED', 'error'
+    if 'STATE_UNKNOWN' in names:
+        return 'Estop: ERROR', 'error'
+    return 'Estop: NOT_STOPPED', 'ok'
+
+
+class RobotStatus():
+    """Model of the status screen: robot state from the cache plus what the operator did last.
+
+    command() and error() may be called from any thread; lines() is what the screen draws.
+    """
+
+    def __init__(self, state_task=None, lease_keepalive=None, clock=None, stats=STATS):
+        self.state_task = state_task
+        self.lease_keepalive = lease_keepalive
+        self.clock = clock
+        self.stats = stats
+        self.last_command = ''
+        self.last_error = ''
+
+    def command(self, desc):
+        self.last_command = desc
+
+    def error(self, desc, err):
+        self.last_error = f'Failed {desc}: {err}'
+
+    def lines(self):
+        state = self.state_task.proto if self.state_task is not None else None
+        lines = [estop_status(state)]
+        if state is not None:
+            power = state.power_state.MotorPowerState.Name(state.power_state.motor_power_state)
+            lines.append(f'Power: {power[len("STATE_"):]}')
+        else:
+            lines.append('Power: --')
+        lines.append(battery_status(state))
+        if self.lease_keepalive is not None:
+            alive = self.lease_keepalive.is_alive()
+            lines.append(('Lease: held', 'ok') if alive else ('Lease: lost', 'error'))
+        if self.clock is not None:
+            lines.append(self.clock.describe())
+        lines.append(f'Last command: {self.last_command}')
+        lines.append((self.last_error, 'error'))
+        lines.append('')
+        lines.extend(self.stats.report_lines())
+        return lines
@@ -0,0 +1,282 @@
+"""Record robot state streams to a compact, memory-mappable columnar file.
+
+TelemetryRecorder copies selected RobotState fields out of each snapshot of a shared
+AsyncRobotState into a preallocated NumPy record buffer, and appends full buffers to disk on a
+writer thread. The file is a short JSON header followed by fixed-size little-endian records, so
+load() maps it straight into a structured array without parsing anything per row. A sidecar
+index of (first row, rows, first time, last time) per chunk narrows time-range lookups.
+
+    python telemetry.py telemetry.bin        # summarize a recording
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bosdyn.client.frame_helpers import BODY_FRAME_NAME, ODOM_FRAME_NAME, VISION_FRAME_NAME
+from bosdyn.util import timestamp_to_sec
+
+from scheduler import BACKGROUND
+from state_watcher import estop_from_state, power_from_state
+from transforms import FrameTree
+
+MAX_RECORD_RATE = 50.0  # Hz; snapshots arriving faster than this are skipped
+CHUNK_ROWS = 1024  # rows per buffer, and per append to the file
+FLUSH_PERIOD = 5.0  # seconds between writes of a part-filled buffer when run from a scheduler
+MAGIC = b'SPOTTLM1'
+HEADER_ALIGN = 64  # bytes; records start on this boundary so the map is aligned
+INDEX_DTYPE = np.dtype([('row', '<i8'), ('rows', '<i8'), ('t_first', '<f8'), ('t_last', '<f8')])
+
+POSE_FIELDS = ('x', 'y', 'z', 'qw', 'qx', 'qy', 'qz')
+
+
+def record_dtype(joint_count):
+    """Record layout for a robot with `joint_count` joints. Times are float64, the rest float32."""
+    return np.dtype([
+        ('t', '<f8'),  # local time.time() the snapshot arrived
+        ('acquired', '<f8'),  # robot clock time the kinematic state was measured
+        ('odom', '<f4', (len(POSE_FIELDS),)),  # odom_tform_body, see POSE_FIELDS
+        ('vision', '<f4', (len(POSE_FIELDS),)),  # vision_tform_body
+        ('velocity', '<f4', (6,)),  # body velocity in odom: linear xyz, angular xyz
+        ('joint_position', '<f4', (joint_count,)),
+        ('joint_velocity', '<f4', (joint_count,)),
+        ('joint_load', '<f4', (joint_count,)),
+        ('battery', '<f4'),  # charge percentage
+        ('estop', 'u1'),  # state_watcher.Estop
+        ('power', 'u1'),  # state_watcher.MotorPower
+    ])
+
+
+def _pose(tree, frame_name, out):
+    pose = tree.a_tform_b(frame_name, BODY_FRAME_NAME)
+    if pose is None:
+        out[:] = np.nan
+        return
+    out[:] = (pose.x, pose.y, pose.z, pose.rot.w, pose.rot.x, pose.rot.y, pose.rot.z)
+
+
+class TelemetryRecorder():
+    """Appends the fields of record_dtype() from every robot state snapshot to `path`.
+
+    Args:
+        path: File to write. An existing recording is replaced.
+        state_task: robot_state_cache.AsyncRobotState to record from; record() can also be called
+            directly with (state, timestamp).
+        max_rate_hz: Upper bound on recorded rows per second.
+        chunk_rows: Rows buffered in memory before they are written.
+        scheduler: Optional scheduler.Scheduler; buffered rows are then also written every
+            FLUSH_PERIOD, so a crash loses seconds rather than a whole buffer.
+    """
+
+    def __init__(self, path, state_task=None, max_rate_hz=MAX_RECORD_RATE, chunk_rows=CHUNK_ROWS,
+                 scheduler=None):
+        self.path = path
+        self._state_task = state_task
+        self._scheduler = scheduler
+        self._flush_task = None
+        self._min_interval = 1.0 / max_rate_hz
+        self._chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        self._dtype = None
+        self._joint_names = None
+        self._buffers = []  # two buffers: one filling while the other is written
+        self._fill = 0
+        self._pending = None  # future of the chunk being written
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='telemetry')
+        self._file = None
+        self._index = None
+        self._next_t = 0.0  # earliest arrival time of the next recorded snapshot
+        self.rows = 0  # rows recorded, written or not
+        self.skipped = 0  # snapshots dropped by the rate limit
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Start recording from the state task's snapshots."""
+        if self._state_task is not None:
+            self._state_task.add_listener(self.record)
+        if self._scheduler is not None and self._flush_task is None:
+            self._flush_task = self._scheduler.add('telemetry_flush', self.flush,
+                                                   1.0 / FLUSH_PERIOD, BACKGROUND, blocking=True)
+
+    def stop(self):
+        """Stop recording, write what is buffered and close the files."""
+        if self._flush_task is not None:
+            self._flush_task.remove()
+            self._flush_task = None
+        if self._state_task is not None:
+            self._state_task.remove_listener(self.record)
+        with self._lock:
+            self._flush_locked()
+            if self._pending is not None:
+                self._pending.result()
+            self._writer.shutdown(wait=True)
+            if self._file is not None:
+                self._file.close()
+                self._index.close()
+                self._file = None
+
+    def _open(self, state):
+        self._joint_names = [joint.name for joint in state.kinematic_state.joint_states]
+        self._dtype = record_dtype(len(self._joint_names))
+        self._buffers = [np.zeros(self._chunk_rows, self._dtype) for _ in range(2)]
+        header = json.dumps({
+            'dtype': self._dtype.descr,
+            'joint_names': self._joint_names,
+            'pose_fields': POSE_FIELDS,
+            'created': time.time(),
+        }).encode()
+        # Magic, header length, header, then padding so the first record is aligned.
+        size = len(MAGIC) + 4 + len(header)
+        header += b' ' * (-size % HEADER_ALIGN)
+        self._file = open(self.path, 'wb')
+        self._file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        self._file.flush()
+        self._index = open(self.path + '.idx', 'wb')
+
+    def record(self, state, timestamp):
+        """Copy the recorded fields of `state`, which arrived at local time `timestamp`."""
+        with self._lock:
+            if timestamp < self._next_t:
+                self.skipped += 1
+                return
+            # Hold the average rate without dropping snapshots that arrive a little early.
+            self._next_t = max(self._next_t + self._min_interval, timestamp - self._min_interval)
+            if self._dtype is None:
+                self._open(state)
+            row = self._buffers[0][self._fill]
+            kinematic = state.kinematic_state
+            row['t'] = timestamp
+            row['acquired'] = timestamp_to_sec(kinematic.acquisition_timestamp)
+            # The snapshot came straight from the robot, so skip validating it. Both poses share
+            # the walk from the root to the body.
+            tree = FrameTree(kinematic.transforms_snapshot, validate=False)
+            _pose(tree, ODOM_FRAME_NAME, row['odom'])
+            _pose(tree, VISION_FRAME_NAME, row['vision'])
+            linear = kinematic.velocity_of_body_in_odom.linear
+            angular = kinematic.velocity_of_body_in_odom.angular
+            row['velocity'] = (linear.x, linear.y, linear.z, angular.x, angular.y, angular.z)
+            joints = kinematic.joint_states
+            count = min(len(joints), len(self._joint_names))
+            row['joint_position'][:count] = [joint.position.value for joint in joints[:count]]
+            row['joint_velocity'][:count] = [joint.velocity.value for joint in joints[:count]]
+            row['joint_load'][:count] = [joint.load.value for joint in joints[:count]]
+            row['battery'] = (state.battery_states[0].charge_percentage.value
+                              if state.battery_states else np.nan)
+            row['estop'] = estop_from_state(state)
+            row['power'] = power_from_state(state)
+            self._fill += 1
+            self.rows += 1
+            if self._fill == self._chunk_rows:
+                self._flush_locked()
+
+    def flush(self):
+        """Hand buffered rows to the writer now instead of when the buffer fills."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._fill:
+            return
+        chunk = self._buffers[0][:self._fill]
+        first_row = self.rows - self._fill
+        if self._pending is not None:
+            # The other buffer is free once its write has finished.
+            self._pending.result()
+        self._pending = self._writer.submit(self._write, chunk, first_row)
+        self._buffers.reverse()
+        self._fill = 0
+
+    def _write(self, chunk, first_row):
+        self._file.write(chunk.tobytes())
+        self._file.flush()
+        entry = np.array([(first_row, len(chunk), chunk['t'][0], chunk['t'][-1])], INDEX_DTYPE)
+        self._index.write(entry.tobytes())
+        self._index.flush()
+
+
+class Telemetry():
+    """A recording mapped into memory. `data` is a read-only structured array, one row per sample."""
+
+    def __init__(self, data, index, joint_names):
+        self.data = data
+        self.index = index
+        self.joint_names = joint_names
+
+    def __len__(self):
+        return len(self.data)
+
+    def between(self, t_start, t_end):
+        """Rows with start <= t < end, located through the chunk index."""
+        chunks = self.index[(self.index['t_last'] >= t_start) & (self.index['t_first'] < t_end)]
+        if not len(chunks):
+            return self.data[:0]
+        first = chunks['row'][0]
+        last = min(chunks['row'][-1] + chunks['rows'][-1], len(self.data))
+        rows = self.data[first:last]
+        times = rows['t']
+        return rows[np.searchsorted(times, t_start):np.searchsorted(times, t_end)]
+
+    def summary(self):
+        if not len(self.data):
+            return {'rows': 0}
+        data = self.data
+        steps = np.linalg.norm(np.diff(data['odom'][:, :2], axis=0), axis=1)
+        return {
+            'rows': len(data),
+            'duration_s': float(data['t'][-1] - data['t'][0]),
+            'rate_hz': float((len(data) - 1) / max(data['t'][-1] - data['t'][0], 1e-9)),
+            'odom_distance_m': float(np.nansum(steps)),
+            'battery_start': float(data['battery'][0]),
+            'battery_end': float(data['battery'][-1]),
+        }
+
+
+def load(path):
+    """Map the recording at `path`. A partly written last record is ignored."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a telemetry recording')
+        (length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length))
+    offset = len(MAGIC) + 4 + length
+    dtype = np.dtype([tuple(field) for field in header['dtype']])
+    rows = (os.path.getsize(path) - offset) // dtype.itemsize
+    if rows:
+        data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(rows,))
+    else:
+        data = np.zeros(0, dtype)
+    index_path = path + '.idx'
+    index = (np.fromfile(index_path, INDEX_DTYPE)
+             if os.path.exists(index_path) else np.zeros(0, INDEX_DTYPE))
+    return Telemetry(data, index, header['joint_names'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('path', help='Recording to summarize')
+    options = parser.parse_args()
+    start = time.perf_counter()
+    telemetry = load(options.path)
+    elapsed = time.perf_counter() - start
+    print(f'Loaded {options.path} ({os.path.getsize(options.path) / 1e6:.1f} MB) in '
+          f'{elapsed * 1000:.1f} ms')
+    for key, value in telemetry.summary().items():
+        print(f'{key:<18}{value:.2f}' if isinstance(value, float) else f'{key:<18}{value}')
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
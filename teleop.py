@@ -0,0 +1,230 @@
+import threading
+import time
+
+from bosdyn.client import ResponseError, RpcError
+from bosdyn.client.lease import Error as LeaseBaseError
+from bosdyn.client.robot_command import RobotCommandBuilder
+
+from profiling import PROFILE, SLEEP
+
+SEND_RATE = 20.0  # Hz
+DEADLINE_TICKS = 3  # each command expires this many ticks after it is sent
+
+# Terminals only report key presses, never releases, so a key counts as held while auto-repeat
+# keeps sending it. The first repeat arrives after the OS repeat delay; later ones come quickly.
+# Until that first repeat a tap and the start of a hold look the same.
+INITIAL_REPEAT_DELAY = 0.55  # seconds
+REPEAT_TIMEOUT = 0.12  # seconds
+
+
+class HeldKeys():
+    """Tracks which keys are currently held, inferred from the terminal's auto-repeat stream.
+
+    A key stays held until no repeat has come for `repeat_timeout`. A new press has no repeat yet,
+    so by default it counts as held for the whole `initial_delay`: a hold drives without a break,
+    and a tap drives for `initial_delay`. Given `tap_pulse`, a new press drives only that long;
+    taps get shorter, but every hold then stops from `tap_pulse` until its first repeat, about
+    `initial_delay` - `tap_pulse` later.
+    """
+
+    def __init__(self, initial_delay=INITIAL_REPEAT_DELAY, repeat_timeout=REPEAT_TIMEOUT,
+                 tap_pulse=None):
+        self._initial_delay = initial_delay
+        self._repeat_timeout = repeat_timeout
+        self._tap_pulse = initial_delay if tap_pulse is None else tap_pulse
+        self._lock = threading.Lock()
+        self._keys = {}  # key -> [last event time, repeating]
+
+    def press(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None:
+                self._keys[key] = [now, False]
+            else:
+                entry[0] = now
+                entry[1] = True
+
+    def release_all(self):
+        with self._lock:
+            self._keys.clear()
+
+    def held(self, now=None):
+        """Return the set of keys held at `now`, forgetting keys whose repeats have stopped."""
+        now = time.monotonic() if now is None else now
+        held = set()
+        with self._lock:
+            for key, (last, repeating) in list(self._keys.items()):
+                since = now - last
+                if repeating:
+                    if since > self._repeat_timeout:
+                        del self._keys[key]
+                    else:
+                        held.add(key)
+                elif since > self._initial_delay:
+                    del self._keys[key]
+                elif since <= self._tap_pulse:
+                    # Not yet known to be a tap rather than the start of a hold.
+                    held.add(key)
+        return held
+
+
+class TeleopEngine():
+    """Sends the combined velocity of all held keys at a fixed rate.
+
+    Input handling only calls key_event(); a separate thread samples the held keys every tick and
+    sends one short-deadline velocity command, so diagonal and turn-while-walking motion work.
+
+    Releases are inferred from auto-repeat stopping, so after a hold the zero velocity goes out
+    REPEAT_TIMEOUT plus up to one tick after the last repeat: 120-170 ms at the defaults. A tap
+    cannot be told from the start of a hold until the first repeat is due, so it drives for
+    INITIAL_REPEAT_DELAY plus up to one tick; `tap_pulse` trades that for a pause in every hold
+    (see HeldKeys). Should the stop be lost, the last command still expires DEADLINE_TICKS after
+    it was sent.
+    """
+
+    def __init__(self, command_client, key_velocities, max_velocity, rate_hz=SEND_RATE,
+                 on_error=None, clock=None, on_send=None, tap_pulse=None):
+        """
+        Args:
+            command_client: RobotCommandClient used to send velocity commands.
+            key_velocities: Dict of key code -> (v_x, v_y, v_rot).
+            max_velocity: (v_x, v_y, v_rot) limits applied to the summed velocity.
+            rate_hz: Command send rate.
+            on_error: Optional callable(err) for failed sends.
+            clock: Optional robot_clock.RobotClock; deadlines then allow for the trip to the robot.
+            on_send: Optional callable(velocity, duration) called after each successful send.
+            tap_pulse: Optional seconds a press drives before its first repeat; see HeldKeys.
+        """
+        self._command_client = command_client
+        self._key_velocities = key_velocities
+        self._max_velocity = max_velocity
+        self._period = 1.0 / rate_hz
+        self._on_error = on_error
+        self._clock = clock
+        self._on_send = on_send
+        self.held_keys = HeldKeys(tap_pulse=tap_pulse)
+        # Velocity command templates, built once per distinct velocity.
+        self._templates = {}
+        self._velocity = (0.0, 0.0, 0.0)
+        self._enabled = threading.Event()
+        self._enabled.set()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.ticks = 0
+        self.sent = 0
+        self.late_ticks = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def velocity(self):
+        """Velocity sent on the latest tick."""
+        return self._velocity
+
+    def key_event(self, key):
+        """Record a key press. Returns False if the key does not drive the robot."""
+        if key not in self._key_velocities:
+            return False
+        self.held_keys.press(key)
+        return True
+
+    @property
+    def enabled(self):
+        return self._enabled.is_set()
+
+    def disable(self):
+        """Stop sending motion at once, e.g. on estop or lease loss. Held keys are forgotten.
+
+        If the robot was moving, the next tick sends it one stop command rather than leaving the
+        last velocity to run out its deadline.
+        """
+        self._enabled.clear()
+        self.held_keys.release_all()
+
+    def enable(self):
+        self._enabled.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='TeleopEngine', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.held_keys.release_all()
+
+    def combined_velocity(self, keys):
+        """Sum the velocities of `keys` and clip to the limits."""
+        total = [0.0, 0.0, 0.0]
+        for key in keys:
+            for i, v in enumerate(self._key_velocities[key]):
+                total[i] += v
+        return tuple(max(-limit, min(limit, v)) for v, limit in zip(total, self._max_velocity))
+
+    def _template(self, velocity):
+        cmd = self._templates.get(velocity)
+        if cmd is None:
+            v_x, v_y, v_rot = velocity
+            cmd = RobotCommandBuilder.synchro_velocity_command(v_x=v_x, v_y=v_y, v_rot=v_rot)
+            self._templates[velocity] = cmd
+        return cmd
+
+    def _deadline(self):
+        if self._clock is not None:
+            return self._clock.deadline(DEADLINE_TICKS * self._period)
+        return time.time() + DEADLINE_TICKS * self._period
+
+    def _send(self, velocity):
+        try:
+            self._command_client.robot_command(command=self._template(velocity),
+                                               end_time_secs=self._deadline())
+            self.sent += 1
+            if self._on_send is not None:
+                self._on_send(velocity, DEADLINE_TICKS * self._period)
+        except (ResponseError, RpcError, LeaseBaseError) as err:
+            if self._on_error is not None:
+                self._on_error(err)
+
+    def _send_stop(self):
+        try:
+            self._command_client.robot_command(command=RobotCommandBuilder.stop_command())
+        except (ResponseError, RpcError, LeaseBaseError) as err:
+            if self._on_error is not None:
+                self._on_error(err)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            PROFILE.loop('teleop')
+            if self._enabled.is_set():
+                velocity = self.combined_velocity(self.held_keys.held())
+                # Idle robots get nothing; the tick after release sends one zero velocity to stop.
+                if velocity != (0.0, 0.0, 0.0) or self._velocity != (0.0, 0.0, 0.0):
+                    self._send(velocity)
+            else:
+                velocity = (0.0, 0.0, 0.0)
+                if self._velocity != velocity:
+                    self._send_stop()
+            self._velocity = velocity
+            self.ticks += 1
+
+            next_tick += self._period
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # Skip missed ticks instead of bursting to catch up.
+                self.late_ticks += 1
+                next_tick = time.monotonic()
+                delay = 0
+            with PROFILE.stage(SLEEP):
+                self._stop_event.wait(delay)
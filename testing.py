@@ -1,41 +1,47 @@
 import curses
-    
-def interface(stdscr):
-    curses.noecho()
-    curses.cbreak()
-    stdscr.keypad(True) # Enable special keys
-    run = True
-    i = 0;
+import contextlib
+
+from input_sources import ESC, CursesInput
+from status_display import StatusScreen
+
+def interface(stdscr, keys=None):
+    """Run the test menu. With stdscr None it runs headless on `keys`, e.g. a ScriptedInput."""
+    last = {'key': '', 'action': ''}
+    screen = None
+    if stdscr is not None:
+        curses.noecho()
+        curses.cbreak()
+        stdscr.keypad(True) # Enable special keys
+        stdscr.nodelay(True)
+
+        screen = StatusScreen(stdscr)
+        screen.add(0, ["User Interface:", "[esc]: Exit", "[c]: Does a Circle", "[s]: Settle and Sit"])
+        screen.add(4, lambda: [last['action'], f"   {last['key']}"])
+
+    if keys is None:
+        keys = CursesInput(screen)
 
     try:
-        stdscr.addstr(0, 0, "User Interface:")
-        stdscr.addstr(1, 0, "[esc]: Exit")
-        stdscr.addstr(2, 0, "[c]: Does a Circle")
-        stdscr.addstr(3, 0, "[s]: Settle and Sit\n")
-        stdscr.refresh()
-        while run:
-            key = stdscr.getch()
-            stdscr.addstr(5, 0, f"          ")
-            stdscr.addstr(5, 0, f"   {key}")
-            if key == ord('p'):
-                break
-            elif key == ord('c'):
-                stdscr.addstr(4, 0, "                           ")
-                stdscr.addstr(4, 0, "Circle")
-            elif key == ord('s'):
-                stdscr.addstr(4, 0, "                           ")
-                stdscr.addstr(4, 0, "Stop")
-            
-                
-            stdscr.refresh()
-            # i = ((i + 1) % 9)
-                        
+        with screen if screen is not None else contextlib.nullcontext():
+            while True:
+                key = keys.wait_key()
+                last['key'] = key
+                if key in (ESC, ord('p')):
+                    break
+                elif key == ord('c'):
+                    last['action'] = "Circle"
+                elif key == ord('s'):
+                    last['action'] = "Stop"
+                # i = ((i + 1) % 9)
+
     finally:
-        curses.nocbreak()
-        curses.echo()
-        stdscr.keypad(False)
-        curses.endwin()
-        
+        if stdscr is not None:
+            curses.nocbreak()
+            curses.echo()
+            stdscr.keypad(False)
+            curses.endwin()
+    return last
 
-curses.wrapper(interface)
 
+if __name__ == '__main__':
+    curses.wrapper(interface)
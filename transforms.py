@@ -0,0 +1,160 @@
+"""Frame tree lookups indexed once per robot state snapshot and memoized across callers.
+
+frame_helpers.get_a_tform_b() validates and walks the whole snapshot on every call. FrameTree
+validates a snapshot once and keeps root_tform_frame for each frame it has resolved, so any pair
+costs one inverse and one multiply. TransformCache keeps recent trees and composed results keyed
+by the snapshot's acquisition timestamp, so every copy of the same snapshot -- the state cache's,
+a listener's, a later lookup's -- shares the work. TRANSFORMS is the cache the scripts share.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from bosdyn.client.frame_helpers import is_gravity_aligned_frame_name, validate_frame_tree_snapshot
+from bosdyn.client.math_helpers import SE3Pose
+
+TREE_CACHE_SIZE = 64  # snapshots whose frame trees are kept
+RESULT_CACHE_SIZE = 1024  # composed (snapshot, frame pair) results kept
+
+SE3_FIELDS = ('x', 'y', 'z', 'qw', 'qx', 'qy', 'qz')  # columns of TransformCache.poses()
+SE2_FIELDS = ('x', 'y', 'angle')  # columns of TransformCache.se2_poses()
+
+
+class FrameTree():
+    """One FrameTreeSnapshot, validated once and resolved lazily from its root down."""
+
+    def __init__(self, snapshot, validate=True):
+        if validate:
+            validate_frame_tree_snapshot(snapshot)
+        self._edges = snapshot.child_to_parent_edge_map
+        self._root_tform = {}  # frame -> SE3Pose root_tform_frame
+
+    def __contains__(self, frame_name):
+        return frame_name in self._edges
+
+    def root_tform(self, frame_name):
+        """root_tform_frame of a frame in the tree."""
+        pose = self._root_tform.get(frame_name)
+        if pose is not None:
+            return pose
+        # Walk up to the nearest resolved ancestor, then resolve back down.
+        chain = []
+        name = frame_name
+        while name not in self._root_tform:
+            edge = self._edges[name]
+            if not edge.parent_frame_name:
+                self._root_tform[name] = SE3Pose.from_identity()
+                break
+            chain.append((name, edge))
+            name = edge.parent_frame_name
+        for name, edge in reversed(chain):
+            self._root_tform[name] = (self._root_tform[edge.parent_frame_name] *
+                                      SE3Pose.from_proto(edge.parent_tform_child))
+        return self._root_tform[frame_name]
+
+    def a_tform_b(self, frame_a, frame_b):
+        """SE3Pose a_tform_b, or None if either frame is missing (as frame_helpers)."""
+        if frame_a not in self._edges or frame_b not in self._edges:
+            return None
+        return self.root_tform(frame_a).inverse() * self.root_tform(frame_b)
+
+    def se2_a_tform_b(self, frame_a, frame_b):
+        """SE2Pose a_tform_b, or None if a frame is missing or frame_a is not gravity aligned."""
+        if not is_gravity_aligned_frame_name(frame_a):
+            return None
+        pose = self.a_tform_b(frame_a, frame_b)
+        return None if pose is None else pose.get_closest_se2_transform()
+
+
+def snapshot_key(state):
+    """Cache key of a RobotState: its kinematic acquisition timestamp."""
+    stamp = state.kinematic_state.acquisition_timestamp
+    return stamp.seconds, stamp.nanos
+
+
+class TransformCache():
+    """LRU caches of frame trees and composed transforms keyed by snapshot timestamp.
+
+    Safe to share between threads. Snapshots are identified by their acquisition timestamp, so
+    states from two robots must not share a cache.
+    """
+
+    def __init__(self, tree_size=TREE_CACHE_SIZE, result_size=RESULT_CACHE_SIZE, validate=True):
+        self._tree_size = tree_size
+        self._result_size = result_size
+        self._validate = validate
+        self._lock = threading.Lock()
+        self._trees = OrderedDict()  # key -> FrameTree
+        self._results = OrderedDict()  # (key, kind, frame_a, frame_b) -> pose or None
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+            self._results.clear()
+
+    def tree(self, state):
+        """FrameTree of a RobotState's transforms snapshot."""
+        key = snapshot_key(state)
+        with self._lock:
+            tree = self._trees.get(key)
+            if tree is not None:
+                self._trees.move_to_end(key)
+                return tree
+        tree = FrameTree(state.kinematic_state.transforms_snapshot, self._validate)
+        with self._lock:
+            tree = self._trees.setdefault(key, tree)
+            while len(self._trees) > self._tree_size:
+                self._trees.popitem(last=False)
+        return tree
+
+    def _lookup(self, state, kind, frame_a, frame_b):
+        key = (snapshot_key(state), kind, frame_a, frame_b)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key]
+            self.misses += 1
+        # FrameTree memoizes as it goes, so a rare concurrent miss only repeats cheap work.
+        tree = self.tree(state)
+        if kind == 'se2':
+            pose = tree.se2_a_tform_b(frame_a, frame_b)
+        else:
+            pose = tree.a_tform_b(frame_a, frame_b)
+        with self._lock:
+            self._results[key] = pose
+            while len(self._results) > self._result_size:
+                self._results.popitem(last=False)
+        return pose
+
+    def a_tform_b(self, state, frame_a, frame_b):
+        """SE3Pose a_tform_b in a RobotState's snapshot, or None if a frame is missing."""
+        return self._lookup(state, 'se3', frame_a, frame_b)
+
+    def se2_a_tform_b(self, state, frame_a, frame_b):
+        """SE2Pose a_tform_b in a RobotState's snapshot; None as frame_helpers.get_se2_a_tform_b."""
+        return self._lookup(state, 'se2', frame_a, frame_b)
+
+    def poses(self, states, frame_a, frame_b):
+        """(N, 7) array of a_tform_b across `states`, columns SE3_FIELDS; NaN rows where missing."""
+        out = np.full((len(states), len(SE3_FIELDS)), np.nan)
+        for i, state in enumerate(states):
+            pose = self.a_tform_b(state, frame_a, frame_b)
+            if pose is not None:
+                out[i] = (pose.x, pose.y, pose.z, pose.rot.w, pose.rot.x, pose.rot.y, pose.rot.z)
+        return out
+
+    def se2_poses(self, states, frame_a, frame_b):
+        """(N, 3) array of SE2 a_tform_b across `states`, columns SE2_FIELDS; NaN where missing."""
+        out = np.full((len(states), len(SE2_FIELDS)), np.nan)
+        for i, state in enumerate(states):
+            pose = self.se2_a_tform_b(state, frame_a, frame_b)
+            if pose is not None:
+                out[i] = (pose.x, pose.y, pose.angle)
+        return out
+
+
+TRANSFORMS = TransformCache()
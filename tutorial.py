@@ -1,13 +1,9 @@
+import argparse
 import time
 import math
 import sys
 
 import bosdyn.client
-from bosdyn.client.image import ImageClient
-
-from bosdyn.api import manipulation_api_pb2
-from PIL import Image
-import io
 from bosdyn.client.robot_command import RobotCommandBuilder, RobotCommandClient
 from bosdyn.client.robot_command import blocking_stand, blocking_sit, blocking_selfright
 from bosdyn.geometry import EulerZXY
@@ -20,59 +16,71 @@ from bosdyn.api.geometry_pb2 import Vec3, SE3Pose
 from bosdyn.client import ResponseError, RpcError
 from bosdyn.client.lease import Error as LeaseBaseError
 
-from bosdyn.api.basic_command_pb2 import RobotCommandFeedbackStatus
 from bosdyn.client import math_helpers
-from bosdyn.client.frame_helpers import (BODY_FRAME_NAME, ODOM_FRAME_NAME, VISION_FRAME_NAME, get_se2_a_tform_b)
+from bosdyn.client.frame_helpers import BODY_FRAME_NAME, ODOM_FRAME_NAME, VISION_FRAME_NAME
+
+from goal_wait import expected_duration, wait_for_goal
+from instrumentation import STATS
+from move_pipeline import MoveExecutor, square
+from profiling import (DISPATCH, FEEDBACK, PROFILE, add_profile_argument, finish_profiling,
+                       start_profiling)
+from startup import connect
+from telemetry import TelemetryRecorder
+from transforms import TRANSFORMS
+
+TELEMETRY_PATH = 'telemetry.bin'
 
 
 global command_client
 global state_client
 def main():
+    parser = argparse.ArgumentParser(description='Stand up, make a relative move and sit down.')
+    add_profile_argument(parser)
+    options = parser.parse_args()
+
     # Create SDK
     sdk = bosdyn.client.create_standard_sdk('understanding_spot')
 
     # Create a robot
     robot = sdk.create_robot('192.168.80.3')
-
-    # Retrive robot id
-    id_client = robot.ensure_client('robot-id')
-    id_client.get_id()
-
-    # Asynchronous call for the robot id
-    fut = id_client.get_id_async()
-    fut.result()
-
-    # Auttheticating the robot
-    robot.authenticate('user', '8w6sm6qeboc9')
-
-    # Retreaving robot state
-    state_client = robot.ensure_client('robot-state')
-    print(state_client.get_robot_state().battery_states)
+    start_profiling(options.profile, robot)
+
+    # Authenticate, time sync, clients, lease and the first robot state, overlapped where they
+    # can be. The state poller feeds the battery readout and every move.
+    session = connect(robot, 'user', '8w6sm6qeboc9')
+    print('\n'.join(session.startup.report_lines()))
+    print(session.clock.describe())
+    state_task = session.state_task
+    state, _ = state_task.latest()
+    if state is not None:
+        print(state.battery_states)
 
     # Capture and view camera images
-    image_client = robot.ensure_client(ImageClient.default_service_name)
-    sources = image_client.list_image_sources()
-
+    # from PIL import Image
+    # import io
+    # image_client = robot.ensure_client(ImageClient.default_service_name)
+    # sources = image_client.list_image_sources()
     # image_response = image_client.get_image_from_sources(["right_fisheye_image"])[0]
     # image = Image.open(io.BytesIO(image_response.shot.image.data))
     # image.show()
 
-    # E-Stop State
-    estop_client = robot.ensure_client('estop')
-    estop_client.get_status()
+    # Or capture every camera in the background without holding up the moves below:
+    # from image_capture import AsyncImageCapture
+    # image_task = AsyncImageCapture(robot)
+    # image_task.toggle_video_mode()
+    # frame, acquisition_time = image_task.latest('right_fisheye_image')
+    # Image.fromarray(frame).show()
 
     # # Cretate E-Stop end point 
+    # estop_client = session.clients['estop']
     # estop_endpoint = bosdyn.client.estop.EstopEndpoint(client=estop_client, name='my_estop', estop_timeout=9.0)
     # estop_endpoint.force_simple_setup()
 
     # # Clearing E-Stop to allow power
     # estop_keep_alive = bosdyn.client.estop.EstopKeepAlive(estop_endpoint)
     # print(estop_client.get_status())
-    
-    assert not robot.is_estopped(), 'Robot is estopped. Please use an external E-Stop client, ' \
-                                    'such as the estop SDK example, to configure E-Stop.'
 
-    # # Acquiring control of spot (ownership/lease)
+    # # Acquiring control of spot (ownership/lease) by hand instead of through connect()
     # lease_client = robot.ensure_client('lease')
     # lease_client.list_leases()
 
@@ -80,19 +88,17 @@ def main():
     # lease_keep_alive = bosdyn.client.lease.LeaseKeepAlive(lease_client)
     # lease_client.list_leases()
     
-    lease_client = robot.ensure_client(bosdyn.client.lease.LeaseClient.default_service_name)
-    with bosdyn.client.lease.LeaseKeepAlive(lease_client, must_acquire=True, return_at_exit=True):
+    # Every state snapshot of the run goes to telemetry.bin; summarize it with telemetry.py.
+    with session, TelemetryRecorder(TELEMETRY_PATH, state_task, scheduler=session.scheduler):
 
         # Powering on robot
         robot.power_on(timeout_sec=20)
         print(robot.is_powered_on())
 
-        robot.time_sync.wait_for_sync()
-
-
-        command_client = robot.ensure_client(RobotCommandClient.default_service_name)
+        command_client = session.clients[RobotCommandClient.default_service_name]
         # blocking_selfright(command_client, timeout_sec=10)
-        blocking_stand(command_client, timeout_sec=10)
+        with PROFILE.stage(FEEDBACK):
+            blocking_stand(command_client, timeout_sec=10)
         # time.sleep(1)
 
 
@@ -102,7 +108,7 @@ def main():
         # command_client.robot_command(cmd)
         # time.sleep(2)
         
-        # relative_move(0, 0, math.radians(180), ODOM_FRAME_NAME, command_client, state_client, stairs=False)    
+        # relative_move(0, 0, math.radians(180), ODOM_FRAME_NAME, command_client, state_task, stairs=False)    
         # command_proto = RobotCommandBuilder.synchro_velocity_command(v_x=0.5, v_y=0.0, v_rot=-1.57)
         # end_time_secs = time.time() + 4.0
         # print(end_time_secs)
@@ -116,52 +122,63 @@ def main():
         #     print(f'Failed Moving Forward: {err}')
         # print("done")
         
-        relative_move(1.5, 0, math.radians(0), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
+        relative_move(1.5, 0, math.radians(0), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
         
         # for i in range(4):
    
-        #     relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
+        #     relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
         
         # this will make spot move straigt, sideways, and turn all at once
-        # relative_move(1, 0 math.radians(0), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(-0.5, -0.5, math.radians(-45), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(1, 0, math.radians(0), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(1, 0, math.radians(0), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(1, 0, math.radians(0), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
-        # relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
+        # relative_move(1, 0 math.radians(0), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(-0.5, -0.5, math.radians(-45), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0.5, 0.5, math.radians(45), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(1, 0, math.radians(0), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(1, 0, math.radians(0), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(1, 0, math.radians(0), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
+        # relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_task, stairs=False)
 
 
 
 
         # Powering off the robot
         # time.sleep(4)
-        blocking_sit(command_client, timeout_sec=10)
+        with PROFILE.stage(FEEDBACK):
+            blocking_sit(command_client, timeout_sec=10)
         robot.power_off(cut_immediately=False)
+
+    STATS.dump()
+    print('\n'.join(STATS.report_lines()))
+    finish_profiling(options.profile_report)
         
-def walk_square(sides_lenght):
-    for i in range(4):
-        relative_move(1, 0, math.radians(0), ODOM_FRAME_NAME, command_client, state_client, stairs=False)    
-        relative_move(0, 0, math.radians(90), ODOM_FRAME_NAME, command_client, state_client, stairs=False)
+def walk_square(side_length, command_client, state_task):
+    # Corners are blended rather than settled; each goal is chained off the last commanded one.
+    executor = MoveExecutor(command_client, state_task)
+    results = executor.run(square(side_length))
+    print(f'Walked {len(results)} moves ({executor.moves_per_minute:.1f} moves/min): '
+          f'{results[-1].status}')
+    return results
     
 
-def relative_move(dx, dy, dyaw, frame_name, robot_command_client, robot_state_client, stairs=False):
-    transforms = robot_state_client.get_robot_state().kinematic_state.transforms_snapshot
+@PROFILE.timed(DISPATCH)
+def relative_move(dx, dy, dyaw, frame_name, robot_command_client, robot_state_task, stairs=False):
+    # Read the pose from the shared state cache, waiting only if nothing has arrived yet; raises
+    # robot_state_cache.NoStateError if nothing does.
+    state = robot_state_task.current()
 
     # Build the transform for where we want the robot to be relative to where the body currently is.
     body_tform_goal = math_helpers.SE2Pose(x=dx, y=dy, angle=dyaw)
     # We do not want to command this goal in body frame because the body will move, thus shifting
     # our goal. Instead, we transform this offset to get the goal position in the output frame
     # (which will be either odom or vision).
-    out_tform_body = get_se2_a_tform_b(transforms, frame_name, BODY_FRAME_NAME)
+    out_tform_body = TRANSFORMS.se2_a_tform_b(state, frame_name, BODY_FRAME_NAME)
     out_tform_goal = out_tform_body * body_tform_goal
 
     # Command the robot to go to the goal point in the specified frame. The command will stop at the
@@ -170,24 +187,19 @@ def relative_move(dx, dy, dyaw, frame_name, robot_command_client, robot_state_cl
         goal_x=out_tform_goal.x, goal_y=out_tform_goal.y, goal_heading=out_tform_goal.angle,
         frame_name=frame_name, params=RobotCommandBuilder.mobility_params(stair_hint=stairs))
     end_time = 10.0
+    end_time_secs = time.time() + end_time
     cmd_id = robot_command_client.robot_command(lease=None, command=robot_cmd,
-                                                end_time_secs=time.time() + end_time)
-    # Wait until the robot has reached the goal.
-    while True:
-        feedback = robot_command_client.robot_command_feedback(cmd_id)
-        mobility_feedback = feedback.feedback.synchronized_feedback.mobility_command_feedback
-        if mobility_feedback.status != RobotCommandFeedbackStatus.STATUS_PROCESSING:
-            print('Failed to reach the goal')
-            break
-        traj_feedback = mobility_feedback.se2_trajectory_feedback
-        if (traj_feedback.status == traj_feedback.STATUS_AT_GOAL and
-                traj_feedback.body_movement_status == traj_feedback.BODY_STATUS_SETTLED):
-            print('Arrived at the goal.')
-            break
-        # time.sleep(1)
+                                                end_time_secs=end_time_secs)
+    # Wait until the robot has reached the goal, polling feedback on an adaptive schedule.
+    result = wait_for_goal(robot_command_client, cmd_id, end_time_secs,
+                           expected_secs=expected_duration(dx, dy, dyaw))
+    if result.reached:
+        print(f'Arrived at the goal. ({result.rpc_count} feedback calls, {result.elapsed:.2f}s)')
+    else:
+        print(f'Failed to reach the goal: {result.status} ({result.rpc_count} feedback calls)')
+    return result
+
 
-    
-    
 
 if __name__ == '__main__':
     if not main():
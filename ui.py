@@ -3,38 +3,56 @@ import time
 import argparse
 import curses
 import signal
-import threading
 
 import bosdyn.client
 import bosdyn.client.util
-from bosdyn.client.lease import LeaseClient, LeaseKeepAlive
+from bosdyn.client.lease import LeaseClient
 from bosdyn.client.estop import EstopClient, EstopEndpoint, EstopKeepAlive
+from bosdyn.api.robot_state_pb2 import EStopState
 from bosdyn.client.robot_state import RobotStateClient
 from bosdyn.client.robot_command import RobotCommandBuilder, RobotCommandClient
 from bosdyn.client import ResponseError, RpcError
 from bosdyn.client.lease import Error as LeaseBaseError
 
+from image_capture import AsyncImageCapture
+from input_sources import CursesInput, ScriptedInput, load_script
+from instrumentation import DEFAULT_DUMP_PATH, STATS, instrument_robot
+from keepalive import ScheduledEstopKeepAlive, ScheduledLeaseKeepAlive
+from profiling import (DISPATCH, INPUT, PROFILE, SLEEP, add_profile_argument, finish_profiling,
+                       start_profiling)
+from robot_clock import RobotClock
+from robot_state_cache import AsyncRobotState, STATE_POLL_RATE
+from scheduler import Scheduler
+from state_watcher import ESTOP_KEEPALIVE, StateWatcher
+from status_display import RobotStatus, StatusScreen
+
 VELOCITY_BASE_SPEED = 0.5  # m/s
 VELOCITY_BASE_ANGULAR = 0.8  # rad/sec
 VELOCITY_CMD_DURATION = 0.6  # seconds
 COMMAND_INPUT_RATE = 0.1
+KNOWN_ESTOP_STATES = (EStopState.STATE_UNKNOWN, EStopState.STATE_ESTOPPED,
+                      EStopState.STATE_NOT_ESTOPPED)
 
 # Code from the spot-sdk estop_nogui.py example
 class EstopNoGui():
     """Provides a software estop without a GUI.
 
     To use this estop, create an instance of the EstopNoGui class and use the stop() and allow()
-    functions programmatically.
+    functions programmatically. Given a scheduler, check-ins run on it instead of on a thread of
+    their own.
     """
 
-    def __init__(self, client, timeout_sec, name=None):
+    def __init__(self, client, timeout_sec, name=None, scheduler=None):
 
         # Force server to set up a single endpoint system
         ep = EstopEndpoint(client, name, timeout_sec)
         ep.force_simple_setup()
 
         # Begin periodic check-in between keep-alive and robot
-        self.estop_keep_alive = EstopKeepAlive(ep)
+        if scheduler is not None:
+            self.estop_keep_alive = ScheduledEstopKeepAlive(ep, scheduler)
+        else:
+            self.estop_keep_alive = EstopKeepAlive(ep)
 
         # Release the estop
         self.estop_keep_alive.allow()
@@ -57,8 +75,10 @@ class EstopNoGui():
     
 class Interface():
     
-    def __init__(self , robot):
+    def __init__(self , robot, scheduler=None):
         self.robot = robot
+        # All background polling and keepalives run on this one loop
+        self._scheduler = scheduler if scheduler is not None else Scheduler()
         # Create clients -- do not use the for communication yet.
         self._lease_client = robot.ensure_client(LeaseClient.default_service_name)
         try:
@@ -71,10 +91,11 @@ class Interface():
         # self._power_client = robot.ensure_client(PowerClient.default_service_name)
         self._robot_state_client = robot.ensure_client(RobotStateClient.default_service_name)
         self._robot_command_client = robot.ensure_client(RobotCommandClient.default_service_name)
-        # self._robot_state_task = AsyncRobotState(self._robot_state_client)
-        # self._image_task = AsyncImageCapture(robot)
-        # self._async_tasks = AsyncTasks([self._robot_state_task, self._image_task])
-        self._lock = threading.Lock()
+        self._robot_state_task = AsyncRobotState(self._robot_state_client,
+                                                 scheduler=self._scheduler)
+        self._clock = RobotClock(robot)
+        self._image_task = AsyncImageCapture(robot, scheduler=self._scheduler)
+        self._status = RobotStatus(self._robot_state_task, clock=self._clock)
         self._command_dictionary = {
             27: self._stop,  # ESC key
             ord('\t'): self._quit_program,
@@ -108,11 +129,15 @@ class Interface():
         
     def start(self):
         """Begin communication with the robot."""
-        # Construct our lease keep-alive object, which begins RetainLease calls in a thread.
-        self._lease_keepalive = LeaseKeepAlive(self._lease_client, must_acquire=True,
-                                               return_at_exit=True)
+        # Construct our lease keep-alive object, which begins RetainLease calls on the scheduler.
+        self._scheduler.start()
+        self._lease_keepalive = ScheduledLeaseKeepAlive(self._lease_client, self._scheduler,
+                                                        must_acquire=True, return_at_exit=True)
 
         self._robot_id = self._robot.get_id()
+        self._clock.wait_for_sync()
+        self._robot_state_task.start()
+        self._image_task.start()
         if self._estop_endpoint is not None:
             self._estop_endpoint.force_simple_setup(
             )  # Set this endpoint as the robot's sole estop.
@@ -125,41 +150,43 @@ class Interface():
         # LOGGER.addHandler(curses_handler)
 
         stdscr.nodelay(True)  # Don't block for user input.
-        stdscr.resize(26, 140)
-        stdscr.refresh()
-
-        # for debug
-        curses.echo()
 
-        # try:
-        while not self._exit_check.kill_now:
+        # The status screen draws on its own thread, at most DRAW_RATE times a second and only
+        # the cells that changed, so a slow terminal never holds up commands.
+        self._status.lease_keepalive = self._lease_keepalive
+        with StatusScreen(stdscr, scheduler=self._scheduler) as screen:
+            screen.add(0, self._status.lines)
             # self._async_tasks.update()
-            self._drive_draw(stdscr, self._lease_keepalive)
-
-            try:
-                cmd = stdscr.getch()
-                # Do not queue up commands on client
-                self.flush_and_estop_buffer(stdscr)
-                self._drive_cmd(cmd)
-                time.sleep(COMMAND_INPUT_RATE)
-            except Exception:
-                # On robot command fault, sit down safely before killing the program.
-                self._safe_power_off()
-                time.sleep(2.0)
-                raise
+            while not self._exit_check.kill_now:
+                PROFILE.loop('input')
+                try:
+                    with PROFILE.stage(INPUT):
+                        cmd = screen.getch()
+                        # Do not queue up commands on client
+                        self.flush_and_estop_buffer(screen)
+                    if cmd == curses.KEY_RESIZE:
+                        screen.invalidate()
+                    with PROFILE.stage(DISPATCH):
+                        self._drive_cmd(cmd)
+                    with PROFILE.stage(SLEEP):
+                        time.sleep(COMMAND_INPUT_RATE)
+                except Exception:
+                    # On robot command fault, sit down safely before killing the program.
+                    self._safe_power_off()
+                    time.sleep(2.0)
+                    raise
 
             # finally:
             #     LOGGER.removeHandler(curses_handler)
-        
-    def drive_draw():
-        print("Drive Draw")
-        
+
     def _try_grpc(self, desc, thunk):
         try:
-            return thunk()
+            result = thunk()
         except (ResponseError, RpcError, LeaseBaseError) as err:
-            print(f'Failed {desc}: {err}')
+            self._status.error(desc, err)
             return None
+        self._status.command(desc)
+        return result
 
         
     def _start_robot_command(self, desc, command_proto, end_time_secs=None):
@@ -200,43 +227,93 @@ class Interface():
     def _velocity_cmd_helper(self, desc='', v_x=0.0, v_y=0.0, v_rot=0.0):
         self._start_robot_command(
             desc, RobotCommandBuilder.synchro_velocity_command(v_x=v_x, v_y=v_y, v_rot=v_rot),
-            end_time_secs=time.time() + VELOCITY_CMD_DURATION)
+            end_time_secs=self._clock.deadline(VELOCITY_CMD_DURATION))
 
         
 
 def main():
     parser = argparse.ArgumentParser()
     bosdyn.client.util.add_base_arguments(parser)
+    parser.add_argument('--state-rate', type=float, default=STATE_POLL_RATE,
+                        help='Robot state polling rate in Hz')
+    parser.add_argument('--rpc-stats', default=DEFAULT_DUMP_PATH,
+                        help='File the per-RPC latency statistics are written to on exit')
+    parser.add_argument('--keys', metavar='PATH',
+                        help='Read keys from a script instead of the keyboard; ends with [q]')
+    parser.add_argument('--headless', action='store_true',
+                        help='With --keys, run without the curses screen and print each command')
+    add_profile_argument(parser)
     options = parser.parse_args()
+    if options.headless and not options.keys:
+        parser.error('--headless needs --keys')
 
     # Create robot object
     sdk = bosdyn.client.create_standard_sdk('User_Interface')
     robot = sdk.create_robot(options.hostname)
+    instrument_robot(robot)
+    start_profiling(options.profile, robot)
     bosdyn.client.util.authenticate(robot)
+    clock = RobotClock(robot).wait_for_sync()
+
+    # One loop runs the estop check-ins, state polls and screen refreshes, safety first
+    scheduler = Scheduler().start()
 
     # Create estop client for the robot
     estop_client = robot.ensure_client(EstopClient.default_service_name)
 
     # Create nogui estop
-    estop_nogui = EstopNoGui(estop_client, options.timeout, 'Estop NoGUI')
+    estop_nogui = EstopNoGui(estop_client, options.timeout, 'Estop NoGUI', scheduler)
 
     # Create robot state client for the robot
     state_client = robot.ensure_client(RobotStateClient.default_service_name)
 
-    # Initialize curses screen display
-    stdscr = curses.initscr()
+    # Poll robot state in the background; the display loop only reads the cached snapshot
+    state_task = AsyncRobotState(state_client, rate_hz=options.state_rate, scheduler=scheduler)
+    state_task.start()
+
+    # Estop and keepalive changes are reported as they are seen, not once per input pass
+    watcher = StateWatcher(state_task, estop_keepalive=estop_nogui.estop_keep_alive,
+                           scheduler=scheduler)
+
+    # Initialize curses screen display. Drawing happens on the screen's own thread from `status`.
+    status = RobotStatus(state_task, clock=clock)
+    stdscr = screen = None
+    if not options.headless:
+        stdscr = curses.initscr()
+        screen = StatusScreen(stdscr, scheduler=scheduler)
+    if options.keys:
+        keys = ScriptedInput(load_script(options.keys), end_key=ord('q'))
+    else:
+        keys = CursesInput(screen)
+
+    @watcher.on_change
+    def report_keepalive(kind, old, new):
+        # If you lose this estop endpoint, report it to user
+        if kind == ESTOP_KEEPALIVE and watcher.keepalive_message:
+            status.last_error = watcher.keepalive_message
+            if screen is None:
+                print(watcher.keepalive_message)
 
     def cleanup_example(msg):
         """Shut down curses and exit the program."""
         print('Exiting')
         #pylint: disable=unused-argument
+        if screen is not None:
+            screen.stop()
+        watcher.stop()
         estop_nogui.estop_keep_alive.shutdown()
+        state_task.stop()
+        scheduler.stop()
+        STATS.dump(options.rpc_stats)
+        finish_profiling(options.profile_report)
 
         # Clean up and close curses
-        stdscr.keypad(False)
-        curses.echo()
-        stdscr.nodelay(False)
-        curses.endwin()
+        if stdscr is not None:
+            stdscr.keypad(False)
+            curses.echo()
+            stdscr.nodelay(False)
+            curses.endwin()
+        print('\n'.join(scheduler.report_lines()))
         print(msg)
 
     def clean_exit(msg=''):
@@ -247,83 +324,77 @@ def main():
         """Exit the application on interrupt."""
         clean_exit()
 
-    def run_example():
-        """Run the actual example with the curses screen display"""
-        # Set up curses screen display to monitor for stop request
-        curses.noecho()
-        stdscr.keypad(True)
-        stdscr.nodelay(True)
-        curses.start_color()
-        curses.init_pair(1, curses.COLOR_GREEN, curses.COLOR_BLACK)
-        curses.init_pair(2, curses.COLOR_YELLOW, curses.COLOR_BLACK)
-        curses.init_pair(3, curses.COLOR_RED, curses.COLOR_BLACK)
-        # If terminal cannot handle colors, do not proceed
-        if not curses.has_colors():
-            return
+    def command(desc):
+        status.command(desc)
+        if screen is None:
+            print(desc)
 
+    def run_example():
+        """Run the actual example with the curses screen display, or headless"""
         # Curses eats Ctrl-C keyboard input, but keep a SIGINT handler around for
         # explicit kill signals outside of the program.
         signal.signal(signal.SIGINT, sigint_handler)
 
-        # Clear screen
-        stdscr.clear()
-
-        # Display usage instructions in terminal
-        stdscr.addstr('Estop w/o GUI running.\n')
-        stdscr.addstr('\n')
-        stdscr.addstr('[q] or [Ctrl-C]: Quit\n', curses.color_pair(2))
-        stdscr.addstr('[SPACE]: Trigger estop\n', curses.color_pair(2))
-        stdscr.addstr('[r]: Release estop\n', curses.color_pair(2))
-        stdscr.addstr('[s]: Settle then cut estop\n', curses.color_pair(2))
+        if screen is not None:
+            # Set up curses screen display to monitor for stop request
+            curses.noecho()
+            stdscr.keypad(True)
+            stdscr.nodelay(True)
+            # If terminal cannot handle colors, do not proceed
+            if not curses.has_colors():
+                return
+
+            # Clear screen
+            stdscr.clear()
+
+            # Usage instructions, then the live status
+            screen.add(0, [
+                'Estop w/o GUI running.',
+                '',
+                ('[q] or [Ctrl-C]: Quit', 'warn'),
+                ('[SPACE]: Trigger estop', 'warn'),
+                ('[r]: Release estop', 'warn'),
+                ('[s]: Settle then cut estop', 'warn'),
+            ])
+            screen.add(6, status.lines)
+            screen.start()
+        watcher.start()
 
         # Monitor estop until user exits
         while True:
-            # Retrieve user input (non-blocking)
-            c = stdscr.getch()
+            PROFILE.loop('input')
+            # Wait for user input; drawing carries on meanwhile
+            with PROFILE.stage(INPUT):
+                c = keys.wait_key(timeout=COMMAND_INPUT_RATE)
 
             try:
-                if c == ord(' '):
-                    estop_nogui.stop()
-                if c == ord('r'):
-                    estop_nogui.allow()
-                if c == ord('q') or c == 3:
-                    clean_exit('Exit on user input')
-                if c == ord('s'):
-                    estop_nogui.settle_then_cut()
+                with PROFILE.stage(DISPATCH):
+                    if c == ord(' '):
+                        estop_nogui.stop()
+                        command('Trigger estop')
+                        # Show the result without waiting for the next scheduled poll
+                        state_task.poll_now()
+                    if c == ord('r'):
+                        estop_nogui.allow()
+                        command('Release estop')
+                        state_task.poll_now()
+                    if c == ord('q') or c == 3:
+                        clean_exit('Exit on user input')
+                    if c == ord('s'):
+                        estop_nogui.settle_then_cut()
+                        command('Settle then cut estop')
+                        state_task.poll_now()
+                    if c == curses.KEY_RESIZE and screen is not None:
+                        screen.invalidate()
             # If the user attempts to toggle estop without valid endpoint
             except bosdyn.client.estop.EndpointUnknownError:
                 clean_exit('This estop endpoint no longer valid. Exiting...')
 
-            # Check if robot is estopped by any estops
-            estop_status = 'NOT_STOPPED\n'
-            estop_status_color = curses.color_pair(1)
-            state = state_client.get_robot_state()
-            estop_states = state.estop_states
-            for estop_state in estop_states:
-                state_str = estop_state.State.Name(estop_state.state)
-                if state_str == 'STATE_ESTOPPED':
-                    estop_status = 'STOPPED\n'
-                    estop_status_color = curses.color_pair(3)
-                    break
-                elif state_str == 'STATE_UNKNOWN':
-                    estop_status = 'ERROR\n'
-                    estop_status_color = curses.color_pair(3)
-                elif state_str == 'STATE_NOT_ESTOPPED':
-                    pass
-                else:
-                    # Unknown estop status
-                    clean_exit()
-
-            # Display current estop status
-            if not estop_nogui.estop_keep_alive.status_queue.empty():
-                latest_status = estop_nogui.estop_keep_alive.status_queue.get()[1].strip()
-                if latest_status != '':
-                    # If you lose this estop endpoint, report it to user
-                    stdscr.addstr(7, 0, latest_status, curses.color_pair(3))
-            stdscr.addstr(6, 0, estop_status, estop_status_color)
-
-            # Slow down loop
-            time.sleep(0.5)
+            # Unknown estop status
+            state = state_task.proto
+            if state is not None and any(estop.state not in KNOWN_ESTOP_STATES
+                                         for estop in state.estop_states):
+                clean_exit('Unknown estop status. Exiting...')
 
     # Run all curses code in a try so we can cleanly exit if something goes wrong
     try: